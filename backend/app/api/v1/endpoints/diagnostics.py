@@ -0,0 +1,97 @@
+"""
+Diagnostics endpoints (admin only)
+
+- Download request profiles captured via the X-Profile-Request header
+- Per-endpoint database query summary (heaviest queries first)
+- Progress and backlog of background AI answer precomputation
+- Model circuit breaker, response cache, in-flight request and conversation state
+- Pay structure snapshot cache
+"""
+
+from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.responses import FileResponse
+from app.core.config import settings
+from app.core.db import query_stats
+from app.core.security import require_admin
+from app.services.precompute_service import precompute_service
+from app.services.gemini_service import gemini_service
+from app.services.conversation_store import conversation_store
+from app.services.snapshot_store import snapshot_store
+from typing import Dict, Optional
+import os
+
+router = APIRouter()
+
+
+@router.get("/profiles/{filename}")
+async def download_profile(
+    filename: str,
+    current_user: Dict = Depends(require_admin)
+):
+    """
+    Download a saved request profile
+    
+    - Requires admin authentication
+    - filename is the value returned in the X-Profile-File header
+    """
+    # Reject anything that isn't a bare file name inside the profile directory
+    if os.path.basename(filename) != filename or filename.startswith("."):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid profile name"
+        )
+    
+    path = os.path.join(settings.PROFILE_OUTPUT_DIR, filename)
+    if not os.path.isfile(path):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Profile not found"
+        )
+    
+    media_type = "text/html" if filename.endswith(".html") else "application/octet-stream"
+    return FileResponse(path, media_type=media_type, filename=filename)
+
+
+@router.get("/queries")
+async def query_summary(
+    endpoint: Optional[str] = None,
+    current_user: Dict = Depends(require_admin)
+):
+    """
+    Summarize recorded database queries per endpoint and table
+    
+    - Sorted by total time spent, so the heaviest queries come first
+    - Optionally filter to a single endpoint path
+    """
+    summary = query_stats.summary()
+    if endpoint:
+        summary = [row for row in summary if row["endpoint"] == endpoint]
+    return {
+        "slow_query_threshold_ms": settings.SLOW_QUERY_THRESHOLD_MS,
+        "queries": summary
+    }
+
+
+@router.delete("/queries")
+async def reset_query_summary(current_user: Dict = Depends(require_admin)):
+    """Clear the recorded query statistics"""
+    query_stats.reset()
+    return {"status": "reset"}
+
+
+@router.get("/precompute")
+async def precompute_status(current_user: Dict = Depends(require_admin)):
+    """Progress, backlog and hit metrics of background answer precomputation"""
+    return precompute_service.stats()
+
+
+@router.get("/ai")
+async def ai_status(current_user: Dict = Depends(require_admin)):
+    """Circuit breaker state, response cache hit rate, in-flight model calls and conversations"""
+    return {**gemini_service.stats(), "conversations": conversation_store.stats()}
+
+
+@router.get("/snapshots")
+async def snapshot_status(current_user: Dict = Depends(require_admin)):
+    """Size and hit/miss counts of the pay structure rehydration cache"""
+    return snapshot_store.stats()
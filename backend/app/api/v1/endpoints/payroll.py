@@ -5,18 +5,40 @@ Payroll analysis and processing endpoints
 from fastapi import APIRouter, Depends, HTTPException, status
 from app.models.schemas import (
     PayrollAnalysisRequest,
-    PayrollAnalysisResponse,
-    AnomalyDetail
+    PayrollAnalysisResponse
 )
 from pydantic import BaseModel
-from app.services.gemini_service import gemini_service
 from app.services.pdf_service import pdf_service
+from app.services.precompute_service import precompute_service
+from app.services.analysis_service import FINAL_STATUSES, payroll_analysis_service
+from app.services.payroll_calculator import (
+    calculate_payslip,
+    calculate_payslips,
+    fetch_unpaid_leave_days,
+    salary_structure
+)
+from app.services.snapshot_store import dehydrate, snapshot_store
+from app.services.tax_engine import tax_bracket_service
+from app.services.ytd_service import fiscal_year_of
+from app.core.config import settings
 from app.core.security import require_admin, get_current_user
 from app.core.supabase import get_supabase_admin_client
-from typing import Dict, List, Optional
-from datetime import datetime
+from app.core.db import aexecute, execute
+from app.core.projections import (
+    EMPLOYEE_PAY_INPUTS,
+    PAYROLL_HEADER,
+    PAYROLL_TOTALS,
+    PAYSLIP_DETAIL,
+    PAYSLIP_DOCUMENT,
+    PAYSLIP_PERIOD
+)
+from app.core.timing import phase
+from typing import Dict, Optional
+from datetime import date, datetime
+import asyncio
 import logging
 import base64
+import uuid
 from fastapi.responses import Response
 
 logger = logging.getLogger(__name__)
@@ -39,6 +61,95 @@ class ProcessPayrollResponse(BaseModel):
     message: str
 
 
+def _active_headcount(supabase, company_id: str) -> int:
+    """Number of active employees of a company (exact count, one row transferred)"""
+    response = execute(supabase.table("employees").select(
+        "id", count="exact"
+    ).eq("company_id", company_id).eq("is_active", True).limit(1))
+    return response.count or 0
+
+
+def _process_payroll_in_db(supabase, payroll_id: str, created_by: str, headcount: int) -> ProcessPayrollResponse:
+    """
+    Compute and insert every payslip of a draft run inside Postgres
+    
+    process_payroll_in_db() inserts the payslips with one set-based statement
+    (same amounts as payroll_calculator) and returns only the run's totals.
+    Its payslips carry full snapshots until backfill_pay_structures.py
+    converts them, PDFs are rendered on first download, and no AI answers are
+    precomputed for the run.
+    """
+    with phase("calculate"):
+        response = execute(supabase.rpc("process_payroll_in_db", {
+            "p_payroll_id": payroll_id,
+            "p_created_by": created_by
+        }))
+    totals = response.data or {}
+    count = int(totals.get("payslip_count") or 0)
+    logger.info(f"Payroll {payroll_id} computed in database: {count} payslips for {headcount} active employees")
+    
+    # The run stays draft without payslips; fail as the Python path does
+    if count == 0:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="No active employees with a salary structure found"
+        )
+    
+    return ProcessPayrollResponse(
+        payroll_id=payroll_id,
+        status="processed",
+        total_employees=count,
+        total_gross_pay=float(totals.get("total_gross") or 0),
+        total_net_pay=float(totals.get("total_net") or 0),
+        message=f"Successfully processed payroll for {count} employees"
+    )
+
+
+def _company_name(supabase, company_id: str) -> str:
+    """Company name printed on payslip PDFs"""
+    response = execute(supabase.table("companies").select("name").eq("id", company_id).limit(1))
+    name = response.data[0].get("name") if response.data else None
+    return name or "Your Company"
+
+
+def _render_payslip_pdf(
+    company_name: str,
+    employee_id: str,
+    employee: Dict,
+    payslip_data: Dict
+) -> Optional[str]:
+    """
+    Render one payslip PDF
+    
+    Args:
+        company_name: From _company_name
+        employee_id: Employee the payslip belongs to
+        employee: Employee row with designation and an embedded profiles(full_name)
+        payslip_data: Calculated (or rehydrated) payslip amounts and snapshot
+    
+    Returns:
+        Base64-encoded PDF, or None if rendering fails
+    """
+    profile = employee.get("profiles") or {}
+    employee_data = {
+        "full_name": profile.get("full_name", "Unknown"),
+        "employee_id": employee_id[:8],
+        "designation": employee.get("designation", "N/A"),
+    }
+    try:
+        with phase("pdf"):
+            pdf_bytes = pdf_service.generate_payslip_pdf(
+                employee_data=employee_data,
+                payslip_data=payslip_data,
+                company_name=company_name
+            )
+    except Exception as pdf_error:
+        logger.error(f"Error generating PDF for employee {employee_id}: {pdf_error}")
+        return None
+    # Base64 string for JSON serialization
+    return base64.b64encode(pdf_bytes).decode('utf-8')
+
+
 @router.post("/process-payroll", response_model=ProcessPayrollResponse)
 async def process_payroll(
     request: ProcessPayrollRequest,
@@ -46,18 +157,24 @@ async def process_payroll(
 ):
     """
     Process payroll for all active employees
+    
+    - Amounts for all employees are computed in one vectorized pass
+      (payroll_calculator), with TDS from progressive tax slabs per regime and
+      fiscal year (tax_engine)
+    - Companies with at least PAYROLL_IN_DB_MIN_EMPLOYEES active employees are
+      computed and inserted inside Postgres instead (process_payroll_in_db RPC)
     """
     try:
         supabase = get_supabase_admin_client()
         
         # Create payroll run
-        payroll_response = supabase.table("payrolls").insert({
+        payroll_response = execute(supabase.table("payrolls").insert({
             "company_id": request.company_id,
             "pay_period_start": request.pay_period_start,
             "pay_period_end": request.pay_period_end,
             "status": "draft",
             "created_by": request.created_by
-        }).execute()
+        }))
         
         if not payroll_response.data:
             raise HTTPException(
@@ -67,10 +184,16 @@ async def process_payroll(
         
         payroll_id = payroll_response.data[0]["id"]
         
+        # Largest companies: one set-based statement in the database, totals only
+        if settings.PAYROLL_IN_DB_MIN_EMPLOYEES > 0:
+            headcount = _active_headcount(supabase, request.company_id)
+            if headcount >= settings.PAYROLL_IN_DB_MIN_EMPLOYEES:
+                return _process_payroll_in_db(supabase, payroll_id, request.created_by, headcount)
+        
         # Fetch active employees with salary structures
-        employees_response = supabase.table("employees").select(
-            "id, profile_id, designation, salary_structures!salary_structures_employee_id_fkey(base_pay, allowances, deductions_fixed, deductions_percent)"
-        ).eq("company_id", request.company_id).eq("is_active", True).execute()
+        employees_response = execute(supabase.table("employees").select(
+            EMPLOYEE_PAY_INPUTS
+        ).eq("company_id", request.company_id).eq("is_active", True))
         
         if not employees_response.data:
             raise HTTPException(
@@ -82,144 +205,104 @@ async def process_payroll(
         
         # Fetch profile names for all employees
         profile_ids = [emp["profile_id"] for emp in employees if emp.get("profile_id")]
-        profiles_response = supabase.table("profiles").select(
+        profiles_response = execute(supabase.table("profiles").select(
             "id, full_name"
-        ).in_("id", profile_ids).execute()
+        ).in_("id", profile_ids))
         
         # Create profile map
         profile_map = {p["id"]: p for p in (profiles_response.data or [])}
         
-        # Fetch approved unpaid leaves for the period
-        leaves_response = supabase.table("leave_requests").select(
-            "employee_id, days_requested"
-        ).eq("status", "approved").eq("leave_type", "unpaid").gte(
-            "start_date", request.pay_period_start
-        ).lte("end_date", request.pay_period_end).execute()
-        
-        # Create leave days map
-        leave_days_map = {}
-        for leave in (leaves_response.data or []):
-            emp_id = leave["employee_id"]
-            days = leave.get("days_requested", 0) or 0
-            leave_days_map[emp_id] = leave_days_map.get(emp_id, 0) + days
-        
-        # Calculate working days in period
-        start_date = datetime.fromisoformat(request.pay_period_start.replace('Z', '+00:00'))
-        end_date = datetime.fromisoformat(request.pay_period_end.replace('Z', '+00:00'))
-        total_days = (end_date - start_date).days + 1
+        # Approved unpaid leave days for the period
+        leave_days_map = fetch_unpaid_leave_days(supabase, request.pay_period_start, request.pay_period_end)
+        
+        # Skip employees without salary structure
+        payable = []
+        for employee in employees:
+            if salary_structure(employee) is None:
+                logger.warning(f"Employee {employee['id']} has no salary structure, skipping")
+                continue
+            payable.append(employee)
+        
+        if not payable:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="No active employees with a salary structure found"
+            )
+        
+        # Slab tables of the structures' tax regimes for the pay period's fiscal year (cached)
+        period_end = datetime.fromisoformat(request.pay_period_end.replace('Z', '+00:00'))
+        tax_tables = tax_bracket_service.tables(
+            supabase,
+            request.company_id,
+            (salary_structure(emp).get("tax_regime") for emp in payable),
+            fiscal_year_of(period_end.date())
+        )
+        
+        # Amounts for all employees in one vectorized pass
+        with phase("calculate"):
+            calculated = calculate_payslips(payable, leave_days_map, tax_tables)
+        
+        company_name = _company_name(supabase, request.company_id)
         
         # Generate payslips
         payslips = []
+        documents = []
+        structures = {}
         total_gross = 0
         total_net = 0
         
-        for employee in employees:
-            # Skip employees without salary structure
-            if not employee.get("salary_structures") or len(employee["salary_structures"]) == 0:
-                logger.warning(f"Employee {employee['id']} has no salary structure, skipping")
-                continue
-            
-            salary_struct = employee["salary_structures"][0]
-            base_pay = float(salary_struct.get("base_pay", 0))
-            
-            # Get unpaid leave days
-            unpaid_leave_days = leave_days_map.get(employee["id"], 0)
-            
-            # Calculate per day pay (assuming 30 days per month)
-            per_day_pay = base_pay / 30
-            leave_deduction = per_day_pay * unpaid_leave_days
-            
-            # Calculate allowances
-            allowances = salary_struct.get("allowances", {})
-            total_allowances = sum(float(v) for v in allowances.values() if isinstance(v, (int, float)))
-            
-            # Calculate deductions
-            deductions_fixed = salary_struct.get("deductions_fixed", {})
-            deductions_percent = salary_struct.get("deductions_percent", {})
-            
-            total_fixed_deductions = sum(float(v) for v in deductions_fixed.values() if isinstance(v, (int, float)))
-            
-            # Calculate percentage-based deductions
-            gross_pay = base_pay + total_allowances
-            total_percent_deductions = sum(
-                gross_pay * (float(v) / 100) 
-                for v in deductions_percent.values() 
-                if isinstance(v, (int, float))
-            )
-            
-            # Default tax deduction (10% if no tax bracket)
-            tax_deduction = gross_pay * 0.1
-            
-            # Total deductions
-            total_deductions = (
-                leave_deduction + 
-                total_fixed_deductions + 
-                total_percent_deductions + 
-                tax_deduction
-            )
-            
-            net_pay = gross_pay - total_deductions
-            
-            # Prepare payslip data
-            payslip_data = {
-                "pay_data_snapshot": {
-                    "base_pay": base_pay,
-                    "allowances": allowances,
-                    "deductions_fixed": deductions_fixed,
-                    "deductions_percent": deductions_percent,
-                    "unpaid_leave_days": unpaid_leave_days,
-                    "leave_deduction": leave_deduction,
-                    "tax_deduction": tax_deduction,
-                },
-                "gross_pay": gross_pay,
-                "total_deductions": total_deductions,
-                "net_pay": net_pay,
-            }
+        for employee, payslip_data in zip(payable, calculated):
+            gross_pay = payslip_data["gross_pay"]
+            net_pay = payslip_data["net_pay"]
             
             # Generate PDF
-            profile_id = employee.get("profile_id")
-            profile = profile_map.get(profile_id, {})
+            profile = profile_map.get(employee.get("profile_id"), {})
+            pdf_blob = _render_payslip_pdf(company_name, employee["id"], {**employee, "profiles": profile}, payslip_data)
             
-            employee_data = {
-                "full_name": profile.get("full_name", "Unknown"),
-                "employee_id": employee.get("id", "N/A")[:8],
-                "designation": employee.get("designation", "N/A"),
-            }
+            # IDs are assigned here so each PDF can be stored under its payslip
+            payslip_id = str(uuid.uuid4())
+            if pdf_blob:
+                documents.append({"payslip_id": payslip_id, "pdf_blob": pdf_blob})
             
-            try:
-                pdf_bytes = pdf_service.generate_payslip_pdf(
-                    employee_data=employee_data,
-                    payslip_data=payslip_data,
-                    company_name="Your Company"  # TODO: Fetch from company table
-                )
-                # Convert to base64 string for JSON serialization
-                pdf_blob = base64.b64encode(pdf_bytes).decode('utf-8')
-            except Exception as pdf_error:
-                logger.error(f"Error generating PDF for employee {employee['id']}: {pdf_error}")
-                pdf_blob = None
+            # Shared structure stored once by hash; the payslip keeps its own fields
+            structure_hash, structure, variable = dehydrate(payslip_data["pay_data_snapshot"])
+            structures[structure_hash] = structure
             
             payslips.append({
+                "id": payslip_id,
                 "payroll_id": payroll_id,
                 "employee_id": employee["id"],
-                "pay_data_snapshot": payslip_data["pay_data_snapshot"],
+                "pay_data_snapshot": variable,
+                "structure_hash": structure_hash,
                 "gross_pay": gross_pay,
-                "total_deductions": total_deductions,
+                "total_deductions": payslip_data["total_deductions"],
                 "net_pay": net_pay,
-                "pdf_blob": pdf_blob,
                 "created_by": request.created_by
             })
             
             total_gross += gross_pay
             total_net += net_pay
         
-        # Insert payslips
+        # Insert payslips (after the structures they reference)
         if payslips:
-            supabase.table("payslips").insert(payslips).execute()
+            snapshot_store.store_structures(supabase, structures)
+            execute(supabase.table("payslips").insert(payslips))
+            
+            # PDFs are stored separately so payslip reads never carry blob bytes
+            if documents:
+                execute(supabase.table("payslip_documents").insert(documents))
             
             # Update payroll status
-            supabase.table("payrolls").update({
+            execute(supabase.table("payrolls").update({
                 "status": "processed"
-            }).eq("id", payroll_id).execute()
+            }).eq("id", payroll_id))
+            
+            # Warm payslip explanations / dashboard insights in the background
+            profile_by_employee = {emp["id"]: emp.get("profile_id") for emp in employees}
+            precompute_service.schedule_payroll(payroll_id, [
+                {"id": row["id"], "profile_id": profile_by_employee.get(row["employee_id"])}
+                for row in payslips
+            ])
         
         return ProcessPayrollResponse(
             payroll_id=payroll_id,
@@ -249,41 +332,26 @@ async def analyze_payroll(
     Analyze payroll run for anomalies
     
     - Requires admin authentication
-    - Fetches payroll data securely
+    - Loads only the numeric payslip columns of the run and its prior runs
+    - Returns the stored analysis while the run is unchanged (processed/paid
+      runs without reloading); a changed draft re-evaluates affected employees
     - Uses AI to detect unusual patterns
+    - Flags amounts that are unusual against each employee's last 12 runs and
+      designation peers (robust z-scores)
     """
     try:
         # Get Supabase admin client (after authorization check)
         supabase = get_supabase_admin_client()
         
-        # Fetch payroll data
-        payroll_data = await _fetch_payroll_data(
-            supabase,
-            request.payroll_id,
-            current_user["user_id"]
-        )
-        
-        # Fetch previous payroll for comparison
-        previous_payroll = await _fetch_previous_payroll(
-            supabase,
-            payroll_data.get("company_id"),
-            payroll_data.get("pay_period_start")
-        )
-        
-        # Analyze with AI
-        analysis = await gemini_service.analyze_payroll_data(
-            current_payroll=payroll_data,
-            previous_payroll=previous_payroll
-        )
+        # Stored result when the run is unchanged; otherwise (incremental) recomputation
+        result = await payroll_analysis_service.analyze(supabase, request.payroll_id)
+        if result is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Payroll not found"
+            )
         
-        # Detect statistical anomalies
-        anomalies = _detect_anomalies(payroll_data, previous_payroll)
-        
-        return PayrollAnalysisResponse(
-            payroll_id=request.payroll_id,
-            anomalies=anomalies,
-            summary=analysis.get("summary", "Analysis complete")
-        )
+        return PayrollAnalysisResponse(**result)
         
     except HTTPException:
         raise
@@ -295,117 +363,230 @@ async def analyze_payroll(
         )
 
 
-async def _fetch_payroll_data(supabase, payroll_id: str, user_id: str) -> Dict:
+class CorrectPayslipResponse(BaseModel):
+    payslip_id: str
+    correction_of: str
+    payroll_id: str
+    employee_id: str
+    gross_pay: float
+    total_deductions: float
+    net_pay: float
+    net_pay_change: float
+    payroll_total_gross: float
+    payroll_total_net: float
+    message: str
+
+
+@router.post("/payslip/{payslip_id}/correct", response_model=CorrectPayslipResponse)
+async def correct_payslip(
+    payslip_id: str,
+    current_user: Dict = Depends(require_admin)
+):
     """
-    Fetch payroll data with authorization check
+    Re-issue one employee's payslip from current inputs
     
-    Args:
-        supabase: Supabase client
-        payroll_id: Payroll run ID
-        user_id: Current user ID
-    
-    Returns:
-        Payroll data
+    - Requires admin authentication (payslips of the admin's company)
+    - Recomputes the employee's pay from the current salary structure, unpaid
+      leave in the pay period and tax slabs, renders only this PDF and inserts a
+      payslip with correction_of set; the payroll is not re-run
+    - Payroll and YTD totals move by the difference (database triggers), so the
+      work is the same regardless of company size
+    - Only the latest payslip of a correction chain can be corrected
     """
     try:
-        # Fetch payroll with payslips
-        response = supabase.table("payrolls").select(
-            "*, payslips(*), company:companies(*)"
-        ).eq("id", payroll_id).single().execute()
+        supabase = get_supabase_admin_client()
         
-        if not response.data:
+        # The payslip with its payroll, and any correction that already replaced it
+        with phase("load"):
+            original_response, corrected_response = await asyncio.gather(
+                aexecute(supabase.table("payslips").select(
+                    f"id, employee_id, payroll_id, net_pay, payrolls({PAYROLL_HEADER})"
+                ).eq("id", payslip_id).limit(1)),
+                aexecute(supabase.table("payslips").select("id").eq("correction_of", payslip_id).limit(1))
+            )
+        
+        if not original_response.data:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
-                detail="Payroll not found"
+                detail="Payslip not found"
             )
         
-        # Verify user has access to this company
-        payroll = response.data
+        original = original_response.data[0]
+        payroll = original.get("payrolls") or {}
+        if payroll.get("company_id") != current_user.get("company_id"):
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="Access denied"
+            )
         
-        return payroll
+        if corrected_response.data:
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail=f"Payslip has already been corrected by {corrected_response.data[0]['id']}"
+            )
         
-    except Exception as e:
-        logger.error(f"Error fetching payroll data: {e}")
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Could not fetch payroll data"
+        # Current inputs: salary structure, unpaid leave in the period, tax slabs
+        employee_id = original["employee_id"]
+        with phase("inputs"):
+            employee_response, leave_days_map = await asyncio.gather(
+                aexecute(supabase.table("employees").select(
+                    f"{EMPLOYEE_PAY_INPUTS}, profiles(full_name)"
+                ).eq("id", employee_id).limit(1)),
+                asyncio.to_thread(
+                    fetch_unpaid_leave_days,
+                    supabase,
+                    payroll["pay_period_start"],
+                    payroll["pay_period_end"],
+                    employee_id
+                )
+            )
+            
+            employee = employee_response.data[0] if employee_response.data else None
+            if employee is None or salary_structure(employee) is None:
+                raise HTTPException(
+                    status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                    detail="Employee has no salary structure"
+                )
+            
+            period_end = date.fromisoformat(str(payroll["pay_period_end"])[:10])
+            tax_tables = await asyncio.to_thread(
+                tax_bracket_service.tables,
+                supabase,
+                payroll["company_id"],
+                [salary_structure(employee).get("tax_regime")],
+                fiscal_year_of(period_end)
+            )
+        
+        with phase("calculate"):
+            payslip_data = calculate_payslip(employee, leave_days_map.get(employee_id, 0), tax_tables)
+        
+        # Render only this employee's PDF
+        company_name = await asyncio.to_thread(_company_name, supabase, payroll["company_id"])
+        pdf_blob = await asyncio.to_thread(_render_payslip_pdf, company_name, employee_id, employee, payslip_data)
+        
+        correction_id = str(uuid.uuid4())
+        structure_hash, structure, variable = dehydrate(payslip_data["pay_data_snapshot"])
+        try:
+            await asyncio.to_thread(snapshot_store.store_structures, supabase, {structure_hash: structure})
+            await aexecute(supabase.table("payslips").insert({
+                "id": correction_id,
+                "payroll_id": payroll["id"],
+                "employee_id": employee_id,
+                "pay_data_snapshot": variable,
+                "structure_hash": structure_hash,
+                "gross_pay": payslip_data["gross_pay"],
+                "total_deductions": payslip_data["total_deductions"],
+                "net_pay": payslip_data["net_pay"],
+                "correction_of": payslip_id,
+                "created_by": current_user["user_id"]
+            }))
+        except Exception as e:
+            # Lost a race with another correction: the chain check in the YTD trigger,
+            # or the unique index on correction_of (23505 unique_violation)
+            if getattr(e, "code", None) == "23505" or "already been corrected" in str(e):
+                raise HTTPException(
+                    status_code=status.HTTP_409_CONFLICT,
+                    detail="Payslip has already been corrected"
+                )
+            raise
+        
+        if pdf_blob:
+            await aexecute(supabase.table("payslip_documents").insert({
+                "payslip_id": correction_id,
+                "pdf_blob": pdf_blob
+            }))
+        
+        # Totals were adjusted by the insert trigger; read them back by primary key
+        totals_response = await aexecute(supabase.table("payrolls").select(
+            PAYROLL_TOTALS
+        ).eq("id", payroll["id"]).limit(1))
+        totals = totals_response.data[0] if totals_response.data else {}
+        
+        # Stored AI answers and finalized analyses describe the replaced payslip
+        precompute_service.invalidate_payslip(payslip_id)
+        if payroll.get("status") in FINAL_STATUSES:
+            await payroll_analysis_service.invalidate(supabase, payroll["id"])
+        
+        net_pay_change = payslip_data["net_pay"] - float(original.get("net_pay") or 0)
+        logger.info(
+            f"Corrected payslip {payslip_id} -> {correction_id} "
+            f"(payroll {payroll['id']}, net pay change {net_pay_change:+.2f})"
         )
-
-
-async def _fetch_previous_payroll(
-    supabase,
-    company_id: str,
-    current_period_start
-) -> Dict:
-    """Fetch previous payroll for comparison"""
-    try:
-        response = supabase.table("payrolls").select(
-            "*, payslips(*)"
-        ).eq("company_id", company_id).lt(
-            "pay_period_start", current_period_start
-        ).order("pay_period_start", desc=True).limit(1).execute()
         
-        if response.data:
-            return response.data[0]
-        return {}
+        return CorrectPayslipResponse(
+            payslip_id=correction_id,
+            correction_of=payslip_id,
+            payroll_id=payroll["id"],
+            employee_id=employee_id,
+            gross_pay=payslip_data["gross_pay"],
+            total_deductions=payslip_data["total_deductions"],
+            net_pay=payslip_data["net_pay"],
+            net_pay_change=net_pay_change,
+            payroll_total_gross=float(totals.get("total_gross") or 0),
+            payroll_total_net=float(totals.get("total_net") or 0),
+            message=f"Issued correction {correction_id} for payslip {payslip_id}"
+        )
         
+    except HTTPException:
+        raise
     except Exception as e:
-        logger.warning(f"Could not fetch previous payroll: {e}")
-        return {}
-
+        logger.error(f"Error correcting payslip {payslip_id}: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="An error occurred correcting the payslip"
+        )
 
-def _detect_anomalies(
-    current_payroll: Dict,
-    previous_payroll: Dict
-) -> List[AnomalyDetail]:
+def _fetch_pdf_blob(supabase, payslip_id: str):
     """
-    Detect statistical anomalies in payroll data
+    Stored PDF of a payslip
     
-    Args:
-        current_payroll: Current payroll data
-        previous_payroll: Previous payroll data
+    Reads payslip_documents; payslips written before PDFs moved there still
+    carry the blob in payslips.pdf_blob.
+    """
+    document_response = execute(supabase.table("payslip_documents").select(
+        PAYSLIP_DOCUMENT
+    ).eq("payslip_id", payslip_id).limit(1))
+    if document_response.data:
+        return document_response.data[0].get("pdf_blob")
     
-    Returns:
-        List of detected anomalies
+    legacy_response = execute(supabase.table("payslips").select("pdf_blob").eq("id", payslip_id).limit(1))
+    return legacy_response.data[0].get("pdf_blob") if legacy_response.data else None
+
+
+def _render_missing_pdf(supabase, payslip_id: str):
     """
-    anomalies = []
+    Render and store the PDF of a payslip inserted without one
     
-    if not previous_payroll or "payslips" not in current_payroll:
-        return anomalies
+    Payroll runs computed in the database (process_payroll_in_db) write no
+    PDFs; each is rendered from the payslip's snapshot on first download.
     
-    # Create a map of previous payslips by employee
-    prev_map = {}
-    if "payslips" in previous_payroll:
-        for payslip in previous_payroll["payslips"]:
-            prev_map[payslip["employee_id"]] = payslip
+    Returns:
+        Base64-encoded PDF, or None if the payslip is missing or rendering fails
+    """
+    response = execute(supabase.table("payslips").select(
+        f"{PAYSLIP_DETAIL}, employees(designation, company_id, profiles(full_name))"
+    ).eq("id", payslip_id).limit(1))
+    if not response.data:
+        return None
     
-    # Check each current payslip
-    for payslip in current_payroll.get("payslips", []):
-        employee_id = payslip["employee_id"]
-        current_net = float(payslip.get("net_pay", 0))
-        
-        if employee_id in prev_map:
-            prev_net = float(prev_map[employee_id].get("net_pay", 0))
-            
-            # Calculate percent change
-            if prev_net > 0:
-                change = (current_net - prev_net) / prev_net
-                
-                # Flag significant changes (>20% or <-10%)
-                if abs(change) > 0.20:
-                    severity = "high" if abs(change) > 0.30 else "medium"
-                    
-                    anomalies.append(AnomalyDetail(
-                        employee_id=employee_id,
-                        metric="net_pay",
-                        previous_value=prev_net,
-                        current_value=current_net,
-                        percent_change=change,
-                        severity=severity,
-                        suggested_action="Review salary changes and deductions"
-                    ))
+    payslip = response.data[0]
+    snapshot_store.rehydrate(supabase, [payslip])
+    employee = payslip.get("employees") or {}
+    pdf_blob = _render_payslip_pdf(
+        _company_name(supabase, employee.get("company_id")),
+        payslip["employee_id"],
+        employee,
+        payslip
+    )
+    if pdf_blob is None:
+        return None
     
-    return anomalies
+    execute(supabase.table("payslip_documents").upsert(
+        {"payslip_id": payslip_id, "pdf_blob": pdf_blob},
+        on_conflict="payslip_id",
+        ignore_duplicates=True
+    ))
+    return pdf_blob
 
 
 @router.get("/payslip/{payslip_id}/download")
@@ -419,14 +600,16 @@ async def download_payslip(
     - Requires authentication
     - Employees can only download their own payslips
     - Admins can download any payslip
+    - Payslips without a stored PDF (runs computed in the database) are
+      rendered and stored on first download
     """
     try:
         supabase = get_supabase_admin_client()
         
         # Fetch payslip
-        payslip_response = supabase.table("payslips").select(
-            "id, employee_id, pdf_blob, created_at, payrolls(pay_period_start, pay_period_end)"
-        ).eq("id", payslip_id).single().execute()
+        payslip_response = execute(supabase.table("payslips").select(
+            f"id, employee_id, created_at, {PAYSLIP_PERIOD}"
+        ).eq("id", payslip_id).single())
         
         if not payslip_response.data:
             raise HTTPException(
@@ -439,9 +622,9 @@ async def download_payslip(
         # Authorization check: Employee can only download their own, admin can download any
         if current_user.get("role") != "admin":
             # Get employee ID for current user
-            employee_response = supabase.table("employees").select("id").eq(
+            employee_response = execute(supabase.table("employees").select("id").eq(
                 "profile_id", current_user["user_id"]
-            ).single().execute()
+            ).single())
             
             if not employee_response.data:
                 raise HTTPException(
@@ -455,8 +638,10 @@ async def download_payslip(
                     detail="Access denied"
                 )
         
-        # Get PDF blob
-        pdf_blob = payslip.get("pdf_blob")
+        # Get PDF blob (rendered now for payslips computed in the database)
+        pdf_blob = _fetch_pdf_blob(supabase, payslip_id)
+        if not pdf_blob:
+            pdf_blob = await asyncio.to_thread(_render_missing_pdf, supabase, payslip_id)
         if not pdf_blob:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
@@ -14,6 +14,74 @@ class Settings(BaseSettings):
     
     # Gemini API Configuration
     GEMINI_API_KEY: str
+    GEMINI_BASE_URL: str = ""
+    GEMINI_MAX_CONCURRENT_REQUESTS: int = 16
+    GEMINI_MAX_CONCURRENT_STREAMS: int = 32
+    GEMINI_MAX_CONCURRENT_ANALYSES: int = 4
+    
+    # Gemini resilience (deadlines, retries, circuit breaker, hedging)
+    GEMINI_TIMEOUT_SECONDS: float = 30.0
+    GEMINI_ANALYSIS_TIMEOUT_SECONDS: float = 90.0
+    GEMINI_STREAM_FIRST_CHUNK_TIMEOUT_SECONDS: float = 20.0
+    GEMINI_STREAM_IDLE_TIMEOUT_SECONDS: float = 30.0
+    GEMINI_MAX_RETRIES: int = 2
+    GEMINI_RETRY_BASE_DELAY_SECONDS: float = 0.5
+    GEMINI_RETRY_MAX_DELAY_SECONDS: float = 8.0
+    GEMINI_CIRCUIT_FAILURE_THRESHOLD: int = 5
+    GEMINI_CIRCUIT_RECOVERY_SECONDS: float = 30.0
+    GEMINI_HEDGE_AFTER_SECONDS: float = 0.0  # 0 disables hedged requests
+    
+    # Per-query deadline for concurrent AI context enrichment
+    ENRICH_QUERY_TIMEOUT_SECONDS: float = 5.0
+    
+    # Payroll analysis: runs above the threshold are analyzed shard by shard (map-reduce)
+    ANALYSIS_MAP_REDUCE_THRESHOLD: int = 5000
+    ANALYSIS_SHARD_SIZE: int = 2000
+    ANALYSIS_SHARD_MAX_OUTPUT_TOKENS: int = 1024
+    ANALYSIS_PAGE_SIZE: int = 1000  # PostgREST max-rows caps this server-side
+    ANALYSIS_LOAD_CONCURRENCY: int = 8
+    
+    # Prompt context encoding: "auto" (per intent), "json" or "compact" for every intent
+    PROMPT_CONTEXT_ENCODING: str = "auto"
+    
+    # AI response cache (memory LRU + local disk tier)
+    RESPONSE_CACHE_ENABLED: bool = True
+    RESPONSE_CACHE_TTL_SECONDS: float = 6 * 60 * 60
+    RESPONSE_CACHE_MAX_ENTRIES: int = 1000
+    RESPONSE_CACHE_DIR: str = ".cache/ai_responses"
+    RESPONSE_CACHE_DISK_MAX_ENTRIES: int = 10000
+    
+    # Tax slab tables (tax_brackets) cached per bracket / fiscal year
+    TAX_BRACKET_CACHE_TTL_SECONDS: float = 60 * 60
+    
+    # Pay structure snapshots (pay_structure_snapshots) kept in memory for rehydration
+    SNAPSHOT_CACHE_MAX_ENTRIES: int = 10000
+    
+    # Payroll runs of companies with at least this many active employees are computed in Postgres
+    # (0, the default, disables; enable once tests/test_payroll_parity.py passes against the database)
+    PAYROLL_IN_DB_MIN_EMPLOYEES: int = 0
+    
+    # Background precomputation of default AI answers after payroll runs
+    PRECOMPUTE_ENABLED: bool = True
+    PRECOMPUTE_RATE_PER_SECOND: float = 2.0
+    PRECOMPUTE_CONCURRENCY: int = 2
+    PRECOMPUTE_MAX_BACKLOG: int = 20000
+    PRECOMPUTE_TTL_SECONDS: float = 45 * 24 * 60 * 60
+    PRECOMPUTE_MAX_MEMORY_ENTRIES: int = 2000
+    PRECOMPUTE_STORE_DIR: str = ".cache/precomputed"
+    PRECOMPUTE_DISK_MAX_ENTRIES: int = 200000
+    
+    # Server-side conversation memory (LRU + idle TTL, rolling summary)
+    CONVERSATION_MAX_SESSIONS: int = 5000
+    CONVERSATION_TTL_SECONDS: float = 2 * 60 * 60
+    CONVERSATION_RECENT_MESSAGES: int = 8
+    CONVERSATION_SUMMARY_MAX_CHARS: int = 2000
+    
+    # Server-Sent Events streaming
+    SSE_HEARTBEAT_SECONDS: float = 15.0
+    SSE_COALESCE_CHARS: int = 48
+    SSE_COALESCE_DELAY_MS: float = 40.0
+    SSE_QUEUE_SIZE: int = 64
     
     # Application Configuration
     ENVIRONMENT: str = "development"
@@ -28,6 +96,13 @@ class Settings(BaseSettings):
     COOKIE_DOMAIN: str = ""
     COOKIE_SECURE: bool = False
     
+    # Observability
+    SERVER_TIMING_ENABLED: bool = True
+    PROFILING_ENABLED: bool = True
+    PROFILE_OUTPUT_DIR: str = "profiles"
+    PROFILE_SAMPLING_INTERVAL: float = 0.001
+    SLOW_QUERY_THRESHOLD_MS: float = 250.0
+    
     class Config:
         env_file = ".env"
         case_sensitive = True
@@ -0,0 +1,226 @@
+"""
+Instrumented query execution for Supabase/PostgREST
+
+All data access goes through execute(query) instead of query.execute() so that
+every query records its table, filters, row count, response size and latency.
+The response size is the HTTP body PostgREST sent (Content-Length, or the
+length of the body httpx already read), so responses are never re-serialized.
+
+- Slow queries (>= SLOW_QUERY_THRESHOLD_MS) are written as structured JSON to
+  the "app.db.slow" logger
+- Per-endpoint/table aggregates are kept in query_stats for the diagnostics API
+- aexecute(query) runs a query in a worker thread so independent queries can
+  be awaited concurrently (asyncio.gather), with an optional deadline
+"""
+
+from app.core.config import settings
+from app.core.timing import current_timings, record_phase
+from typing import Any, Dict, List, Optional, Tuple
+import asyncio
+import json
+import logging
+import threading
+import time
+
+slow_query_logger = logging.getLogger("app.db.slow")
+
+# The last HTTP response of a query run on this thread; the client is synchronous,
+# so its response hook runs on the thread that called execute()
+_http = threading.local()
+_hooked_sessions_lock = threading.Lock()
+
+
+class QueryStats:
+    """Thread-safe aggregate of query metrics keyed by (endpoint, table, method)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats: Dict[Tuple[str, str, str], Dict[str, float]] = {}
+
+    def record(
+        self,
+        endpoint: str,
+        table: str,
+        method: str,
+        duration_ms: float,
+        rows: int,
+        response_bytes: int,
+        failed: bool
+    ) -> None:
+        key = (endpoint, table, method)
+        with self._lock:
+            entry = self._stats.get(key)
+            if entry is None:
+                entry = {
+                    "count": 0,
+                    "errors": 0,
+                    "total_ms": 0.0,
+                    "max_ms": 0.0,
+                    "rows": 0,
+                    "bytes": 0,
+                    "max_bytes": 0,
+                }
+                self._stats[key] = entry
+            entry["count"] += 1
+            entry["errors"] += 1 if failed else 0
+            entry["total_ms"] += duration_ms
+            entry["max_ms"] = max(entry["max_ms"], duration_ms)
+            entry["rows"] += rows
+            entry["bytes"] += response_bytes
+            entry["max_bytes"] = max(entry["max_bytes"], response_bytes)
+
+    def summary(self) -> List[Dict[str, Any]]:
+        """Per-endpoint query summary, heaviest (by total time) first"""
+        with self._lock:
+            items = list(self._stats.items())
+        result = []
+        for (endpoint, table, method), entry in items:
+            count = entry["count"] or 1
+            result.append({
+                "endpoint": endpoint,
+                "table": table,
+                "method": method,
+                "count": entry["count"],
+                "errors": entry["errors"],
+                "total_ms": round(entry["total_ms"], 2),
+                "avg_ms": round(entry["total_ms"] / count, 2),
+                "max_ms": round(entry["max_ms"], 2),
+                "avg_rows": round(entry["rows"] / count, 2),
+                "total_bytes": entry["bytes"],
+                "avg_bytes": round(entry["bytes"] / count, 2),
+                "max_bytes": entry["max_bytes"],
+            })
+        result.sort(key=lambda r: r["total_ms"], reverse=True)
+        return result
+
+    def reset(self) -> None:
+        with self._lock:
+            self._stats.clear()
+
+
+query_stats = QueryStats()
+
+
+def _describe_query(query: Any) -> Tuple[str, str, Optional[str], Dict[str, str]]:
+    """Extract table, HTTP method, selected columns and filters from a PostgREST builder"""
+    path = str(getattr(query, "path", "") or "")
+    table = path.rstrip("/").rsplit("/", 1)[-1] or "unknown"
+    method = str(getattr(query, "http_method", "GET") or "GET").upper()
+
+    columns = None
+    filters: Dict[str, str] = {}
+    params = getattr(query, "params", None)
+    if params is not None:
+        try:
+            for key, value in params.multi_items():
+                if key == "select":
+                    columns = value
+                elif key in filters:
+                    filters[key] = f"{filters[key]},{value}"
+                else:
+                    filters[key] = value
+        except Exception:
+            pass
+    return table, method, columns, filters
+
+
+def _remember_response(response: Any) -> None:
+    _http.response = response
+
+
+def _capture_responses(query: Any) -> None:
+    """Install the response hook on the builder's httpx session (once per session)"""
+    session = getattr(query, "session", None)
+    hooks = getattr(session, "event_hooks", None)
+    if hooks is None:
+        return
+    with _hooked_sessions_lock:
+        if _remember_response not in hooks["response"]:
+            hooks["response"].append(_remember_response)
+
+
+def _response_bytes(response: Any) -> int:
+    """Body size of an HTTP response, without decoding it again"""
+    if response is None:
+        return 0
+    length = response.headers.get("content-length")
+    if length and length.isdigit():
+        return int(length)
+    try:
+        return len(response.content)
+    except Exception:  # body not read (e.g. the request failed mid-stream)
+        return 0
+
+
+def _measure_response(data: Any, http_response: Any) -> Tuple[int, int]:
+    """Row count and HTTP body size of a response"""
+    if data is None:
+        rows = 0
+    else:
+        rows = len(data) if isinstance(data, list) else 1
+    return rows, _response_bytes(http_response)
+
+
+def execute(query: Any) -> Any:
+    """
+    Execute a Supabase query builder and record its metrics
+
+    Args:
+        query: A PostgREST request builder (e.g. supabase.table("x").select("*").eq(...))
+
+    Returns:
+        The builder's execute() response, unchanged
+    """
+    table, method, columns, filters = _describe_query(query)
+    start = time.perf_counter()
+    response = None
+    failed = False
+    _capture_responses(query)
+    _http.response = None
+    try:
+        response = query.execute()
+        return response
+    except Exception:
+        failed = True
+        raise
+    finally:
+        duration_ms = (time.perf_counter() - start) * 1000
+        rows, response_bytes = _measure_response(getattr(response, "data", None), _http.response)
+        _http.response = None
+
+        timings = current_timings()
+        endpoint = timings.endpoint if timings else "background"
+        record_phase("db", duration_ms)
+        query_stats.record(endpoint, table, method, duration_ms, rows, response_bytes, failed)
+
+        if duration_ms >= settings.SLOW_QUERY_THRESHOLD_MS:
+            slow_query_logger.warning(json.dumps({
+                "event": "slow_query",
+                "endpoint": endpoint,
+                "table": table,
+                "method": method,
+                "columns": columns,
+                "filters": filters,
+                "rows": rows,
+                "response_bytes": response_bytes,
+                "duration_ms": round(duration_ms, 2),
+                "failed": failed,
+            }, default=str))
+
+
+async def aexecute(query: Any, timeout: Optional[float] = None) -> Any:
+    """
+    Execute a query builder off the event loop
+
+    The Supabase client is synchronous; running it in a worker thread lets
+    independent queries overlap. On timeout the caller stops waiting, but the
+    HTTP request itself finishes in its thread.
+
+    Args:
+        query: A PostgREST request builder
+        timeout: Optional deadline in seconds (raises asyncio.TimeoutError)
+    """
+    call = asyncio.to_thread(execute, query)
+    if timeout:
+        return await asyncio.wait_for(call, timeout)
+    return await call
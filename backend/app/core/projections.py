@@ -0,0 +1,50 @@
+"""
+Named column projections for Supabase reads
+
+Payslip reads select one of these instead of "*", so metadata queries never
+transfer PDF bytes. PDFs live in payslip_documents (keyed by payslip_id) and are
+read only by the download endpoint.
+
+- PAYSLIP_SUMMARY: amounts only (lists, totals, anomaly checks)
+- PAYSLIP_DETAIL: summary plus the calculation snapshot and correction link;
+  snapshots with a structure_hash are rehydrated by snapshot_store
+- PAYSLIP_WITH_PERIOD: detail plus the payroll's pay period (AI contexts)
+- PAYSLIP_DOCUMENT: the stored PDF of one payslip
+- PAYSLIP_ANALYSIS: numeric columns for payroll analysis, with the snapshot
+  amounts it needs extracted server-side (JSON paths) instead of the whole snapshot
+- PAYROLL_HEADER: a payroll run without its payslips
+- PAYROLL_TOTALS: a run's trigger-maintained totals (corrections applied)
+- EMPLOYEE_PAY_INPUTS: an employee with the salary structure fields payslip
+  calculation reads
+"""
+
+PAYSLIP_SUMMARY = "id, employee_id, payroll_id, gross_pay, total_deductions, net_pay, created_at"
+
+PAYSLIP_DETAIL = f"{PAYSLIP_SUMMARY}, pay_data_snapshot, structure_hash, correction_of"
+
+PAYSLIP_PERIOD = "payrolls(pay_period_start, pay_period_end)"
+
+PAYSLIP_WITH_PERIOD = f"{PAYSLIP_DETAIL}, {PAYSLIP_PERIOD}"
+
+PAYSLIP_DOCUMENT = "payslip_id, pdf_blob"
+
+PAYSLIP_ANALYSIS = (
+    "id, employee_id, gross_pay, total_deductions, net_pay, correction_of, structure_hash, "
+    "tax_deduction:pay_data_snapshot->tax_deduction, "
+    "leave_deduction:pay_data_snapshot->leave_deduction, "
+    "allowances:pay_data_snapshot->allowances"
+)
+
+PAYROLL_HEADER = "id, company_id, pay_period_start, pay_period_end, status"
+
+PAYROLL_TOTALS = "id, total_gross, total_deductions, total_net, payslip_count"
+
+EMPLOYEE_PAY_INPUTS = (
+    "id, profile_id, designation, salary_structures!salary_structures_employee_id_fkey"
+    "(base_pay, allowances, deductions_fixed, deductions_percent, tax_regime)"
+)
+
+
+def embed(relation: str, columns: str) -> str:
+    """Embedded resource select, e.g. embed("payslips", PAYSLIP_DETAIL) -> "payslips(...)" """
+    return f"{relation}({columns})"
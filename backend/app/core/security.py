@@ -4,8 +4,10 @@ Security utilities for JWT validation and authentication
 
 from fastapi import HTTPException, Security, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from typing import Dict
+from typing import Dict, Optional
 from app.core.supabase import get_supabase_admin_client
+from app.core.db import execute
+from app.core.timing import phase
 import logging
 
 logger = logging.getLogger(__name__)
@@ -20,38 +22,9 @@ async def verify_token(
     Returns the user data from the token
     """
     try:
-        token = credentials.credentials
-        supabase = get_supabase_admin_client()
-        
-        # Verify the token using Supabase
-        user_response = supabase.auth.get_user(token)
-        
-        if not user_response or not user_response.user:
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Invalid or expired token",
-                headers={"WWW-Authenticate": "Bearer"},
-            )
-        
-        user = user_response.user
-        
-        # Fetch user profile to get role
-        profile_response = supabase.table("profiles").select("role, company_id").eq(
-            "id", user.id
-        ).single().execute()
-        
-        if not profile_response.data:
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="User profile not found"
-            )
-        
-        return {
-            "user_id": user.id,
-            "email": user.email,
-            "role": profile_response.data.get("role"),
-            "company_id": profile_response.data.get("company_id")
-        }
+        with phase("auth"):
+            token_payload = _validate_token(credentials.credentials)
+        return token_payload
         
     except HTTPException:
         raise
@@ -64,6 +37,57 @@ async def verify_token(
         )
 
 
+def _validate_token(token: str) -> Dict:
+    """Validate the bearer token with Supabase and load the user's profile"""
+    supabase = get_supabase_admin_client()
+    
+    # Verify the token using Supabase
+    user_response = supabase.auth.get_user(token)
+    
+    if not user_response or not user_response.user:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid or expired token",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    
+    user = user_response.user
+    
+    # Fetch user profile to get role
+    profile_response = execute(supabase.table("profiles").select("role, company_id").eq(
+        "id", user.id
+    ).single())
+    
+    if not profile_response.data:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="User profile not found"
+        )
+    
+    return {
+        "user_id": user.id,
+        "email": user.email,
+        "role": profile_response.data.get("role"),
+        "company_id": profile_response.data.get("company_id")
+    }
+
+
+def token_role(authorization: str) -> Optional[str]:
+    """
+    Role of the user a "Bearer <token>" header authenticates
+
+    Used by the timing middleware before route dependencies run; returns None
+    for missing or invalid tokens instead of raising.
+    """
+    scheme, _, token = (authorization or "").partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return None
+    try:
+        return _validate_token(token).get("role")
+    except Exception:
+        return None
+
+
 async def get_current_user(token_payload: Dict = Security(verify_token)) -> Dict:
     """
     Get current authenticated user
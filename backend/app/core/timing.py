@@ -0,0 +1,227 @@
+"""
+Request timing and on-demand profiling
+
+- phase("db") / record_phase(...) accumulate per-request phase durations
+- ServerTimingMiddleware emits them as a Server-Timing response header
+- Admins can send X-Profile-Request: 1 to capture a sampling profile of that
+  single request (the token is checked before profiling starts); the profile
+  is written to PROFILE_OUTPUT_DIR and its file name is returned in the
+  X-Profile-File header
+"""
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from app.core.config import settings
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Dict, Optional
+import asyncio
+import logging
+import os
+import re
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+PROFILE_REQUEST_HEADER = "X-Profile-Request"
+PROFILE_FILE_HEADER = "X-Profile-File"
+
+# Human readable descriptions for the Server-Timing "desc" parameter
+PHASE_DESCRIPTIONS = {
+    "auth": "Token validation",
+    "db": "Database queries",
+    "enrich": "Context enrichment",
+    "sanitize": "Context sanitization",
+    "llm": "Model calls",
+    "digest": "Payroll digest",
+    "pdf": "PDF rendering",
+}
+
+
+# Path segments that are identifiers (UUIDs, numbers) are collapsed so that
+# per-endpoint metrics don't grow one entry per record
+_ID_SEGMENT = re.compile(r"^(?:[0-9a-fA-F]{8}-[0-9a-fA-F-]{27}|\d+)$")
+
+
+def normalize_endpoint(path: str) -> str:
+    """Replace identifier path segments with {id}"""
+    return "/".join("{id}" if _ID_SEGMENT.match(seg) else seg for seg in path.split("/"))
+
+
+class RequestTimings:
+    """Mutable per-request timing record shared by everything handling the request"""
+
+    def __init__(self, endpoint: str):
+        self.endpoint = normalize_endpoint(endpoint)
+        self.started = time.perf_counter()
+        self.phases: Dict[str, float] = {}
+        # Queries run in worker threads (db.aexecute) record into the same object
+        self._lock = threading.Lock()
+
+    def add(self, name: str, duration_ms: float) -> None:
+        with self._lock:
+            self.phases[name] = self.phases.get(name, 0.0) + duration_ms
+
+    def total_ms(self) -> float:
+        return (time.perf_counter() - self.started) * 1000
+
+    def header_value(self) -> str:
+        """Render phases as a Server-Timing header value"""
+        entries = []
+        for name, duration in self.phases.items():
+            entry = f"{name};dur={duration:.1f}"
+            desc = PHASE_DESCRIPTIONS.get(name)
+            if desc:
+                entry += f';desc="{desc}"'
+            entries.append(entry)
+        entries.append(f"total;dur={self.total_ms():.1f}")
+        return ", ".join(entries)
+
+
+_current_timings: ContextVar[Optional[RequestTimings]] = ContextVar("request_timings", default=None)
+
+
+def current_timings() -> Optional[RequestTimings]:
+    """Timing record of the request being handled, if any"""
+    return _current_timings.get()
+
+
+def record_phase(name: str, duration_ms: float) -> None:
+    """Add a duration to the current request's phase (no-op outside a request)"""
+    timings = _current_timings.get()
+    if timings is not None:
+        timings.add(name, duration_ms)
+
+
+@contextmanager
+def phase(name: str):
+    """Time a block of code and add it to the named phase"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_phase(name, (time.perf_counter() - start) * 1000)
+
+
+class _RequestProfiler:
+    """Sampling profiler for a single request (pyinstrument, falling back to cProfile)"""
+
+    def __init__(self, endpoint: str):
+        try:
+            from pyinstrument import Profiler
+            self._profiler = Profiler(
+                interval=settings.PROFILE_SAMPLING_INTERVAL,
+                async_mode="enabled"
+            )
+            self._kind = "pyinstrument"
+        except ImportError:
+            import cProfile
+            self._profiler = cProfile.Profile()
+            self._kind = "cprofile"
+
+        # Named up front: the header is sent before a streamed body finishes
+        slug = re.sub(r"[^A-Za-z0-9_-]+", "_", endpoint.strip("/")).strip("_") or "root"
+        stamp = datetime.utcnow().strftime("%Y%m%dT%H%M%S%f")
+        extension = "html" if self._kind == "pyinstrument" else "prof"
+        self.filename = f"{stamp}_{slug}.{extension}"
+
+    def start(self) -> None:
+        if self._kind == "pyinstrument":
+            self._profiler.start()
+        else:
+            self._profiler.enable()
+
+    def stop(self) -> None:
+        if self._kind == "pyinstrument":
+            self._profiler.stop()
+        else:
+            self._profiler.disable()
+
+    def save(self) -> None:
+        """Write the profile to PROFILE_OUTPUT_DIR under self.filename"""
+        os.makedirs(settings.PROFILE_OUTPUT_DIR, exist_ok=True)
+        path = os.path.join(settings.PROFILE_OUTPUT_DIR, self.filename)
+        if self._kind == "pyinstrument":
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(self._profiler.output_html())
+        else:
+            self._profiler.dump_stats(path)
+
+
+class ServerTimingMiddleware:
+    """
+    Attach Server-Timing headers and run admin-requested request profiles
+
+    A pure ASGI middleware, so timing and profiling cover the whole response
+    including streamed bodies (/chat/stream). Headers go out before a
+    streamed body, so their Server-Timing holds the phases up to that point;
+    the complete timings of a streamed response are logged when it ends.
+    """
+
+    # Only one request is profiled at a time so profiles don't interleave; set and
+    # cleared without awaiting in between, so concurrent requests never wait on it
+    _profiling = False
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        timings = RequestTimings(scope["path"])
+        token = _current_timings.set(timings)
+        profiler = None
+        try:
+            # The admin check happens before claiming the profiler, so other callers can't hold it;
+            # a request that finds a profile already running is handled normally
+            if await self._profile_requested_by_admin(scope) and not ServerTimingMiddleware._profiling:
+                ServerTimingMiddleware._profiling = True
+                profiler = _RequestProfiler(timings.endpoint)
+                profiler.start()
+
+            phases_sent: Dict[str, float] = {}
+
+            async def send_with_timing(message: Message) -> None:
+                nonlocal phases_sent
+                if message["type"] == "http.response.start":
+                    headers = MutableHeaders(scope=message)
+                    if settings.SERVER_TIMING_ENABLED:
+                        headers.append("Server-Timing", timings.header_value())
+                    if profiler is not None:
+                        headers.append(PROFILE_FILE_HEADER, profiler.filename)
+                    phases_sent = dict(timings.phases)
+                await send(message)
+
+            try:
+                await self.app(scope, receive, send_with_timing)
+            finally:
+                if profiler is not None:
+                    profiler.stop()
+                    ServerTimingMiddleware._profiling = False
+                    try:
+                        profiler.save()
+                        logger.info(f"Saved request profile for {timings.endpoint}: {profiler.filename}")
+                    except Exception as e:
+                        logger.error(f"Could not save request profile: {e}")
+
+            # Phases recorded while the body streamed missed the header
+            if settings.SERVER_TIMING_ENABLED and timings.phases != phases_sent:
+                logger.info(f"Server-Timing {timings.endpoint} (streamed): {timings.header_value()}")
+        finally:
+            _current_timings.reset(token)
+
+    async def _profile_requested_by_admin(self, scope: Scope) -> bool:
+        headers = Headers(scope=scope)
+        if not settings.PROFILING_ENABLED:
+            return False
+        if headers.get(PROFILE_REQUEST_HEADER, "").lower() not in ("1", "true", "yes"):
+            return False
+        if self._profiling:
+            return False
+        from app.core.security import token_role  # security imports this module
+        role = await asyncio.to_thread(token_role, headers.get("authorization", ""))
+        return role == "admin"
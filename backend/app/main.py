@@ -6,7 +6,10 @@ Main application entry point
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from app.core.config import settings
-from app.api.v1.endpoints import chat, payroll
+from app.core.timing import ServerTimingMiddleware, PROFILE_FILE_HEADER
+from app.api.v1.endpoints import chat, payroll, diagnostics
+from app.services.precompute_service import precompute_service
+from app.services.conversation_store import SESSION_ID_HEADER
 
 app = FastAPI(
     title="Payroll AI Backend",
@@ -21,11 +24,22 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing", PROFILE_FILE_HEADER, SESSION_ID_HEADER],
 )
 
+# Per-request phase timings (Server-Timing) and admin-triggered profiling
+app.add_middleware(ServerTimingMiddleware)
+
 # Include routers
 app.include_router(chat.router, prefix="/api/v1/chat", tags=["chat"])
 app.include_router(payroll.router, prefix="/api/v1/payroll", tags=["payroll"])
+app.include_router(diagnostics.router, prefix="/api/v1/diagnostics", tags=["diagnostics"])
+
+@app.on_event("shutdown")
+async def shutdown():
+    """Stop background workers"""
+    await precompute_service.stop()
+
 
 @app.get("/")
 async def root():
@@ -12,13 +12,15 @@ class ChatRequest(BaseModel):
     query: str = Field(..., description="User's question or query")
     context: Optional[Dict[str, Any]] = Field(None, description="Context data for the query")
     intent: Optional[str] = Field(None, description="Intent/purpose: 'payslip_explain', 'leave_advice', 'payslip_tax_suggestions', 'dashboard_insights'")
-    chat_history: Optional[List[Dict[str, str]]] = Field(None, description="Previous conversation messages for context continuity")
+    chat_history: Optional[List[Dict[str, str]]] = Field(None, description="Previous conversation messages; only used to seed a new session")
+    session_id: Optional[str] = Field(None, description="Conversation session ID returned by a previous response")
 
 
 class ChatResponse(BaseModel):
     """Response model for chat endpoint"""
     response: str = Field(..., description="AI-generated response")
     context_used: bool = Field(False, description="Whether context data was used")
+    session_id: Optional[str] = Field(None, description="Conversation session ID to send with the next message")
 
 
 class PayrollAnalysisRequest(BaseModel):
@@ -50,7 +52,8 @@ class PayslipExplainRequest(BaseModel):
     payslip_id: Optional[str] = Field(None, description="UUID of the payslip to explain")
     query: Optional[str] = Field("Please explain the provided payslip", description="Query to send to AI")
     system_instruction: Optional[str] = Field(None, description="Optional custom system instruction for the AI")
-    chat_history: Optional[List[Dict[str, str]]] = Field(None, description="Previous conversation messages for context continuity")
+    chat_history: Optional[List[Dict[str, str]]] = Field(None, description="Previous conversation messages; only used to seed a new session")
+    session_id: Optional[str] = Field(None, description="Conversation session ID returned by a previous response")
 
 
 class PayslipExplainResponse(BaseModel):
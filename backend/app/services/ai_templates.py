@@ -2,7 +2,13 @@
 AI prompt templates for contextual assistance
 """
 
+from app.services.context_encoder import encode_json
+from functools import lru_cache
 from typing import Dict, Any, Optional
+import re
+
+# Bump whenever template wording changes so cached AI responses are not reused
+TEMPLATE_VERSION = "1"
 
 # India-specific tax guidance snippets
 INDIA_TAX_GUIDANCE = """
@@ -29,15 +35,22 @@ class AITemplates:
     """Centralized AI prompt templates"""
     
     @staticmethod
-    def get_template(template_key: str) -> str:
-        """Get a template by key"""
-        templates = {
+    def get_template(template_key: Optional[str]) -> str:
+        """Get a template by key (templates are built once)"""
+        templates = AITemplates.all_templates()
+        return templates.get(template_key or "", templates["general"])
+    
+    @staticmethod
+    @lru_cache(maxsize=1)
+    def all_templates() -> Dict[str, str]:
+        """Every template by key, built on first use; "general" is the fallback"""
+        return {
             "payslip_explain": AITemplates._payslip_explain_template(),
             "leave_advice": AITemplates._leave_advice_template(),
             "payslip_tax_suggestions": AITemplates._payslip_tax_suggestions_template(),
             "dashboard_insights": AITemplates._dashboard_insights_template(),
+            "general": AITemplates._general_template(),
         }
-        return templates.get(template_key, AITemplates._general_template())
     
     @staticmethod
     def _payslip_explain_template() -> str:
@@ -132,6 +145,44 @@ Use Indian Rupee (₹) formatting where applicable.
 Always prioritize user privacy and data security."""
 
 
+# Keys containing any of these substrings (case-insensitive) are never sent to the model
+SENSITIVE_FIELDS = (
+    "bank_account",
+    "bank_account_number",
+    "account_number",
+    "ifsc",
+    "ifsc_code",
+    "ssn",
+    "tax_id",
+    "pan",
+    "pan_number",
+    "aadhaar",
+    "aadhaar_number",
+    "passport",
+    "password",
+    "token",
+    "api_key",
+    "secret",
+    "profile_id",
+    "id",  # Remove all ID fields
+    "employee_id",
+    "payroll_id",
+    "created_by",
+    "updated_by",
+    "pdf_blob",  # Remove PDF data
+    "blob",  # Any blob data
+)
+
+# All rules compiled into one matcher
+_SENSITIVE_KEY_PATTERN = re.compile("|".join(re.escape(field) for field in SENSITIVE_FIELDS))
+
+
+@lru_cache(maxsize=4096)
+def is_sensitive_key(key: str) -> bool:
+    """Whether a context key must be dropped (decision cached per key)"""
+    return _SENSITIVE_KEY_PATTERN.search(str(key).lower()) is not None
+
+
 def sanitize_context(context: Dict[str, Any]) -> Dict[str, Any]:
     """
     Remove sensitive fields from context before sending to AI
@@ -145,45 +196,14 @@ def sanitize_context(context: Dict[str, Any]) -> Dict[str, Any]:
     if not context:
         return {}
     
-    # List of sensitive fields to remove
-    sensitive_fields = [
-        "bank_account",
-        "bank_account_number",
-        "account_number",
-        "ifsc",
-        "ifsc_code",
-        "ssn",
-        "tax_id",
-        "pan",
-        "pan_number",
-        "aadhaar",
-        "aadhaar_number",
-        "passport",
-        "password",
-        "token",
-        "api_key",
-        "secret",
-        "profile_id",
-        "id",  # Remove all ID fields
-        "employee_id",
-        "payroll_id",
-        "created_by",
-        "updated_by",
-        "pdf_blob",  # Remove PDF data
-        "blob",  # Any blob data
-    ]
-    
     def _sanitize_dict(data: Any) -> Any:
         """Recursively sanitize nested dictionaries"""
         if isinstance(data, dict):
-            sanitized = {}
-            for key, value in data.items():
-                # Skip sensitive keys
-                if any(sensitive in key.lower() for sensitive in sensitive_fields):
-                    continue
-                # Recursively sanitize nested dicts/lists
-                sanitized[key] = _sanitize_dict(value)
-            return sanitized
+            return {
+                key: _sanitize_dict(value)
+                for key, value in data.items()
+                if not is_sensitive_key(key)
+            }
         elif isinstance(data, list):
             return [_sanitize_dict(item) for item in data]
         else:
@@ -216,11 +236,7 @@ def format_context_for_prompt(context: Dict[str, Any], intent: Optional[str] = N
     if "data" in context and isinstance(context["data"], dict):
         lines.append("Data:")
         for key, value in context["data"].items():
-            if isinstance(value, (dict, list)):
-                import json
-                lines.append(f"  {key}: {json.dumps(value, indent=2)}")
-            else:
-                lines.append(f"  {key}: {value}")
+            lines.append(encode_json(key, value))
     
     return "\n".join(lines) if lines else "No additional context provided."
 
@@ -228,6 +244,9 @@ def format_context_for_prompt(context: Dict[str, Any], intent: Optional[str] = N
 # Export utilities
 __all__ = [
     "AITemplates",
+    "TEMPLATE_VERSION",
+    "SENSITIVE_FIELDS",
+    "is_sensitive_key",
     "sanitize_context",
     "format_context_for_prompt",
     "INDIA_TAX_GUIDANCE",
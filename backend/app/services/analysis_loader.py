@@ -0,0 +1,162 @@
+"""
+Data loading for payroll analysis
+
+- Reads only PAYSLIP_ANALYSIS columns (no PDFs, no full snapshots), so memory
+  and latency grow with headcount, not with document size
+- Runs are read page by page (ANALYSIS_PAGE_SIZE rows, ordered by ID): the
+  first page also returns the exact row count, the remaining pages are fetched
+  concurrently (at most ANALYSIS_LOAD_CONCURRENCY requests in flight per load)
+- Each page is converted to columnar arrays in the worker thread that fetched
+  it (allowances of deduplicated snapshots come from snapshot_store's cache);
+  the rows are dropped as soon as the page is converted
+- The current run, the prior runs and the company's designations load concurrently
+"""
+
+from app.core.config import settings
+from app.core.db import aexecute, execute
+from app.core.projections import PAYROLL_HEADER, PAYSLIP_ANALYSIS
+from app.services.anomaly_engine import MAX_HISTORY_RUNS
+from app.services.payroll_columns import concat_columns, drop_superseded, headcount, payslip_columns
+from app.services.snapshot_store import snapshot_store
+from typing import Any, Callable, Dict, List, Optional
+import asyncio
+import logging
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class PayrollRun:
+    """A payroll run's header and its payslips as columns"""
+
+    def __init__(self, payroll: Dict[str, Any], columns: Dict[str, np.ndarray]):
+        self.payroll = payroll
+        self.columns = columns
+
+    @property
+    def headcount(self) -> int:
+        return headcount(self.columns)
+
+
+class AnalysisData:
+    """Everything /analyze-payroll reads: the run, its predecessors (most recent first) and designations"""
+
+    def __init__(self, current: PayrollRun, history: List[PayrollRun], designations: Dict[str, str]):
+        self.current = current
+        self.history = history
+        self.designations = designations
+
+    @property
+    def previous(self) -> Optional[PayrollRun]:
+        return self.history[0] if self.history else None
+
+
+async def _paged(make_query: Callable[[], Any], convert: Callable[[List[Dict]], Any], limit: asyncio.Semaphore) -> List[Any]:
+    """
+    Fetch every page of a query and convert each page in its worker thread
+
+    Args:
+        make_query: Returns a fresh, ordered query builder (select with count="exact")
+        convert: Page rows -> converted page
+        limit: Bounds concurrent page requests
+
+    Returns:
+        Converted pages in order
+    """
+    page_size = settings.ANALYSIS_PAGE_SIZE
+
+    def fetch(start: int):
+        response = execute(make_query().range(start, start + page_size - 1))
+        return response, convert(response.data or [])
+
+    async def fetch_page(start: int):
+        async with limit:
+            return (await asyncio.to_thread(fetch, start))[1]
+
+    async with limit:
+        first_response, first = await asyncio.to_thread(fetch, 0)
+    total = getattr(first_response, "count", None)
+    if total is None:
+        # No count returned: continue sequentially until a short page
+        pages, start, size = [first], page_size, len(first_response.data or [])
+        while size == page_size:
+            async with limit:
+                response, page = await asyncio.to_thread(fetch, start)
+            size = len(response.data or [])
+            pages.append(page)
+            start += page_size
+        return pages
+    rest = await asyncio.gather(*(fetch_page(start) for start in range(page_size, total, page_size)))
+    return [first, *rest]
+
+
+async def load_run(supabase, payroll: Dict[str, Any], limit: asyncio.Semaphore) -> PayrollRun:
+    """Load a run's payslips (PAYSLIP_ANALYSIS) into columns"""
+    def convert(rows: List[Dict]) -> Dict[str, np.ndarray]:
+        snapshot_store.rehydrate(supabase, rows)
+        return payslip_columns(rows)
+
+    pages = await _paged(
+        lambda: supabase.table("payslips").select(PAYSLIP_ANALYSIS, count="exact")
+        .eq("payroll_id", payroll["id"]).order("id"),
+        convert,
+        limit
+    )
+    return PayrollRun(payroll, drop_superseded(concat_columns(pages)))
+
+
+async def _load_history(supabase, payroll: Dict[str, Any], runs: int, limit: asyncio.Semaphore) -> List[PayrollRun]:
+    try:
+        response = await aexecute(supabase.table("payrolls").select(PAYROLL_HEADER).eq(
+            "company_id", payroll.get("company_id")
+        ).lt(
+            "pay_period_start", payroll.get("pay_period_start")
+        ).order("pay_period_start", desc=True).limit(runs))
+        return list(await asyncio.gather(*(load_run(supabase, p, limit) for p in response.data or [])))
+    except Exception as e:
+        logger.warning(f"Could not load previous payrolls: {e}")
+        return []
+
+
+async def _load_designations(supabase, company_id: str, limit: asyncio.Semaphore) -> Dict[str, str]:
+    """Map employee ID -> designation for a company"""
+    try:
+        pages = await _paged(
+            lambda: supabase.table("employees").select("id, designation", count="exact")
+            .eq("company_id", company_id).order("id"),
+            lambda rows: {e["id"]: e.get("designation") for e in rows},
+            limit
+        )
+        return {k: v for page in pages for k, v in page.items()}
+    except Exception as e:
+        logger.warning(f"Could not load designations: {e}")
+        return {}
+
+
+async def load_payroll_header(supabase, payroll_id: str) -> Optional[Dict[str, Any]]:
+    """PAYROLL_HEADER of a payroll, or None if it doesn't exist"""
+    response = await aexecute(supabase.table("payrolls").select(PAYROLL_HEADER).eq("id", payroll_id).limit(1))
+    return response.data[0] if response.data else None
+
+
+async def load_analysis_data(supabase, payroll: Dict[str, Any], history_runs: int = MAX_HISTORY_RUNS) -> AnalysisData:
+    """
+    Load a payroll run, its prior runs and the company's designations
+
+    Args:
+        supabase: Supabase client
+        payroll: The run's header (load_payroll_header)
+        history_runs: Number of prior runs (most recent first)
+    """
+    payroll_id = payroll["id"]
+    limit = asyncio.Semaphore(settings.ANALYSIS_LOAD_CONCURRENCY)
+    current, history, designations = await asyncio.gather(
+        load_run(supabase, payroll, limit),
+        _load_history(supabase, payroll, history_runs, limit),
+        _load_designations(supabase, payroll.get("company_id"), limit),
+    )
+    logger.info(
+        f"Loaded payroll {payroll_id} for analysis: {current.headcount} payslips, "
+        f"{len(history)} prior runs ({sum(run.headcount for run in history)} payslips)"
+    )
+    return AnalysisData(current, history, designations)
@@ -0,0 +1,259 @@
+"""
+Persisted, incrementally maintained payroll analyses
+
+Results of /analyze-payroll are stored in payroll_analyses, versioned by a
+fingerprint of the run:
+
+- employee hash: the employee's amounts (every metric and allowance line,
+  to the cent) and designation
+- fingerprint: all employee hashes, the prior runs' fingerprints and
+  ENGINE_VERSION
+- processed/paid payrolls with a stored result are answered from storage
+  without loading the run; drafts are reloaded (numeric columns only) and
+  answered from storage when the fingerprint is unchanged
+- when a draft changed (same prior runs), only employees whose hash changed,
+  or whose designation's peer baseline changed, are re-evaluated; stored
+  anomalies are kept for everyone else
+- the AI summary is regenerated only when the anomaly set changed
+"""
+
+from app.core.db import aexecute
+from app.core.timing import phase
+from app.models.schemas import AnomalyDetail
+from app.services.analysis_loader import AnalysisData, load_analysis_data, load_payroll_header
+from app.services.anomaly_engine import detect_anomalies, peer_stats
+from app.services.gemini_service import gemini_service
+from app.services.payroll_columns import ALLOWANCE_PREFIX, METRICS
+from app.services.payroll_digest import UNASSIGNED
+from typing import Any, Dict, List, Optional
+import asyncio
+import hashlib
+import json
+import logging
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Bump when anomaly rules or thresholds change so stored results are recomputed
+ENGINE_VERSION = "1"
+
+# Payroll statuses whose payslips no longer change
+FINAL_STATUSES = {"processed", "paid"}
+
+_SEVERITY_RANK = {"high": 0, "medium": 1, "low": 2}
+
+# 64-bit FNV parameters for the vectorized row hash
+_FNV_OFFSET = np.uint64(0xCBF29CE484222325)
+_FNV_PRIME = np.uint64(0x100000001B3)
+
+
+def _stable_hash(text: str) -> np.uint64:
+    """Process-independent 64-bit hash of a string (Python's hash() is salted)"""
+    return np.uint64(int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "little"))
+
+
+def employee_hashes(columns: Dict[str, np.ndarray], designations: Dict[str, str]) -> Dict[str, str]:
+    """
+    employee_id -> 16-hex-digit hash of the employee's amounts and designation
+
+    Missing allowance lines don't contribute, so adding a line for one employee
+    doesn't change anyone else's hash.
+    """
+    employee_ids = columns["employee_id"]
+    if employee_ids.size == 0:
+        return {}
+    labels = np.array([designations.get(e) or UNASSIGNED for e in employee_ids.tolist()], dtype=str)
+    names, groups = np.unique(labels, return_inverse=True)
+    hashes = _FNV_OFFSET ^ np.array([_stable_hash(name) for name in names.tolist()], dtype=np.uint64)[groups]
+    keys = list(METRICS) + sorted(k for k in columns if k.startswith(ALLOWANCE_PREFIX))
+    for key in keys:
+        values = columns[key]
+        cents = np.round(np.nan_to_num(values) * 100).astype(np.int64).view(np.uint64)
+        mixed = ((hashes ^ _stable_hash(key)) * _FNV_PRIME ^ cents) * _FNV_PRIME
+        hashes = np.where(np.isnan(values), hashes, mixed)
+    return dict(zip(employee_ids.tolist(), (f"{h:016x}" for h in hashes.tolist())))
+
+
+def _digest(parts: List[str]) -> str:
+    return hashlib.sha256("\n".join(parts).encode("utf-8")).hexdigest()
+
+
+def run_fingerprint(hashes: Dict[str, str]) -> str:
+    return _digest([f"{e}:{h}" for e, h in sorted(hashes.items())])
+
+
+def anomaly_fingerprint(anomalies: List[Dict[str, Any]]) -> str:
+    rows = sorted(json.dumps(a, sort_keys=True) for a in anomalies)
+    return _digest(rows)
+
+
+def _sort_anomalies(anomalies: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Most severe first; order within a severity is kept (engine order)"""
+    return sorted(anomalies, key=lambda a: _SEVERITY_RANK.get(a.get("severity"), 3))
+
+
+class PayrollAnalysisService:
+    """Stored /analyze-payroll results with incremental recomputation"""
+
+    async def analyze(self, supabase, payroll_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Analysis of a payroll run, from storage when still current
+
+        Args:
+            supabase: Supabase admin client
+            payroll_id: Payroll run ID
+
+        Returns:
+            {"payroll_id", "anomalies" (AnomalyDetail dicts), "summary"}, or None
+            if the payroll doesn't exist
+        """
+        payroll, stored = await asyncio.gather(
+            load_payroll_header(supabase, payroll_id),
+            self._load_stored(supabase, payroll_id)
+        )
+        if payroll is None:
+            return None
+        if stored and stored.get("engine_version") != ENGINE_VERSION:
+            stored = None
+
+        if stored and payroll.get("status") in FINAL_STATUSES and stored.get("anomaly_fingerprint"):
+            logger.info(f"Payroll analysis {payroll_id}: stored result ({payroll.get('status')})")
+            return self._result(payroll_id, stored)
+
+        with phase("load"):
+            data = await load_analysis_data(supabase, payroll)
+        with phase("fingerprint"):
+            hashes, history_fingerprint, fingerprint = await asyncio.to_thread(self._fingerprints, data)
+
+        if stored and stored.get("fingerprint") == fingerprint and stored.get("anomaly_fingerprint"):
+            logger.info(f"Payroll analysis {payroll_id}: unchanged, stored result")
+            return self._result(payroll_id, stored)
+
+        with phase("anomalies"):
+            stats = await asyncio.to_thread(peer_stats, data.current.columns, data.designations)
+            if stored and stored.get("history_fingerprint") == history_fingerprint:
+                anomalies = await asyncio.to_thread(self._update_anomalies, data, stored, hashes, stats)
+            else:
+                anomalies = await asyncio.to_thread(self._all_anomalies, data)
+
+        anomalies_hash = anomaly_fingerprint(anomalies)
+        summary = stored.get("summary") if stored else None
+        if not (stored and stored.get("anomaly_fingerprint") == anomalies_hash and summary):
+            previous = data.previous.columns if data.previous else None
+            analysis = await gemini_service.analyze_payroll_data(
+                payroll=payroll,
+                current=data.current.columns,
+                previous=previous,
+                designations=data.designations
+            )
+            summary = analysis.get("summary", "Analysis complete")
+            if analysis.get("failed"):
+                anomalies_hash = None  # retry the summary on the next call
+        else:
+            logger.info(f"Payroll analysis {payroll_id}: anomaly set unchanged, summary reused")
+
+        row = {
+            "payroll_id": payroll_id,
+            "engine_version": ENGINE_VERSION,
+            "fingerprint": fingerprint,
+            "history_fingerprint": history_fingerprint,
+            "employee_hashes": hashes,
+            "peer_stats": stats,
+            "anomalies": anomalies,
+            "anomaly_fingerprint": anomalies_hash,
+            "summary": summary,
+            "payroll_status": payroll.get("status"),
+        }
+        await self._save(supabase, row)
+        return self._result(payroll_id, row)
+
+    async def invalidate(self, supabase, payroll_id: str) -> None:
+        """Drop a stored analysis (e.g. after a processed payroll's payslip was corrected)"""
+        try:
+            await aexecute(supabase.table("payroll_analyses").delete().eq("payroll_id", payroll_id))
+        except Exception as e:
+            logger.warning(f"Could not invalidate payroll analysis {payroll_id}: {e}")
+
+    @staticmethod
+    def _result(payroll_id: str, row: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            "payroll_id": payroll_id,
+            "anomalies": [AnomalyDetail(**a) for a in row.get("anomalies") or []],
+            "summary": row.get("summary") or "Analysis complete",
+        }
+
+    @staticmethod
+    def _fingerprints(data: AnalysisData):
+        hashes = employee_hashes(data.current.columns, data.designations)
+        history_fingerprint = _digest([
+            f"{run.payroll.get('id')}:{run_fingerprint(employee_hashes(run.columns, {}))}"
+            for run in data.history
+        ])
+        fingerprint = _digest([ENGINE_VERSION, history_fingerprint, run_fingerprint(hashes)])
+        return hashes, history_fingerprint, fingerprint
+
+    @staticmethod
+    def _all_anomalies(data: AnalysisData) -> List[Dict[str, Any]]:
+        anomalies = detect_anomalies(
+            data.current.columns,
+            [run.columns for run in data.history],
+            data.designations
+        )
+        return [a.model_dump() for a in anomalies]
+
+    @staticmethod
+    def _update_anomalies(
+        data: AnalysisData,
+        stored: Dict[str, Any],
+        hashes: Dict[str, str],
+        stats: Dict[str, Dict[str, List[float]]]
+    ) -> List[Dict[str, Any]]:
+        """Re-evaluate only employees whose row or peer baseline changed"""
+        stored_hashes = stored.get("employee_hashes") or {}
+        stored_stats = stored.get("peer_stats") or {}
+        changed_designations = {
+            name for name in set(stats) | set(stored_stats)
+            if stats.get(name) != stored_stats.get(name)
+        }
+        employee_ids = data.current.columns["employee_id"].tolist()
+        affected = [
+            i for i, e in enumerate(employee_ids)
+            if stored_hashes.get(e) != hashes[e]
+            or (data.designations.get(e) or UNASSIGNED) in changed_designations
+        ]
+        affected_ids = {employee_ids[i] for i in affected}
+        kept = [
+            a for a in stored.get("anomalies") or []
+            if a.get("employee_id") in hashes and a.get("employee_id") not in affected_ids
+        ]
+        fresh = detect_anomalies(
+            data.current.columns,
+            [run.columns for run in data.history],
+            data.designations,
+            rows=np.array(affected, dtype=np.int64)
+        )
+        logger.info(
+            f"Payroll analysis {data.current.payroll.get('id')}: re-evaluated {len(affected)} of "
+            f"{len(employee_ids)} employees ({len(changed_designations)} designation baselines changed)"
+        )
+        return _sort_anomalies(kept + [a.model_dump() for a in fresh])
+
+    async def _load_stored(self, supabase, payroll_id: str) -> Optional[Dict[str, Any]]:
+        try:
+            response = await aexecute(
+                supabase.table("payroll_analyses").select("*").eq("payroll_id", payroll_id).limit(1)
+            )
+            return response.data[0] if response.data else None
+        except Exception as e:
+            logger.warning(f"Could not read stored payroll analysis {payroll_id}: {e}")
+            return None
+
+    async def _save(self, supabase, row: Dict[str, Any]) -> None:
+        try:
+            await aexecute(supabase.table("payroll_analyses").upsert(row, on_conflict="payroll_id"))
+        except Exception as e:
+            logger.warning(f"Could not store payroll analysis {row['payroll_id']}: {e}")
+
+
+# Singleton instance
+payroll_analysis_service = PayrollAnalysisService()
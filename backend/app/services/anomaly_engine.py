@@ -0,0 +1,283 @@
+"""
+Vectorized payroll anomaly detection over multiple prior runs
+
+- Every metric of the current run (gross, deductions, net, leave deduction and
+  each allowance line) is compared with the same employee's last MAX_HISTORY_RUNS
+  runs using a robust z-score: 0.6745 * (value - median) / MAD
+- MAD is floored (MAD_FLOOR_FRACTION of the employee's typical amount) so
+  employees with a perfectly flat history aren't flagged for a rounding change
+- Each value is also compared with the employee's designation peers in the
+  current run (median/MAD within the designation, groups of MIN_PEER_GROUP or more)
+- Deductions and net pay are compared net of unpaid leave, so leave shows up
+  once (as leave_deduction, at reduced severity) instead of on three metrics
+- All statistics run on employee x run matrices with numpy; rows are only
+  touched once, to build the columns, and once per flagged value
+
+detect_anomalies() takes columnar runs (payroll_columns) and returns AnomalyDetail
+objects, most severe first.
+"""
+
+from app.models.schemas import AnomalyDetail
+from app.services.payroll_columns import ALLOWANCE_PREFIX
+from app.services.payroll_digest import UNASSIGNED, group_medians
+from typing import Dict, List, Optional, Sequence, Tuple
+import numpy as np
+
+# Prior runs compared per employee
+MAX_HISTORY_RUNS = 12
+
+# Metrics compared for every payslip, plus each allowance line ("allowance.<name>")
+BASE_METRICS = ("gross_pay", "total_deductions", "net_pay", "leave_deduction")
+
+# Robust z-score thresholds (history and peer comparisons)
+Z_MEDIUM = 3.5
+Z_HIGH = 7.0
+
+# MAD floor: this fraction of max(|median|, MIN_SCALE_SHARE x median gross pay)
+MAD_FLOOR_FRACTION = 0.025
+MIN_SCALE_SHARE = 0.25
+
+# Designations smaller than this are not used for peer comparison
+MIN_PEER_GROUP = 5
+
+# Metrics compared net of the period's unpaid leave deduction (sign it is applied
+# with), so an unpaid leave only shows up as a leave_deduction finding
+LEAVE_ADJUSTED = {"total_deductions": -1.0, "net_pay": 1.0}
+
+# Findings on these metrics are reported one severity level lower (routine causes)
+DOWNGRADED_METRICS = {"leave_deduction"}
+
+# Metrics without a meaningful peer comparison (most peers are at zero)
+NO_PEER_METRICS = {"leave_deduction"}
+
+_SEVERITY = ("low", "medium", "high")
+
+_ACTIONS = {
+    "gross_pay": "Check salary structure changes (revision, allowances) for this employee",
+    "total_deductions": "Review deduction changes (tax, statutory, unpaid leave)",
+    "net_pay": "Review salary changes and deductions",
+    "leave_deduction": "Verify unpaid leave days recorded for this period",
+}
+
+
+def _align(sorted_ids: np.ndarray, order: np.ndarray, run: Dict[str, np.ndarray]) -> Tuple[np.ndarray, np.ndarray]:
+    """(current-run rows, run rows) of the employees present in both runs"""
+    run_ids = run["employee_id"]
+    if run_ids.size == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    pos = np.minimum(np.searchsorted(sorted_ids, run_ids), sorted_ids.size - 1)
+    run_rows = np.flatnonzero(sorted_ids[pos] == run_ids)
+    return order[pos[run_rows]], run_rows
+
+
+def _history_matrix(
+    metric: str,
+    alignments: List[Tuple[np.ndarray, np.ndarray]],
+    history: Sequence[Dict[str, np.ndarray]],
+    count: int
+) -> np.ndarray:
+    """employees x runs matrix of a metric, NaN where the employee or line is absent"""
+    matrix = np.full((count, len(history)), np.nan)
+    for r, (run, (rows, run_rows)) in enumerate(zip(history, alignments)):
+        values = run.get(metric)
+        if values is not None:
+            matrix[rows, r] = values[run_rows]
+    return matrix
+
+
+def _row_medians(matrix: np.ndarray) -> np.ndarray:
+    """Median of each row ignoring NaN (NaN for empty rows), via one sort"""
+    if matrix.shape[1] == 0:
+        return np.full(matrix.shape[0], np.nan)
+    ordered = np.sort(matrix, axis=1)  # NaN sorts last
+    counts = np.count_nonzero(~np.isnan(matrix), axis=1)
+    low = np.maximum((counts - 1) // 2, 0)
+    high = np.maximum(counts // 2, 0)
+    medians = (
+        np.take_along_axis(ordered, low[:, None], axis=1)[:, 0]
+        + np.take_along_axis(ordered, high[:, None], axis=1)[:, 0]
+    ) / 2
+    medians[counts == 0] = np.nan
+    return medians
+
+
+def _robust_z(values: np.ndarray, medians: np.ndarray, mads: np.ndarray, scale: np.ndarray) -> np.ndarray:
+    floor = MAD_FLOOR_FRACTION * np.maximum(np.abs(medians), scale)
+    spread = np.fmax(mads, floor)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        z = 0.6745 * (values - medians) / spread
+    return np.where(spread > 0, z, np.nan)
+
+
+def _severity(history_z: float, peer_z: float) -> int:
+    """Level (index into _SEVERITY): medium/high on the history z-score, one
+    level higher when the value is also a peer-group outlier"""
+    h = abs(history_z) if np.isfinite(history_z) else 0.0
+    p = abs(peer_z) if np.isfinite(peer_z) else 0.0
+    level = 2 if h > Z_HIGH else 1 if h > Z_MEDIUM else 0
+    if p > Z_MEDIUM:
+        level = min(level + 1, 2) if level else (1 if p > Z_HIGH else 0)
+    return level
+
+
+def _action(metric: str, history_flag: bool, peer_flag: bool) -> str:
+    if metric.startswith(ALLOWANCE_PREFIX):
+        action = f"Verify the {metric[len(ALLOWANCE_PREFIX):]} allowance amount"
+    else:
+        action = _ACTIONS.get(metric, "Review this amount")
+    if history_flag and peer_flag:
+        return f"{action}; unusual against both the employee's recent runs and designation peers"
+    if peer_flag:
+        return f"{action}; out of line with designation peers"
+    return f"{action}; unusual against the employee's recent runs"
+
+
+def _peer_groups(employee_ids: np.ndarray, designations: Dict[str, str]) -> Tuple[np.ndarray, np.ndarray]:
+    """(designation names, designation code per row)"""
+    labels = np.array([designations.get(e) or UNASSIGNED for e in employee_ids.tolist()], dtype=str)
+    return np.unique(labels, return_inverse=True)
+
+
+def _compared_values(current: Dict[str, np.ndarray], metric: str) -> np.ndarray:
+    """A metric's current values as compared (net of unpaid leave where LEAVE_ADJUSTED)"""
+    sign = LEAVE_ADJUSTED.get(metric)
+    if sign is None:
+        return current[metric]
+    return current[metric] + sign * current["leave_deduction"]
+
+
+def _peer_baseline(values: np.ndarray, groups: np.ndarray, group_count: int) -> Tuple[np.ndarray, np.ndarray]:
+    """(median, MAD) per designation; missing lines count as zero"""
+    peer_values = np.where(np.isnan(values), 0.0, values)
+    medians = group_medians(peer_values, groups, group_count)
+    mads = group_medians(np.abs(peer_values - medians[groups]), groups, group_count)
+    return medians, mads
+
+
+def _metrics(current: Dict[str, np.ndarray]) -> List[str]:
+    return list(BASE_METRICS) + sorted(k for k in current if k.startswith(ALLOWANCE_PREFIX))
+
+
+def peer_stats(current: Dict[str, np.ndarray], designations: Optional[Dict[str, str]] = None) -> Dict[str, Dict[str, List[float]]]:
+    """
+    Peer baselines of a run: designation -> metric -> [median, MAD]
+
+    Only designations used for peer comparison (MIN_PEER_GROUP or more) are
+    included. An employee's peer findings can only change when their row or
+    their designation's baseline changes.
+    """
+    if current["employee_id"].size == 0:
+        return {}
+    names, groups = _peer_groups(current["employee_id"], designations or {})
+    sizes = np.bincount(groups, minlength=names.size)
+    stats: Dict[str, Dict[str, List[float]]] = {
+        str(name): {} for name, size in zip(names.tolist(), sizes.tolist()) if size >= MIN_PEER_GROUP
+    }
+    for metric in _metrics(current):
+        if metric in NO_PEER_METRICS:
+            continue
+        medians, mads = _peer_baseline(_compared_values(current, metric), groups, names.size)
+        for g, name in enumerate(names.tolist()):
+            if name in stats:
+                stats[name][metric] = [round(float(medians[g]), 2), round(float(mads[g]), 2)]
+    return stats
+
+
+def detect_anomalies(
+    current: Dict[str, np.ndarray],
+    history: Sequence[Dict[str, np.ndarray]],
+    designations: Optional[Dict[str, str]] = None,
+    rows: Optional[np.ndarray] = None
+) -> List[AnomalyDetail]:
+    """
+    Flag unusual amounts in a payroll run
+
+    Args:
+        current: Columns of the run being analyzed (one row per employee)
+        history: Columns of prior runs, most recent first (first
+            MAX_HISTORY_RUNS are used)
+        designations: employee_id -> designation (peer groups)
+        rows: Only evaluate these rows of current (peer baselines still use
+            the whole run); all rows by default
+
+    Returns:
+        AnomalyDetail per flagged (employee, metric), most severe first.
+        previous_value is the expected amount: the employee's median over the
+        prior runs, or the designation median for peer-only findings (adjusted
+        for this period's unpaid leave for deductions and net pay).
+    """
+    if current["employee_id"].size == 0:
+        return []
+    selected = np.arange(current["employee_id"].size) if rows is None else np.asarray(rows, dtype=np.int64)
+    if selected.size == 0:
+        return []
+    employee_ids = current["employee_id"][selected]
+    count = employee_ids.size
+    history = list(history)[:MAX_HISTORY_RUNS]
+    order = np.argsort(employee_ids, kind="stable")
+    sorted_ids = employee_ids[order]
+    alignments = [_align(sorted_ids, order, run) for run in history]
+
+    # Peer groups (designation codes) over the whole run
+    names, all_groups = _peer_groups(current["employee_id"], designations or {})
+    group_count = names.size
+    groups = all_groups[selected]
+    peer_ok = (np.bincount(all_groups, minlength=group_count) >= MIN_PEER_GROUP)[groups]
+
+    # Typical gross pay per employee scales the MAD floor of every metric
+    matrices = {"gross_pay": _history_matrix("gross_pay", alignments, history, count)}
+    matrices["leave_deduction"] = _history_matrix("leave_deduction", alignments, history, count)
+    typical_gross = _row_medians(matrices["gross_pay"])
+    gross_scale = MIN_SCALE_SHARE * np.where(np.isnan(typical_gross), current["gross_pay"][selected], typical_gross)
+    leave = current["leave_deduction"][selected]
+
+    findings = []  # (severity level, |z|, metric, row, expected value, history flag, peer flag)
+    for metric in _metrics(current):
+        compared = _compared_values(current, metric)
+        values = compared[selected]
+        matrix = matrices.get(metric)
+        if matrix is None:
+            matrix = _history_matrix(metric, alignments, history, count)
+        sign = LEAVE_ADJUSTED.get(metric)
+        if sign is not None:
+            matrix = matrix + sign * np.nan_to_num(matrices["leave_deduction"])
+        medians = _row_medians(matrix)
+        mads = _row_medians(np.abs(matrix - medians[:, None]))
+        history_z = _robust_z(values, medians, mads, gross_scale)
+
+        if metric in NO_PEER_METRICS:
+            peer_medians = peer_z = np.full(count, np.nan)
+        else:
+            group_median, group_mad = _peer_baseline(compared, all_groups, group_count)
+            peer_medians = group_median[groups]
+            peer_z = _robust_z(values, peer_medians, group_mad[groups], gross_scale)
+            peer_z = np.where(peer_ok & ~np.isnan(values), peer_z, np.nan)
+
+        history_flag = np.abs(np.nan_to_num(history_z)) > Z_MEDIUM
+        peer_flag = np.abs(np.nan_to_num(peer_z)) > Z_MEDIUM
+        for i in np.flatnonzero(history_flag | peer_flag).tolist():
+            level = _severity(history_z[i], peer_z[i])
+            if metric in DOWNGRADED_METRICS:
+                level = max(level - 1, 0)
+            if history_flag[i]:
+                expected, score = medians[i], abs(history_z[i])
+            else:
+                expected, score = peer_medians[i], abs(peer_z[i])
+            if sign is not None:
+                expected -= sign * leave[i]  # back to this period's terms
+            findings.append((level, float(score), metric, i, float(expected), bool(history_flag[i]), bool(peer_flag[i])))
+
+    findings.sort(key=lambda f: (-f[0], -f[1]))
+    anomalies = []
+    for level, _, metric, i, expected, history_flag, peer_flag in findings:
+        value = float(current[metric][selected[i]])
+        anomalies.append(AnomalyDetail(
+            employee_id=str(employee_ids[i]),
+            metric=metric,
+            previous_value=round(expected, 2),
+            current_value=round(value, 2),
+            percent_change=round((value - expected) / expected, 4) if expected else None,
+            severity=_SEVERITY[level],
+            suggested_action=_action(metric, history_flag, peer_flag)
+        ))
+    return anomalies
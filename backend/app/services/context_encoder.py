@@ -0,0 +1,124 @@
+"""
+Context encodings for AI prompts
+
+- "json": every section as indented JSON (the original format)
+- "compact": scalars as key=value lines, nested dicts flattened to dotted keys,
+  and homogeneous lists of records as one header plus one comma-separated row
+  per record, e.g.
+
+    previous_payslips[3]{created_at,gross_pay,net_pay}:
+      2025-09-30,63600,53000
+      2025-08-31,63600,54666.67
+      2025-07-31,61000,52100
+
+Twelve months of payslip history costs a fraction of the tokens in the compact
+form, because key names, braces and indentation are not repeated per row.
+prompt_engine picks the encoding per intent.
+"""
+
+from typing import Any, Dict, List, Optional
+import json
+
+ENCODING_JSON = "json"
+ENCODING_COMPACT = "compact"
+
+# One-line legend added to prompts that use the compact encoding
+COMPACT_LEGEND = (
+    "Data (key=value lines; tables as name[row count]{columns} followed by one "
+    "comma-separated row per line, empty cell = no value):"
+)
+
+
+def _scalar(value: Any) -> str:
+    """Render a scalar cell/value without JSON noise"""
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, float):
+        if value.is_integer():
+            return str(int(value))
+        return str(round(value, 2))
+    text = str(value)
+    if any(c in text for c in ',\n"') or text != text.strip():
+        return json.dumps(text, ensure_ascii=False)
+    return text
+
+
+def _is_scalar(value: Any) -> bool:
+    return value is None or isinstance(value, (str, int, float, bool))
+
+
+def _flatten(value: Dict[str, Any], prefix: str = "") -> Optional[Dict[str, Any]]:
+    """Flatten nested dicts into dotted keys; None if a value can't be flattened (e.g. a list)"""
+    flat: Dict[str, Any] = {}
+    for key, item in value.items():
+        name = f"{prefix}{key}"
+        if isinstance(item, dict):
+            nested = _flatten(item, f"{name}.")
+            if nested is None:
+                return None
+            flat.update(nested)
+        elif _is_scalar(item):
+            flat[name] = item
+        else:
+            return None
+    return flat
+
+
+def _table(key: str, rows: List[Dict[str, Any]]) -> Optional[str]:
+    """Header-plus-rows table for a list of records, or None if the records aren't flat"""
+    flat_rows = []
+    columns: List[str] = []
+    seen = set()
+    for row in rows:
+        flat = _flatten(row)
+        if flat is None:
+            return None
+        flat_rows.append(flat)
+        for column in flat:
+            if column not in seen:
+                seen.add(column)
+                columns.append(column)
+    lines = [f"  {key}[{len(flat_rows)}]{{{','.join(columns)}}}:"]
+    for flat in flat_rows:
+        lines.append("    " + ",".join(_scalar(flat.get(column)) for column in columns))
+    return "\n".join(lines)
+
+
+def encode_compact(key: str, value: Any) -> str:
+    """Render one context section in the compact encoding"""
+    if _is_scalar(value):
+        return f"  {key}={_scalar(value)}"
+    if isinstance(value, dict):
+        flat = _flatten(value, f"{key}.")
+        if flat is not None:
+            return "\n".join(f"  {name}={_scalar(item)}" for name, item in flat.items()) or f"  {key}={{}}"
+    if isinstance(value, list):
+        if not value:
+            return f"  {key}[0]"
+        if all(_is_scalar(item) for item in value):
+            return f"  {key}=[{', '.join(_scalar(item) for item in value)}]"
+        if all(isinstance(item, dict) for item in value):
+            table = _table(key, value)
+            if table is not None:
+                return table
+    # Irregular structure: single-line JSON
+    return f"  {key}: {json.dumps(value, ensure_ascii=False, separators=(',', ':'), default=str)}"
+
+
+def encode_json(key: str, value: Any) -> str:
+    """Render one context section as indented JSON (original format)"""
+    if isinstance(value, (dict, list)):
+        return f"  {key}: {json.dumps(value, indent=2)}"
+    return f"  {key}: {value}"
+
+
+ENCODERS = {
+    ENCODING_JSON: encode_json,
+    ENCODING_COMPACT: encode_compact,
+}
+
+
+def encode_section(key: str, value: Any, encoding: str = ENCODING_JSON) -> str:
+    return ENCODERS.get(encoding, encode_json)(key, value)
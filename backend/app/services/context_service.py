@@ -0,0 +1,307 @@
+"""
+Context enrichment for AI requests
+
+- enrich_context_by_intent(): fetch the data an intent needs for the current user
+  (payslip_explain gets up to 12 months, fiscal Apr 1 -> current, plus the
+  maintained YTD totals from employee_ytd_totals); after the
+  employee lookup, the intent's queries run concurrently
+- build_conversation_context(): merge chat history into the sanitized context
+
+Fetched payslips get their full calculation snapshot back from snapshot_store.
+
+Shared by the chat endpoints and background precomputation.
+"""
+
+from app.core.config import settings
+from app.core.supabase import get_supabase_admin_client
+from app.core.db import aexecute
+from app.core.projections import PAYSLIP_DETAIL, PAYSLIP_WITH_PERIOD
+from typing import Any, Dict, List, Optional
+from app.services.snapshot_store import snapshot_store
+from app.services.ytd_service import fiscal_year_of, fiscal_year_start, format_ytd, ytd_query
+from datetime import datetime
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+async def _run_plan(queries: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Run independent queries concurrently with a per-query timeout
+    
+    Returns:
+        name -> response data (None for failed, timed-out or empty queries)
+    """
+    names = list(queries)
+    results = await asyncio.gather(
+        *(aexecute(queries[name], timeout=settings.ENRICH_QUERY_TIMEOUT_SECONDS) for name in names),
+        return_exceptions=True
+    )
+    data = {}
+    for name, result in zip(names, results):
+        if isinstance(result, Exception):
+            logger.warning(f"Enrichment query '{name}' failed: {type(result).__name__}: {result}")
+            data[name] = None
+        else:
+            data[name] = result.data
+    return data
+
+
+def _sum_ytd(payslips: list) -> Dict[str, Any]:
+    """YTD totals summed from fetched payslips (fallback when employee_ytd_totals has no row)"""
+    total_gross = 0.0
+    total_net = 0.0
+    for p in payslips:
+        pay_snapshot = p.get("pay_data_snapshot") or {}
+        total_gross += float(pay_snapshot.get("gross_pay") or p.get("gross_pay") or 0)
+        total_net += float(pay_snapshot.get("net_pay") or p.get("net_pay") or 0)
+    return {
+        "gross_ytd": total_gross,
+        "net_ytd": total_net,
+        "months_included": len(payslips)
+    }
+
+
+def _current_payslips(payslips: List[Dict[str, Any]], limit: int = 12) -> List[Dict[str, Any]]:
+    """
+    Drop payslips replaced by a correction among them, keeping the first `limit`
+
+    A correction is in the same pay period and created after the payslip it
+    replaces, so a query ordered by created_at (newest first) returns it
+    whenever it returns the replaced payslip.
+    """
+    corrected = {p.get("correction_of") for p in payslips if p.get("correction_of")}
+    return [p for p in payslips if p.get("id") not in corrected][:limit]
+
+
+def _period_start(payslip: Dict[str, Any]) -> str:
+    return (payslip.get("payrolls") or {}).get("pay_period_start") or ""
+
+
+def _previous_payslips(payslips: List[Dict[str, Any]], current: Dict[str, Any], limit: int = 11) -> List[Dict[str, Any]]:
+    """Payslips for pay periods before the current payslip's, latest first"""
+    start = _period_start(current)
+    earlier = [p for p in payslips if p.get("id") != current.get("id") and "" < _period_start(p) < start]
+    return sorted(earlier, key=_period_start, reverse=True)[:limit]
+
+
+async def _fetch_previous_payslips(supabase, employee_id: str, current: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Up to 11 payslips for pay periods before the current payslip's (empty on failure)"""
+    try:
+        response = await aexecute(supabase.table("payslips").select(
+            f"{PAYSLIP_DETAIL}, payrolls!inner(pay_period_start, pay_period_end)"
+        ).eq("employee_id", employee_id).lt(
+            "payrolls.pay_period_start", _period_start(current)
+        ).order("created_at", desc=True).limit(22), timeout=settings.ENRICH_QUERY_TIMEOUT_SECONDS)
+        previous = _previous_payslips(_current_payslips(response.data or [], 22), current)
+        await snapshot_store.arehydrate(supabase, previous)
+        return previous
+    except Exception as e:
+        logger.warning(f"Could not fetch payslips before {current.get('id')}: {e}")
+        return []
+
+
+async def enrich_context_by_intent(
+    intent: str,
+    context: Dict,
+    current_user: Dict
+) -> Dict:
+    """
+    Fetch additional context from database based on intent.
+    
+    For payslip_explain: fetch payslips of the current fiscal year (Apr 1 -> current month,
+    by pay period) and the maintained YTD totals.
+    
+    The employee lookup runs first; every other query for the intent depends only
+    on it and runs concurrently (per-query timeout ENRICH_QUERY_TIMEOUT_SECONDS).
+    A failed query only leaves its part of the context out.
+    
+    Args:
+        intent: The intent type (payslip_explain, leave_advice, etc.)
+        context: Existing context from request
+        current_user: Current authenticated user
+    
+    Returns:
+        Enriched context with fetched data
+    """
+    supabase = get_supabase_admin_client()
+    enriched = context.copy()
+    
+    try:
+        # Get employee record for current user (everything else depends on it)
+        employee_response = await aexecute(supabase.table("employees").select(
+            "id, company_id, designation, profile_id"
+        ).eq("profile_id", current_user["user_id"]).single(), timeout=settings.ENRICH_QUERY_TIMEOUT_SECONDS)
+        
+        if not employee_response.data:
+            return enriched
+        
+        employee = employee_response.data
+        employee_id = employee["id"]
+        
+        # Employee name/email/phone (masked before reaching the model)
+        plan = {
+            "profile": supabase.table("profiles").select(
+                "full_name, email, phone"
+            ).eq("id", current_user["user_id"]).single(),
+        }
+        
+        payslip_id = None
+        if intent == "payslip_explain":
+            # Payslips of the current fiscal year (Apr 1 -> now, by pay period), up to 12
+            # (twice that is fetched: corrected payslips are dropped below)
+            fiscal_start = fiscal_year_start(fiscal_year_of())
+            plan["payslips"] = supabase.table("payslips").select(
+                f"{PAYSLIP_DETAIL}, payrolls!inner(pay_period_start, pay_period_end)"
+            ).eq("employee_id", employee_id).gte(
+                "payrolls.pay_period_end", fiscal_start.isoformat()
+            ).order("created_at", desc=True).limit(24)
+            # Maintained fiscal-year totals (one primary-key lookup)
+            plan["ytd"] = ytd_query(supabase, employee_id)
+            
+            # The requested payslip may be older than the fiscal window; fetch it alongside
+            payslip_id = context.get("payslip_id") or context.get("data", {}).get("payslip_id")
+            if payslip_id:
+                plan["requested_payslip"] = supabase.table("payslips").select(
+                    PAYSLIP_WITH_PERIOD
+                ).eq("id", payslip_id).eq("employee_id", employee_id).single()
+        
+        elif intent == "leave_advice":
+            # All leave balances and leave requests (no limit)
+            plan["balances"] = supabase.table("employee_leave_balances").select("*").eq("employee_id", employee_id)
+            plan["requests"] = supabase.table("leave_requests").select("*").eq("employee_id", employee_id).order("created_at", desc=True)
+            # Full salary structure for the employee (all fields/components)
+            plan["salary"] = supabase.table("salary_structures").select("*").eq("employee_id", employee_id).order("created_at", desc=True)
+            # All active and upcoming leave periods/holidays for the company (no limit)
+            plan["periods"] = supabase.table("leave_periods").select("*").eq("company_id", employee["company_id"]).order("start_date", desc=False)
+        
+        elif intent in ["payslip_tax_suggestions", "dashboard_insights"]:
+            # Recent payslips for analysis (12 months, corrected ones dropped below)
+            # and leave balance for a holistic view
+            plan["payslips"] = supabase.table("payslips").select(
+                PAYSLIP_WITH_PERIOD
+            ).eq("employee_id", employee_id).order(
+                "created_at", desc=True
+            ).limit(24)
+            plan["leave_balance"] = supabase.table("employee_leave_balances").select(
+                "*"
+            ).eq("employee_id", employee_id).single()
+            plan["ytd"] = ytd_query(supabase, employee_id)
+        
+        results = await _run_plan(plan)
+        
+        # Deduplicated snapshots: merge the shared pay structure back in
+        try:
+            await snapshot_store.arehydrate(
+                supabase,
+                [*(results.get("payslips") or []), results.get("requested_payslip")]
+            )
+        except Exception as e:
+            logger.warning(f"Could not rehydrate payslip snapshots: {e}")
+        
+        profile = results["profile"]
+        if profile:
+            enriched["meta"] = enriched.get("meta", {})
+            enriched["meta"]["employee_name"] = profile.get("full_name")
+            enriched["meta"]["employee_email"] = profile.get("email")
+            enriched["meta"]["employee_phone"] = profile.get("phone")
+        
+        if intent == "payslip_explain":
+            payslips = _current_payslips(results["payslips"] or [])
+            if payslips or results.get("requested_payslip"):
+                enriched["data"] = enriched.get("data", {})
+                
+                # The specific payslip if payslip_id provided, else the latest one
+                current = None
+                if payslip_id:
+                    current = next((p for p in payslips if p.get("id") == payslip_id), None) or results.get("requested_payslip")
+                elif payslips:
+                    current = max(payslips, key=_period_start)
+                
+                if current:
+                    enriched["data"]["current_payslip"] = current
+                    # Previous payslips: up to 11 pay periods before the current one, for comparisons
+                    previous = _previous_payslips(payslips, current)
+                    if not previous and _period_start(current):
+                        # The payslip is the first of the fiscal window or predates it; look further back
+                        previous = await _fetch_previous_payslips(supabase, employee_id, current)
+                    enriched["data"]["previous_payslips"] = previous
+                
+                # YTD totals are maintained by the database; sum the fetched payslips
+                # only if the aggregate is unavailable
+                enriched["data"]["ytd_totals"] = format_ytd(results["ytd"][0]) if results["ytd"] else _sum_ytd(payslips)
+        
+        elif intent == "leave_advice":
+            enriched["data"] = enriched.get("data", {})
+            if results["balances"]:
+                enriched["data"]["leave_balances"] = results["balances"]
+            
+            requests = results["requests"]
+            if requests:
+                # Group by status
+                enriched["data"]["approved_leaves"] = [r for r in requests if r.get("status") == "approved"]
+                enriched["data"]["pending_leaves"] = [r for r in requests if r.get("status") == "pending"]
+                enriched["data"]["revoked_leaves"] = [r for r in requests if r.get("status") in ("revoked", "cancelled", "canceled")]
+                enriched["data"]["rejected_leaves"] = [r for r in requests if r.get("status") == "rejected"]
+                enriched["data"]["all_leaves"] = requests
+                
+                # Leaves taken: count of all approved + revoked/cancelled
+                enriched["data"]["leaves_taken"] = len([r for r in requests if r.get("status") in ("approved", "revoked", "cancelled", "canceled")])
+            
+            if results["salary"]:
+                enriched["data"]["salary_structure"] = results["salary"][0]
+            
+            if results["periods"]:
+                today = datetime.utcnow().date().isoformat()
+                enriched["data"]["upcoming_holidays"] = [p for p in results["periods"] if not p.get("end_date") or p["end_date"] >= today]
+        
+        elif intent in ["payslip_tax_suggestions", "dashboard_insights"]:
+            recent = _current_payslips(results["payslips"] or [])
+            if recent:
+                enriched["data"] = enriched.get("data", {})
+                enriched["data"]["recent_payslips"] = recent
+            
+            if results["leave_balance"]:
+                enriched["data"] = enriched.get("data", {})
+                enriched["data"]["leave_balance"] = results["leave_balance"]
+            
+            if results["ytd"]:
+                enriched["data"] = enriched.get("data", {})
+                enriched["data"]["ytd_totals"] = format_ytd(results["ytd"][0])
+        
+        enriched["page_view"] = intent
+        
+    except Exception as e:
+        logger.warning(f"Could not enrich context for intent {intent}: {e}")
+        # Return original context if enrichment fails
+    
+    return enriched
+
+
+def build_conversation_context(
+    chat_history: Optional[list],
+    current_context: Optional[Dict],
+    summary: Optional[str] = None
+) -> Dict:
+    """
+    Merge chat history with current context
+    
+    Args:
+        chat_history: Recent messages in conversation
+        current_context: Current context data
+        summary: Rolling summary of older messages (server-side conversation store)
+    
+    Returns:
+        Combined context
+    """
+    combined = current_context.copy() if current_context else {}
+    
+    if summary:
+        combined["conversation_summary"] = summary
+    if chat_history and len(chat_history) > 0:
+        # Add recent conversation for continuity
+        combined["conversation_history"] = chat_history[-settings.CONVERSATION_RECENT_MESSAGES:]
+    
+    return combined
+
@@ -0,0 +1,230 @@
+"""
+Single-pass preparation of AI contexts
+
+- prepare_context(): projects only the fields an intent's prompt uses, then
+  drops sensitive keys and masks contact details in just those values
+- sanitize_and_mask(): the same fused walk without projection
+- mask_values(): masking only (e.g. conversation messages)
+
+Sensitive key rules come from ai_templates.SENSITIVE_FIELDS (one precompiled
+matcher, decision cached per key). Emails and phone-length digit runs are masked
+in place with precompiled patterns, so dates, timestamps and amounts survive.
+"""
+
+from app.services.ai_templates import is_sensitive_key
+from typing import Any, Callable, Dict, Optional
+import re
+
+_EMAIL_PATTERN = re.compile(r"[\w.+-]+@[\w-]+(?:\.[\w-]+)+")
+# 10-16 digits, optionally grouped with spaces/dashes; not an ISO date, nor part of a decimal, time or word
+_PHONE_PATTERN = re.compile(r"(?<![\w.:+-])(?!\d{4}-\d{2}-\d{2})\+?\d[\d -]{8,16}\d(?![\w.:-])")
+
+# Longest list kept for data without an intent-specific projection
+DEFAULT_LIST_LIMIT = 20
+
+
+def mask_email(email: str) -> str:
+    """Keep the first character of the local part and domain root, mask the rest"""
+    try:
+        local, domain = email.split("@", 1)
+        local_masked = (local[0] + "***") if len(local) > 1 else "***"
+        domain_parts = domain.split(".")
+        domain_root = domain_parts[0]
+        domain_masked = (domain_root[0] + "***") if len(domain_root) > 1 else "***"
+        rest = "." + ".".join(domain_parts[1:]) if len(domain_parts) > 1 else ""
+        return f"{local_masked}@{domain_masked}{rest}"
+    except Exception:
+        return "***@***.***"
+
+
+def mask_phone(phone: str) -> str:
+    """Keep the country code (India) or the first 2 digits, mask the rest"""
+    digits = re.sub(r"\D", "", phone)
+    if len(digits) <= 4:
+        return "****"
+    if digits.startswith("91") and len(digits) >= 12:
+        # India: +91XXXXXXXXXX -> +91-98****
+        return f"+91-{digits[2:4]}****"
+    return digits[:2] + "****"
+
+
+def mask_text(text: str) -> str:
+    """Mask emails and phone numbers inside a string"""
+    if "@" in text:
+        text = _EMAIL_PATTERN.sub(lambda m: mask_email(m.group()), text)
+    return _PHONE_PATTERN.sub(lambda m: mask_phone(m.group()), text)
+
+
+def mask_values(data: Any) -> Any:
+    """Recursively mask strings without dropping any keys"""
+    if isinstance(data, str):
+        return mask_text(data)
+    if isinstance(data, dict):
+        return {key: mask_values(value) for key, value in data.items()}
+    if isinstance(data, list):
+        return [mask_values(item) for item in data]
+    return data
+
+
+def _clean(data: Any, list_limit: Optional[int] = None) -> Any:
+    """Drop sensitive keys and mask strings in one walk"""
+    if isinstance(data, str):
+        return mask_text(data)
+    if isinstance(data, dict):
+        return {
+            key: _clean(value, list_limit)
+            for key, value in data.items()
+            if not is_sensitive_key(key)
+        }
+    if isinstance(data, list):
+        items = data[:list_limit] if list_limit else data
+        return [_clean(item, list_limit) for item in items]
+    return data
+
+
+def sanitize_and_mask(context: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Remove sensitive fields and mask contact details (no projection)"""
+    if not context:
+        return {}
+    return _clean(context)
+
+
+# ---- per-intent projections ----------------------------------------------
+
+Projector = Callable[[Any], Any]
+
+
+def _pick(*fields: str) -> Projector:
+    """Project a row to the given fields"""
+    def project(row: Any) -> Any:
+        if not isinstance(row, dict):
+            return None
+        return {f: _clean(row[f]) for f in fields if f in row and not is_sensitive_key(f)}
+    return project
+
+
+def _rows(projector: Projector, limit: int) -> Projector:
+    """Project the first `limit` rows of a list"""
+    def project(rows: Any) -> Any:
+        if not isinstance(rows, list):
+            return None
+        return [projector(row) for row in rows[:limit]]
+    return project
+
+
+def _scalar(value: Any) -> Any:
+    return value if isinstance(value, (int, float, bool)) else _clean(value)
+
+
+def _payslip_summary(payslip: Any) -> Any:
+    """Essential fields of one payslip (pay breakdown and period)"""
+    if not isinstance(payslip, dict):
+        return None
+    snapshot = payslip.get("pay_data_snapshot") or {}
+    allowances = snapshot.get("allowances") or {}
+    payrolls = payslip.get("payrolls") or {}
+    return {
+        "base_pay": snapshot.get("base_pay"),
+        "allowances": {k: allowances.get(k) for k in ("hra", "meal", "transport", "other") if k in allowances},
+        "gross_pay": payslip.get("gross_pay"),
+        "total_deductions": payslip.get("total_deductions") or snapshot.get("total_deductions"),
+        "tax_deduction": snapshot.get("tax_deduction"),
+        "leave_deduction": snapshot.get("leave_deduction"),
+        "net_pay": payslip.get("net_pay"),
+        "pay_period_start": payrolls.get("pay_period_start"),
+        "pay_period_end": payrolls.get("pay_period_end"),
+    }
+
+
+def _payslip_trend(payslip: Any) -> Any:
+    """Per-month summary used for comparisons"""
+    if not isinstance(payslip, dict):
+        return None
+    snapshot = payslip.get("pay_data_snapshot") or {}
+    return {
+        "created_at": payslip.get("created_at"),
+        "gross_pay": payslip.get("gross_pay"),
+        "net_pay": payslip.get("net_pay"),
+        "leave_deduction": snapshot.get("leave_deduction"),
+        "total_deductions": payslip.get("total_deductions") or snapshot.get("total_deductions"),
+    }
+
+
+_LEAVE_REQUEST = _pick("start_date", "end_date", "days_requested", "leave_type", "status")
+_LEAVE_BALANCE = _pick("total_granted", "leaves_taken", "remaining_leaves")
+_YTD = _pick("fiscal_year", "gross_ytd", "deductions_ytd", "tax_ytd", "net_ytd", "months_included")
+
+INTENT_PROJECTIONS: Dict[str, Dict[str, Projector]] = {
+    "payslip_explain": {
+        "current_payslip": _payslip_summary,
+        "previous_payslips": _rows(_payslip_trend, 12),
+        "ytd_totals": _YTD,
+    },
+    "leave_advice": {
+        "leave_balances": _rows(_LEAVE_BALANCE, 12),
+        "approved_leaves": _rows(_LEAVE_REQUEST, 20),
+        "pending_leaves": _rows(_LEAVE_REQUEST, 20),
+        "revoked_leaves": _rows(_LEAVE_REQUEST, 20),
+        "rejected_leaves": _rows(_LEAVE_REQUEST, 20),
+        "leaves_taken": _scalar,
+        "salary_structure": _pick("name", "base_pay", "allowances", "deductions_fixed", "deductions_percent"),
+        "upcoming_holidays": _rows(_pick("name", "start_date", "end_date", "is_active"), 20),
+    },
+    "payslip_tax_suggestions": {
+        "recent_payslips": _rows(_payslip_summary, 12),
+        "leave_balance": _LEAVE_BALANCE,
+        "ytd_totals": _YTD,
+    },
+    "dashboard_insights": {
+        "recent_payslips": _rows(_payslip_summary, 12),
+        "leave_balance": _LEAVE_BALANCE,
+        "ytd_totals": _YTD,
+    },
+}
+
+
+def _project(data: Dict[str, Any], projections: Dict[str, Projector]) -> Dict[str, Any]:
+    compact = {}
+    for key, projector in projections.items():
+        value = data.get(key)
+        if value is None:
+            continue
+        projected = projector(value)
+        if projected is not None:
+            compact[key] = projected
+    return compact
+
+
+def prepare_context(context: Optional[Dict[str, Any]], intent: Optional[str]) -> Dict[str, Any]:
+    """
+    Project, sanitize and mask a context for the model in one pass
+
+    Args:
+        context: Raw (enriched) context, either {"data": {...}, ...} or the data itself
+        intent: Intent key selecting the projection; other intents keep all
+            non-sensitive data with lists capped at DEFAULT_LIST_LIMIT
+
+    Returns:
+        {"data": {...}} plus "page_view" when present
+    """
+    if not context or not isinstance(context, dict):
+        return {}
+
+    data = context.get("data") if "data" in context else context
+    if not isinstance(data, dict):
+        data = {}
+
+    projections = INTENT_PROJECTIONS.get(intent or "")
+    if projections is not None:
+        compact = _project(data, projections)
+    else:
+        compact = _clean(
+            {k: v for k, v in data.items() if k not in ("meta", "page_view")},
+            DEFAULT_LIST_LIMIT
+        )
+
+    prepared: Dict[str, Any] = {"data": compact}
+    page_view = context.get("page_view")
+    if isinstance(page_view, str):
+        prepared["page_view"] = page_view
+    return prepared
@@ -0,0 +1,185 @@
+"""
+Server-side conversation memory for the AI assistant
+
+- Conversations are keyed by (user, session_id) and bounded by LRU + idle TTL
+- The last CONVERSATION_RECENT_MESSAGES messages are kept verbatim
+- Older messages are folded into a rolling summary in the background, so the
+  history part of a prompt stays roughly constant however long the conversation runs
+- Clients send only the new message plus the session_id returned by the API;
+  a legacy chat_history is used to seed a conversation the server doesn't know
+"""
+
+from app.core.config import settings
+from app.services.gemini_service import gemini_service
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Set, Tuple
+import asyncio
+import logging
+import threading
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+# Response header carrying the session id for streamed answers
+SESSION_ID_HEADER = "X-Session-Id"
+
+
+class Conversation:
+    """Rolling summary plus the most recent messages of one chat session"""
+
+    def __init__(self, session_id: str):
+        self.session_id = session_id
+        self.summary = ""
+        self.messages: List[Dict[str, str]] = []
+        self.updated_at = time.time()
+        self._folding = False
+
+    def history(self) -> List[Dict[str, str]]:
+        return list(self.messages)
+
+
+def _extractive_summary(previous: str, messages: List[Dict[str, str]], max_chars: int) -> str:
+    """Fallback summary: previous summary plus a clipped line per folded message"""
+    lines = [previous] if previous else []
+    for msg in messages:
+        content = " ".join((msg.get("content") or "").split())
+        if len(content) > 200:
+            content = content[:200].rstrip() + "…"
+        lines.append(f"{msg.get('role', 'user').upper()}: {content}")
+    summary = "\n".join(lines)
+    # Keep the newest part when the summary outgrows its budget
+    return summary[-max_chars:] if len(summary) > max_chars else summary
+
+
+class ConversationStore:
+    """LRU + TTL store of conversations with background summarization"""
+
+    def __init__(
+        self,
+        max_sessions: int,
+        ttl_seconds: float,
+        recent_messages: int,
+        summary_max_chars: int
+    ):
+        self.max_sessions = max_sessions
+        self.ttl_seconds = ttl_seconds
+        self.recent_messages = recent_messages
+        self.summary_max_chars = summary_max_chars
+        self._sessions: "OrderedDict[Tuple[str, str], Conversation]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._folds = 0
+        # Strong references to background folds (the loop only keeps weak ones)
+        self._tasks: Set["asyncio.Task"] = set()
+
+    def open(
+        self,
+        user_key: str,
+        session_id: Optional[str],
+        seed_history: Optional[List[Dict[str, str]]] = None
+    ) -> Conversation:
+        """
+        Return the conversation for a session, creating it if unknown or expired
+
+        Args:
+            user_key: Authenticated user id (or "anonymous")
+            session_id: Session id sent by the client, if any
+            seed_history: chat_history from clients that still send it
+
+        Returns:
+            The conversation (its session_id is returned to the client)
+        """
+        now = time.time()
+        with self._lock:
+            key = (user_key, session_id) if session_id else None
+            conversation = self._sessions.get(key) if key else None
+            if conversation is not None and conversation.updated_at + self.ttl_seconds < now:
+                del self._sessions[key]
+                conversation = None
+
+            if conversation is None:
+                conversation = Conversation(session_id or uuid.uuid4().hex)
+                key = (user_key, conversation.session_id)
+                self._sessions[key] = conversation
+                while len(self._sessions) > self.max_sessions:
+                    self._sessions.popitem(last=False)
+                if seed_history:
+                    conversation.messages = [
+                        {"role": m.get("role", "user"), "content": m.get("content", "")}
+                        for m in seed_history
+                    ]
+
+            conversation.updated_at = now
+            self._sessions.move_to_end(key)
+
+        self._maybe_fold(conversation)
+        return conversation
+
+    def record_turn(self, conversation: Conversation, query: str, answer: str) -> None:
+        """Append a user/assistant exchange and fold old messages if needed"""
+        conversation.messages.append({"role": "user", "content": query})
+        conversation.messages.append({"role": "assistant", "content": answer})
+        conversation.updated_at = time.time()
+        self._maybe_fold(conversation)
+
+    def _maybe_fold(self, conversation: Conversation) -> None:
+        # Fold in batches of two exchanges so summarization runs every other turn
+        if conversation._folding or len(conversation.messages) <= self.recent_messages + 4:
+            return
+        conversation._folding = True
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # No running loop (e.g. called from a worker thread): fold without the model
+            conversation._folding = False
+            self._fold_extractive(conversation)
+            return
+        task = loop.create_task(self._fold(conversation))
+        self._tasks.add(task)
+        task.add_done_callback(self._fold_done)
+
+    def _fold_done(self, task: "asyncio.Task") -> None:
+        self._tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"Background conversation fold failed: {task.exception()!r}")
+
+    async def _fold(self, conversation: Conversation) -> None:
+        """Replace everything but the recent messages with an updated summary"""
+        try:
+            folded = conversation.messages[:-self.recent_messages]
+            summary = await gemini_service.summarize_conversation(
+                conversation.summary, folded, self.summary_max_chars
+            )
+            if not summary:
+                summary = _extractive_summary(conversation.summary, folded, self.summary_max_chars)
+            conversation.summary = summary[:self.summary_max_chars]
+            # Messages appended while summarizing stay after the folded prefix
+            del conversation.messages[:len(folded)]
+            self._folds += 1
+        except Exception as e:
+            logger.warning(f"Could not summarize conversation {conversation.session_id}: {e}")
+            self._fold_extractive(conversation)
+        finally:
+            conversation._folding = False
+
+    def _fold_extractive(self, conversation: Conversation) -> None:
+        folded = conversation.messages[:-self.recent_messages]
+        if not folded:
+            return
+        conversation.summary = _extractive_summary(conversation.summary, folded, self.summary_max_chars)
+        del conversation.messages[:len(folded)]
+        self._folds += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            size = len(self._sessions)
+        return {"sessions": size, "folds": self._folds}
+
+
+# Singleton instance
+conversation_store = ConversationStore(
+    max_sessions=settings.CONVERSATION_MAX_SESSIONS,
+    ttl_seconds=settings.CONVERSATION_TTL_SECONDS,
+    recent_messages=settings.CONVERSATION_RECENT_MESSAGES,
+    summary_max_chars=settings.CONVERSATION_SUMMARY_MAX_CHARS,
+)
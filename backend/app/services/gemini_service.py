@@ -3,23 +3,37 @@ Gemini AI service for intelligent features (updated to gemini-2.5-flash)
 
 Provides:
 - deterministic generation configuration (low temperature)
-- helper: sanitize_and_mask_context()
+- helper: sanitize_and_mask_context(); prompts use the fused per-intent pass in context_transform
 - generate_response(...) -> full text
 - generate_response_chunks(...) -> async generator that yields text chunks (for SSE)
+- chat prompts are assembled by app.services.prompt_engine (precompiled templates,
+  per-intent token budgets and output limits); token accounting is logged per request
+
+All model calls go through the SDK's async surface (client.aio) so a request
+waiting on Gemini never blocks the event loop. Each call type is bounded by its
+own concurrency limit (GEMINI_MAX_CONCURRENT_*), and every call runs through the
+resilience layer (deadlines, jittered retries, circuit breaker, optional hedging).
 """
 
 from google import genai
 from app.core.config import settings
+from app.core.timing import phase
 from app.services.ai_templates import (
-    AITemplates,
-    sanitize_context,
-    format_context_for_prompt
+    TEMPLATE_VERSION,
+    sanitize_context
 )
+from app.services.response_cache import response_cache, make_response_cache_key
+from app.services.single_flight import SingleFlight, StreamSingleFlight
+from app.services.resilience import CircuitBreaker, call_with_resilience, resilient_stream
+from app.services.payroll_columns import empty_columns, headcount, take
+from app.services.payroll_digest import build_payroll_digest, shard_columns
+from app.services.context_transform import prepare_context, sanitize_and_mask, mask_values
+from app.services.prompt_engine import Prompt, prompt_engine
 import logging
-from typing import Dict, Any, Optional, AsyncGenerator
+from typing import Dict, Any, List, Optional, AsyncGenerator, Tuple
 import json
-import re
 import asyncio
+import numpy as np
 
 logger = logging.getLogger(__name__)
 
@@ -28,8 +42,9 @@ class GeminiService:
     """Service for interacting with Gemini AI (gemini-2.5-flash)"""
 
     def __init__(self):
-        # Use the new google-genai SDK client
-        self.client = genai.Client(api_key=settings.GEMINI_API_KEY)
+        # Use the new google-genai SDK client (GEMINI_BASE_URL allows pointing at a local fake endpoint)
+        http_options = genai.types.HttpOptions(base_url=settings.GEMINI_BASE_URL) if settings.GEMINI_BASE_URL else None
+        self.client = genai.Client(api_key=settings.GEMINI_API_KEY, http_options=http_options)
         self.model_name = "gemini-2.5-flash"
 
         # Deterministic / structured output settings (low temperature for accuracy)
@@ -41,142 +56,101 @@ class GeminiService:
 
         # chunk size used by server-side chunked streaming (characters)
         self._stream_chunk_size = 200
-        
-        # Store active chat sessions per request (in-memory, consider Redis for production)
-        self._chat_sessions = {}
 
-    def _mask_email(self, email: str) -> str:
-        """Simple email masking: keep first character of local and domain root, mask rest"""
-        try:
-            local, domain = email.split("@", 1)
-            local_masked = (local[0] + "***") if len(local) > 1 else "***"
-            domain_parts = domain.split(".")
-            domain_root = domain_parts[0]
-            domain_masked = (domain_root[0] + "***") if len(domain_root) > 1 else "***"
-            rest = "." + ".".join(domain_parts[1:]) if len(domain_parts) > 1 else ""
-            return f"{local_masked}@{domain_masked}{rest}"
-        except Exception:
-            return "***@***.***"
-
-    def _mask_phone(self, phone: str) -> str:
-        """Mask phone numbers leaving country code and first 2 digits, mask rest"""
-        digits = re.sub(r"\D", "", phone)
-        if len(digits) <= 4:
-            return "****"
-        if digits.startswith("91") and len(digits) >= 10:
-            # India: +91XXXXXXXXXX -> +91-98****
-            return f"+91-{digits[2:4]}****"
-        return digits[:2] + "****"
-
-    def _mask_string_values(self, data: Any) -> Any:
-        """Recursively mask email/phone occurrences in strings in the sanitized context"""
-        if isinstance(data, dict):
-            masked = {}
-            for k, v in data.items():
-                masked[k] = self._mask_string_values(v)
-            return masked
-        if isinstance(data, list):
-            return [self._mask_string_values(i) for i in data]
-        if isinstance(data, str):
-            # mask emails
-            if "@" in data and re.match(r".+@.+\..+", data):
-                return self._mask_email(data)
-            # mask phone-like strings
-            if re.search(r"\d{6,}", data):
-                return self._mask_phone(data)
-            return data
-        return data
+        # Per-call-type concurrency limits for in-flight model calls
+        self._generate_limit = asyncio.Semaphore(settings.GEMINI_MAX_CONCURRENT_REQUESTS)
+        self._stream_limit = asyncio.Semaphore(settings.GEMINI_MAX_CONCURRENT_STREAMS)
+        self._analysis_limit = asyncio.Semaphore(settings.GEMINI_MAX_CONCURRENT_ANALYSES)
 
-    def sanitize_and_mask_context(self, context: Optional[Dict[str, Any]]) -> Dict[str, Any]:
-        """
-        Sanitize using existing template helper, then mask contact-like strings.
-        Removes all sensitive fields (PAN, Aadhaar, bank numbers etc.) and masks emails/phones.
-        """
-        if not context:
-            return {}
-        sanitized = sanitize_context(context)
-        masked = self._mask_string_values(sanitized)
-        return masked
+        # Fail fast to fallback messages while the model endpoint is degraded
+        self._breaker = CircuitBreaker(
+            "Gemini",
+            failure_threshold=settings.GEMINI_CIRCUIT_FAILURE_THRESHOLD,
+            recovery_seconds=settings.GEMINI_CIRCUIT_RECOVERY_SECONDS
+        )
+
+        # Identical concurrent requests (same cache key) share one upstream call
+        self._inflight_responses = SingleFlight()
+        self._inflight_streams = StreamSingleFlight()
 
-    def _compact_payslip_context(self, context: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    def sanitize_and_mask_context(self, context: Optional[Dict[str, Any]]) -> Dict[str, Any]:
         """
-        Reduce and normalize the sanitized context to only the essential fields
-        that the model needs. This avoids sending large or duplicated structures
-        which can increase token usage and trigger MAX_TOKENS or safety filters.
+        Remove all sensitive fields (PAN, Aadhaar, bank numbers etc.) and mask emails/phones.
+        Model calls use prepare_context(), which also projects the context per intent.
         """
-        if not context or not isinstance(context, dict):
-            return {}
-
-        data = context.get("data") if "data" in context else context
-        compact = {}
-
-        # Current payslip summary
-        cur = data.get("current_payslip") if isinstance(data, dict) else None
-        if cur:
-            cps = {}
-            pay_snapshot = cur.get("pay_data_snapshot", {}) or {}
-            cps["base_pay"] = pay_snapshot.get("base_pay")
-            # keep allowances as-is but limit keys
-            allowances = pay_snapshot.get("allowances") or {}
-            cps["allowances"] = {k: allowances.get(k) for k in ("hra", "meal", "transport", "other") if k in allowances}
-            cps["gross_pay"] = cur.get("gross_pay")
-            cps["total_deductions"] = cur.get("total_deductions") or pay_snapshot.get("total_deductions")
-            cps["net_pay"] = cur.get("net_pay")
-            # payroll period
-            payrolls = cur.get("payrolls") or {}
-            cps["pay_period_start"] = payrolls.get("pay_period_start")
-            cps["pay_period_end"] = payrolls.get("pay_period_end")
-            compact["current_payslip"] = cps
-
-        # Previous payslips: include up to last 12, but only compact summary fields
-        prev = data.get("previous_payslips") if isinstance(data, dict) else None
-        if prev and isinstance(prev, list):
-            summarized = []
-            for p in prev[:12]:
-                psnap = p.get("pay_data_snapshot", {}) or {}
-                summarized.append({
-                    "created_at": p.get("created_at"),
-                    "gross_pay": p.get("gross_pay"),
-                    "net_pay": p.get("net_pay"),
-                    "leave_deduction": psnap.get("leave_deduction"),
-                    "total_deductions": p.get("total_deductions") or psnap.get("total_deductions")
-                })
-            compact["previous_payslips"] = summarized
-
-        # YTD totals
-        ytd = data.get("ytd_totals") if isinstance(data, dict) else None
-        if ytd:
-            compact["ytd_totals"] = {
-                "gross_ytd": ytd.get("gross_ytd"),
-                "net_ytd": ytd.get("net_ytd"),
-                "months_included": ytd.get("months_included")
-            }
+        return sanitize_and_mask(context)
 
-        # Pass along minimal intent/page info if present
-        if isinstance(data, dict) and data.get("intent"):
-            compact["intent"] = data.get("intent")
-        if isinstance(data, dict) and data.get("page_view"):
-            compact["page_view"] = data.get("page_view")
-
-        return {"data": compact}
+    def _response_cache_key(
+        self,
+        query: str,
+        prompt: Prompt,
+        intent: Optional[str],
+        system_instruction: Optional[str]
+    ) -> str:
+        """Cache / single-flight key for an assembled prompt (its trimmed context and history)"""
+        return make_response_cache_key(
+            intent,
+            prompt.template.version,
+            prompt.context,
+            query,
+            model=self.model_name,
+            generation_config={**self.generation_config, "max_output_tokens": prompt.max_output_tokens},
+            system_instruction=system_instruction or "",
+            history={k: v for k, v in prompt.history.items() if v},
+            encoding=prompt.encoding,
+        )
+
+    def _split_conversation(self, context: Dict[str, Any]) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        """Separate conversation summary/history from the data context"""
+        history = {
+            "summary": context.get("conversation_summary") or "",
+            "messages": (context.get("conversation_history") or [])[-settings.CONVERSATION_RECENT_MESSAGES:],
+        }
+        rest = {k: v for k, v in context.items() if k not in ("conversation_summary", "conversation_history")}
+        return rest, history
 
-    def _build_prompt_with_template(self, query: str, context: Dict[str, Any], intent: Optional[str]) -> str:
+    def _prepare(
+        self,
+        context: Optional[Dict[str, Any]],
+        intent: Optional[str]
+    ) -> Tuple[Dict[str, Any], Dict[str, Any]]:
         """
-        Build prompt using templates and formatted context
+        Project, sanitize and mask the data context in one pass (context_transform)
+        and split off the masked conversation summary/history for the prompt prefix
         """
-        if intent:
-            template = AITemplates.get_template(intent)
-        else:
-            template = AITemplates._general_template()  # fallback
-        context_str = format_context_for_prompt(context or {}, intent)
-        prompt = f"""{template}
-
-Context Information:
-{context_str}
+        rest, history = self._split_conversation(context or {})
+        return prepare_context(rest, intent), mask_values(history)
+
+    def stats(self) -> Dict[str, Any]:
+        """Circuit breaker, cache and in-flight metrics for diagnostics"""
+        return {
+            "circuit": self._breaker.stats(),
+            "response_cache": response_cache.stats(),
+            "in_flight_requests": self._inflight_responses.in_flight(),
+            "in_flight_streams": self._inflight_streams.in_flight(),
+            "templates": prompt_engine.versions(),
+        }
 
-User Question: {query}
+    async def replay_text(self, text: str) -> AsyncGenerator[str, None]:
+        """Replay a stored answer as stream chunks of _stream_chunk_size characters"""
+        for start in range(0, len(text), self._stream_chunk_size):
+            yield text[start:start + self._stream_chunk_size]
+            # Let the event loop flush each chunk like a live stream would
+            await asyncio.sleep(0)
 
-Please provide a helpful, accurate response based on the context provided. Return a human-friendly response, and where possible return a short structured JSON snippet summarizing key fields (summary, earnings, deductions, comparisons, advice)."""
+    def _assemble(
+        self,
+        query: str,
+        context: Optional[Dict[str, Any]],
+        intent: Optional[str],
+        system_instruction: Optional[str] = None
+    ) -> Prompt:
+        """Prepare the context and assemble a budgeted prompt (token accounting is logged)"""
+        with phase("sanitize"):
+            safe_context, history = self._prepare(context, intent)
+            prompt = prompt_engine.assemble(query, safe_context, intent, history, system_instruction)
+        logger.info(prompt.log_line())
+        logger.debug(f"Prompt for intent={intent}:\n{prompt.text}")
         return prompt
     
     async def generate_response(
@@ -198,121 +172,24 @@ Please provide a helpful, accurate response based on the context provided. Retur
         Returns:
             AI-generated response
         """
-        print("TEST PRINT: generate_response called")
         try:
-            # Sanitize and mask context
-            safe_context = self.sanitize_and_mask_context(context) if context else {}
-            # Compact context to essential fields to avoid duplicated/oversized prompts
-            safe_context = self._compact_payslip_context(safe_context) if safe_context else {}
-
-            # Build prompt with template if intent provided
-            prompt = self._build_prompt_with_template(query, safe_context, intent)
-
-            # Prepend custom system instruction if provided
-            if system_instruction:
-                prompt = f"SYSTEM INSTRUCTION: {system_instruction}\n\n{prompt}"
-
-            # VERBOSE: Print the full prompt being sent to AI
-            logger.info(f"GEMINI VERBOSE PROMPT SENT TO AI:\n{'='*40}\n{prompt}\n{'='*40}")
-            print(f"VERBOSE: Sending prompt to AI:\n{prompt}\n")  # Commented out for production
-
-            # Print query, context, and prompt for debugging/traceability
-            print(f"QUERY: {query}")
-            print(f"CONTEXT: {json.dumps(safe_context, indent=2)}")
-            print(f"PROMPT: {prompt}\n{'='*40}")
-
-            # Generate response using new SDK
-            config = genai.types.GenerateContentConfig(
-                temperature=self.generation_config["temperature"],
-                top_p=self.generation_config["top_p"],
-                max_output_tokens=self.generation_config["max_output_tokens"]
-            )
-
-            response = self.client.models.generate_content(
-                model=self.model_name,
-                contents=prompt,
-                config=config
-            )
-
-            # Inspect prompt feedback for an explicit block (prompt blocked)
-            prompt_feedback = getattr(response, 'prompt_feedback', None)
-            if prompt_feedback is not None and getattr(prompt_feedback, 'block_reason', None):
-                block = getattr(prompt_feedback, 'block_reason')
-                logger.warning(f"Prompt was blocked by content filters. Block reason: {block}")
-                return (
-                    "I apologize; the query or context appears to be blocked by the content filters. "
-                    "Please remove any sensitive identifiers or rephrase your question and try again."
-                )
-
-            # If the API returned no candidates, advise rephrasing
-            candidates = getattr(response, 'candidates', None)
-            if not candidates:
-                logger.warning("No candidates returned by model. Check promptFeedback for block reasons.")
-                return (
-                    "I apologize, but I couldn't generate a response. Please try rephrasing your question "
-                    "or provide less sensitive context."
-                )
-
-            # Try to extract usable text from candidates in a robust way
-            for idx, cand in enumerate(candidates):
-                finish_reason = getattr(cand, 'finish_reason', getattr(cand, 'finishReason', None))
-                logger.debug(f"Candidate {idx} finish_reason={finish_reason}")
-                # Attempt a few extraction strategies (SDK shapes vary)
-                try:
-                    # 1) Quick accessor on overall response (if available and valid)
-                    try:
-                        txt = response.text
-                        if txt:
-                            return txt
-                    except Exception:
-                        pass
-
-                    # 2) Try candidate.content which may hold parts/segments
-                    content = getattr(cand, 'content', None)
-                    if content:
-                        parts = None
-                        # content may be a list-like or an object with 'parts' or 'segments'
-                        if isinstance(content, (list, tuple)):
-                            parts = content
-                        else:
-                            parts = getattr(content, 'parts', None) or getattr(content, 'segments', None) or [content]
-
-                        texts = []
-                        for p in parts:
-                            t = getattr(p, 'text', None)
-                            if t is None and isinstance(p, dict):
-                                t = p.get('text')
-                            if t:
-                                texts.append(t)
-
-                        joined = "".join(texts).strip()
-                        if joined:
-                            return joined
-
-                    # 3) Some SDKs present candidate.message or candidate.output_text
-                    for attr in ('message', 'output_text', 'text'):
-                        val = getattr(cand, attr, None)
-                        if val and isinstance(val, str) and val.strip():
-                            return val.strip()
-                except Exception as e:
-                    logger.warning(f"Failed to extract text from candidate {idx}: {e}")
-
-            # If we got here, no candidate contained usable text. Log finish reasons and give helpful guidance.
-            fr_reasons = [getattr(c, 'finish_reason', getattr(c, 'finishReason', None)) for c in candidates]
-            logger.warning(f"No usable text found in any candidate. finish_reasons={fr_reasons}")
-
-            # If any finish reason indicates safety or sensitive PII, return a specific message
-            unsafe_indicators = {"SAFETY", "SPII", "BLOCKLIST", "PROHIBITED_CONTENT"}
-            if any(str(fr).upper() in unsafe_indicators for fr in fr_reasons if fr):
-                return (
-                    "I apologize, the model blocked generation due to safety or privacy concerns. "
-                    "Please remove any sensitive data (IDs, account numbers) and try again."
-                )
-
-            return (
-                "I apologize, but I couldn't generate a proper response. Please try rephrasing your question "
-                "or provide different context."
-            )
+            prompt = self._assemble(query, context, intent, system_instruction)
+
+            # Serve repeated questions over the same context from the cache
+            cache_key = self._response_cache_key(query, prompt, intent, system_instruction)
+            cached = await response_cache.aget(cache_key) if settings.RESPONSE_CACHE_ENABLED else None
+            if cached is not None:
+                logger.info(f"Response cache hit for intent={intent}")
+                return cached
+
+            async def _generate_and_cache() -> str:
+                text, cacheable = await self._generate_text(prompt.text, prompt.max_output_tokens, intent)
+                if cacheable and settings.RESPONSE_CACHE_ENABLED:
+                    await response_cache.aset(cache_key, text)
+                return text
+
+            # Concurrent identical requests wait on the same model call
+            return await self._inflight_responses.do(cache_key, _generate_and_cache)
             
         except AttributeError as e:
             logger.error(f"Response format error: {e}")
@@ -321,6 +198,209 @@ Please provide a helpful, accurate response based on the context provided. Retur
             logger.error(f"Error generating AI response: {e}")
             return "I apologize, but I encountered an error processing your request. Please try again or contact support if the issue persists."
     
+    async def precompute_response(
+        self,
+        query: str,
+        context: Optional[Dict[str, Any]],
+        intent: str
+    ) -> Optional[str]:
+        """
+        Generate an answer ahead of time (background precomputation)
+        
+        Returns:
+            The answer, or None when the model produced only a fallback message
+        """
+        prompt = self._assemble(query, context, intent)
+        text, cacheable = await self._generate_text(prompt.text, prompt.max_output_tokens, intent)
+        return text if cacheable else None
+    
+    async def summarize_conversation(
+        self,
+        previous_summary: str,
+        messages: List[Dict[str, str]],
+        max_chars: int
+    ) -> Optional[str]:
+        """
+        Fold older conversation messages into the rolling summary
+        
+        Returns:
+            Updated summary, or None if the model couldn't produce one
+        """
+        transcript = "\n".join(
+            f"{msg.get('role', 'user').upper()}: {msg.get('content', '')}"
+            for msg in mask_values(messages)
+        )
+        prompt = f"""Update the running summary of a conversation between an employee and a payroll assistant.
+Keep figures, months, decisions and open questions; drop greetings and repetition.
+Answer with the updated summary only, in at most {max_chars} characters.
+
+Current summary:
+{previous_summary or "(none)"}
+
+New messages:
+{transcript}"""
+        config = genai.types.GenerateContentConfig(
+            temperature=0.1,
+            max_output_tokens=512
+        )
+        try:
+            async with self._generate_limit:
+                response = await self._call_model(prompt, config, timeout=settings.GEMINI_TIMEOUT_SECONDS)
+            text = getattr(response, "text", None)
+            return text.strip() if text else None
+        except Exception as e:
+            logger.warning(f"Conversation summarization failed: {e}")
+            return None
+    
+    def _log_usage(self, response: Any, intent: Optional[str]) -> None:
+        """Log the token counts reported by the model (to compare with the local estimate)"""
+        usage = getattr(response, "usage_metadata", None)
+        if usage is None:
+            return
+        logger.info(
+            f"Gemini usage intent={intent or 'general'} "
+            f"prompt={getattr(usage, 'prompt_token_count', None)} "
+            f"output={getattr(usage, 'candidates_token_count', None)} "
+            f"thinking={getattr(usage, 'thoughts_token_count', None)} "
+            f"total={getattr(usage, 'total_token_count', None)}"
+        )
+    
+    async def _call_model(
+        self,
+        prompt: str,
+        config: "genai.types.GenerateContentConfig",
+        timeout: float,
+        hedge_after: Optional[float] = None
+    ) -> Any:
+        """generate_content with a deadline, jittered retries and the circuit breaker"""
+        return await call_with_resilience(
+            lambda: self.client.aio.models.generate_content(
+                model=self.model_name,
+                contents=prompt,
+                config=config
+            ),
+            breaker=self._breaker,
+            timeout=timeout,
+            retries=settings.GEMINI_MAX_RETRIES,
+            base_delay=settings.GEMINI_RETRY_BASE_DELAY_SECONDS,
+            max_delay=settings.GEMINI_RETRY_MAX_DELAY_SECONDS,
+            hedge_after=hedge_after
+        )
+    
+    async def _generate_text(
+        self,
+        prompt: str,
+        max_output_tokens: Optional[int] = None,
+        intent: Optional[str] = None
+    ) -> Tuple[str, bool]:
+        """
+        Call the model and extract the response text
+        
+        Args:
+            prompt: Assembled prompt text
+            max_output_tokens: Output limit (defaults to generation_config's)
+            intent: For the usage log line
+        
+        Returns:
+            (text, cacheable) - cacheable is False when text is a fallback message
+        """
+        # Generate response using new SDK
+        config = genai.types.GenerateContentConfig(
+            temperature=self.generation_config["temperature"],
+            top_p=self.generation_config["top_p"],
+            max_output_tokens=max_output_tokens or self.generation_config["max_output_tokens"]
+        )
+
+        async with self._generate_limit:
+            with phase("llm"):
+                response = await self._call_model(
+                    prompt,
+                    config,
+                    timeout=settings.GEMINI_TIMEOUT_SECONDS,
+                    hedge_after=settings.GEMINI_HEDGE_AFTER_SECONDS or None
+                )
+        self._log_usage(response, intent)
+
+        # Inspect prompt feedback for an explicit block (prompt blocked)
+        prompt_feedback = getattr(response, 'prompt_feedback', None)
+        if prompt_feedback is not None and getattr(prompt_feedback, 'block_reason', None):
+            block = getattr(prompt_feedback, 'block_reason')
+            logger.warning(f"Prompt was blocked by content filters. Block reason: {block}")
+            return (
+                "I apologize; the query or context appears to be blocked by the content filters. "
+                "Please remove any sensitive identifiers or rephrase your question and try again."
+            ), False
+
+        # If the API returned no candidates, advise rephrasing
+        candidates = getattr(response, 'candidates', None)
+        if not candidates:
+            logger.warning("No candidates returned by model. Check promptFeedback for block reasons.")
+            return (
+                "I apologize, but I couldn't generate a response. Please try rephrasing your question "
+                "or provide less sensitive context."
+            ), False
+
+        # Try to extract usable text from candidates in a robust way
+        for idx, cand in enumerate(candidates):
+            finish_reason = getattr(cand, 'finish_reason', getattr(cand, 'finishReason', None))
+            logger.debug(f"Candidate {idx} finish_reason={finish_reason}")
+            # Attempt a few extraction strategies (SDK shapes vary)
+            try:
+                # 1) Quick accessor on overall response (if available and valid)
+                try:
+                    txt = response.text
+                    if txt:
+                        return txt, True
+                except Exception:
+                    pass
+
+                # 2) Try candidate.content which may hold parts/segments
+                content = getattr(cand, 'content', None)
+                if content:
+                    parts = None
+                    # content may be a list-like or an object with 'parts' or 'segments'
+                    if isinstance(content, (list, tuple)):
+                        parts = content
+                    else:
+                        parts = getattr(content, 'parts', None) or getattr(content, 'segments', None) or [content]
+
+                    texts = []
+                    for p in parts:
+                        t = getattr(p, 'text', None)
+                        if t is None and isinstance(p, dict):
+                            t = p.get('text')
+                        if t:
+                            texts.append(t)
+
+                    joined = "".join(texts).strip()
+                    if joined:
+                        return joined, True
+
+                # 3) Some SDKs present candidate.message or candidate.output_text
+                for attr in ('message', 'output_text', 'text'):
+                    val = getattr(cand, attr, None)
+                    if val and isinstance(val, str) and val.strip():
+                        return val.strip(), True
+            except Exception as e:
+                logger.warning(f"Failed to extract text from candidate {idx}: {e}")
+
+        # If we got here, no candidate contained usable text. Log finish reasons and give helpful guidance.
+        fr_reasons = [getattr(c, 'finish_reason', getattr(c, 'finishReason', None)) for c in candidates]
+        logger.warning(f"No usable text found in any candidate. finish_reasons={fr_reasons}")
+
+        # If any finish reason indicates safety or sensitive PII, return a specific message
+        unsafe_indicators = {"SAFETY", "SPII", "BLOCKLIST", "PROHIBITED_CONTENT"}
+        if any(str(fr).upper() in unsafe_indicators for fr in fr_reasons if fr):
+            return (
+                "I apologize, the model blocked generation due to safety or privacy concerns. "
+                "Please remove any sensitive data (IDs, account numbers) and try again."
+            ), False
+
+        return (
+            "I apologize, but I couldn't generate a proper response. Please try rephrasing your question "
+            "or provide different context."
+        ), False
+    
     async def generate_response_chunks(
         self, 
         query: str, 
@@ -330,154 +410,126 @@ Please provide a helpful, accurate response based on the context provided. Retur
     ) -> AsyncGenerator[str, None]:
         """
         Real-time streaming generator using the new google-genai SDK with chat sessions.
-        Yields text chunks as they are generated by the model.
+        Yields text chunks as they are generated by the model. Errors propagate to
+        the caller (sse_event_stream turns them into an "error" event).
         """
-        try:
-            # Sanitize and mask context
-            safe_context = self.sanitize_and_mask_context(context) if context else {}
-            
-            # Extract conversation history from context if present
-            chat_history = safe_context.get("conversation_history", [])
-            
-            # Remove conversation history from context to avoid duplication
-            if "conversation_history" in safe_context:
-                safe_context = {k: v for k, v in safe_context.items() if k != "conversation_history"}
-            
-            # Compact context to essential fields
-            safe_context = self._compact_payslip_context(safe_context) if safe_context else {}
-            
-            # Build prompt with template
-            prompt = self._build_prompt_with_template(query, safe_context, intent)
-            
-            # Prepend custom system instruction if provided
-            if system_instruction:
-                prompt = f"SYSTEM INSTRUCTION: {system_instruction}\n\n{prompt}"
-            
-            # Create or get chat session
-            # For stateless API, we create a new chat session each time with history
-            config = genai.types.GenerateContentConfig(
-                temperature=self.generation_config["temperature"],
-                top_p=self.generation_config["top_p"],
-                max_output_tokens=self.generation_config["max_output_tokens"]
+        prompt = self._assemble(query, context, intent, system_instruction)
+        
+        # Each request opens a fresh chat; memory comes from the server-side conversation store
+        config = genai.types.GenerateContentConfig(
+            temperature=self.generation_config["temperature"],
+            top_p=self.generation_config["top_p"],
+            max_output_tokens=prompt.max_output_tokens
+        )
+        
+        # Cached answers are replayed as chunks without calling the model
+        cache_key = self._response_cache_key(query, prompt, intent, system_instruction)
+        cached = await response_cache.aget(cache_key) if settings.RESPONSE_CACHE_ENABLED else None
+        if cached is not None:
+            logger.info(f"Response cache hit for streaming intent={intent}")
+            async for piece in self.replay_text(cached):
+                yield piece
+            return
+        
+        # Identical concurrent streams fan out from one shared upstream generation
+        async for piece in self._inflight_streams.subscribe(
+            cache_key,
+            lambda: self._stream_model(prompt.text, config, cache_key, intent)
+        ):
+            yield piece
+    
+    async def _stream_model(
+        self,
+        prompt: str,
+        config: "genai.types.GenerateContentConfig",
+        cache_key: str,
+        intent: Optional[str] = None
+    ) -> AsyncGenerator[str, None]:
+        """Stream one model generation and cache it once complete"""
+        # Track if we got any content
+        has_content = False
+        streamed_parts = []
+        last_chunk = None
+        
+        async def _open_stream():
+            # Create a fresh async chat session for each attempt
+            chat = self.client.aio.chats.create(
+                model=self.model_name,
+                config=config
+            )
+            # Send message with streaming
+            return await chat.send_message_stream(prompt)
+        
+        # The stream slot is held until the model finishes (or every subscriber has left)
+        async with self._stream_limit:
+            response_stream = resilient_stream(
+                _open_stream,
+                breaker=self._breaker,
+                first_chunk_timeout=settings.GEMINI_STREAM_FIRST_CHUNK_TIMEOUT_SECONDS,
+                idle_timeout=settings.GEMINI_STREAM_IDLE_TIMEOUT_SECONDS,
+                retries=settings.GEMINI_MAX_RETRIES,
+                base_delay=settings.GEMINI_RETRY_BASE_DELAY_SECONDS,
+                max_delay=settings.GEMINI_RETRY_MAX_DELAY_SECONDS
             )
-            
-            # If we have chat history, create a chat with history
-            if chat_history and len(chat_history) > 0:
-                # Create a chat session
-                chat = self.client.chats.create(
-                    model=self.model_name,
-                    config=config
-                )
-                
-                # Manually build history by sending previous messages
-                # Note: In production, you'd want to replay history more efficiently
-                # For now, we'll just use the context in the prompt
-                
-                # Add history context to prompt
-                history_context = "\n\nPrevious conversation:\n"
-                for msg in chat_history[-8:]:  # Keep last 8 messages
-                    role = msg.get("role", "user")
-                    content = msg.get("content", "")
-                    history_context += f"{role.upper()}: {content}\n"
-                
-                full_prompt = history_context + "\n" + prompt
-                
-                # Send message with streaming
-                response_stream = chat.send_message_stream(full_prompt)
-            else:
-                # No history, create a fresh chat session
-                chat = self.client.chats.create(
-                    model=self.model_name,
-                    config=config
-                )
-                
-                # Send message with streaming
-                response_stream = chat.send_message_stream(prompt)
-            
-            # Track if we got any content
-            has_content = False
             
             # Yield chunks as they arrive from the model
-            for chunk in response_stream:
+            async for chunk in response_stream:
+                last_chunk = chunk
                 if hasattr(chunk, 'text') and chunk.text:
                     has_content = True
+                    streamed_parts.append(chunk.text)
                     yield chunk.text
                 elif hasattr(chunk, 'parts'):
                     for part in chunk.parts:
                         if hasattr(part, 'text') and part.text:
                             has_content = True
+                            streamed_parts.append(part.text)
                             yield part.text
-            
-            # If no content was streamed, yield error message
-            if not has_content:
-                logger.warning("No content received from streaming response")
-                yield "I apologize, but I couldn't generate a response. Please try rephrasing your question."
-                
-        except Exception as e:
-            logger.error(f"Error in streaming response: {e}")
-            yield f"I apologize, but I encountered an error: {str(e)}"
-    
-    def _build_prompt(self, query: str, context: Optional[Dict[str, Any]] = None) -> str:
-        """
-        Build a prompt with context and safety guidelines
         
-        Args:
-            query: User's question
-            context: Optional context data
+        # Usage metadata arrives with the final chunk
+        self._log_usage(last_chunk, intent)
         
-        Returns:
-            Formatted prompt
-        """
-        base_prompt = f"""You are an AI assistant for a payroll and HR management system in India. 
-Your role is to help employees and admins understand their payroll data, compensation, leave policies, and related queries.
-
-Be concise, accurate, and professional. Always prioritize data privacy and security.
-If you're unsure about specific calculations or data, acknowledge the limitation.
-Use Indian Rupee (₹) formatting for currency values.
-
-User Query: {query}
-"""
-        
-        if context:
-            # Add context information
-            context_str = format_context_for_prompt(context)
-            base_prompt += f"\n\nContext:\n{context_str}"
-        
-        return base_prompt
+        # If no content was streamed, yield error message
+        if not has_content:
+            logger.warning("No content received from streaming response")
+            yield "I apologize, but I couldn't generate a response. Please try rephrasing your question."
+        elif settings.RESPONSE_CACHE_ENABLED:
+            # Only complete streams are cached
+            await response_cache.aset(cache_key, "".join(streamed_parts))
     
     async def analyze_payroll_data(
         self,
-        current_payroll: Dict[str, Any],
-        previous_payroll: Optional[Dict[str, Any]] = None
+        payroll: Dict[str, Any],
+        current: Dict[str, np.ndarray],
+        previous: Optional[Dict[str, np.ndarray]] = None,
+        designations: Optional[Dict[str, str]] = None
     ) -> Dict[str, Any]:
         """
         Analyze payroll data for anomalies
         
+        Only a bounded-size statistical digest of the runs is sent to the model,
+        so prompt size does not grow with headcount. Runs above
+        ANALYSIS_MAP_REDUCE_THRESHOLD payslips are also analyzed shard by shard
+        and the findings merged in a final reduce call.
+        
         Args:
-            current_payroll: Current payroll run data
-            previous_payroll: Previous payroll run data for comparison
+            payroll: Payroll run header (pay period)
+            current: Payslip columns of the run (payroll_columns)
+            previous: Payslip columns of the previous run, for comparison
+            designations: employee_id -> designation, for per-designation aggregates
         
         Returns:
             Analysis results with detected anomalies
         """
         try:
-            # Sanitize payroll data
-            safe_current = self.sanitize_and_mask_context({"data": current_payroll})
-            safe_previous = self.sanitize_and_mask_context({"data": previous_payroll}) if previous_payroll else None
+            safe_digest = await self._payroll_digest(current, previous, designations)
             
-            prompt = self._build_analysis_prompt(safe_current["data"], safe_previous["data"] if safe_previous else None)
+            prompt = self._build_analysis_prompt(payroll, safe_digest)
+            if headcount(current) > settings.ANALYSIS_MAP_REDUCE_THRESHOLD:
+                findings = await self._analyze_shards(current, previous, designations)
+                prompt += "\n\nFindings per shard of employees:\n" + "\n\n".join(findings)
             
-            config = genai.types.GenerateContentConfig(
-                temperature=self.generation_config["temperature"],
-                top_p=self.generation_config["top_p"],
-                max_output_tokens=self.generation_config["max_output_tokens"]
-            )
-            
-            response = self.client.models.generate_content(
-                model=self.model_name,
-                contents=prompt,
-                config=config
-            )
+            response = await self._analysis_call(prompt, self.generation_config["max_output_tokens"])
             
             # Return structured response
             return {
@@ -489,31 +541,120 @@ User Query: {query}
             logger.error(f"Error analyzing payroll: {e}")
             return {
                 "summary": "Analysis unavailable due to an error. Please review payroll data manually.",
-                "anomalies": []
+                "anomalies": [],
+                "failed": True
             }
     
+    async def _payroll_digest(
+        self,
+        current: Dict[str, np.ndarray],
+        previous: Optional[Dict[str, np.ndarray]],
+        designations: Optional[Dict[str, str]]
+    ) -> Dict[str, Any]:
+        """Digest built off the event loop, with field-level sanitization only
+        (digest strings are designations and short refs, which phone masking would mangle)"""
+        with phase("digest"):
+            digest = await asyncio.to_thread(build_payroll_digest, current, previous, designations)
+        with phase("sanitize"):
+            return sanitize_context(digest)
+    
+    async def _analysis_call(self, prompt: str, max_output_tokens: int) -> Any:
+        config = genai.types.GenerateContentConfig(
+            temperature=self.generation_config["temperature"],
+            top_p=self.generation_config["top_p"],
+            max_output_tokens=max_output_tokens
+        )
+        async with self._analysis_limit:
+            with phase("llm"):
+                return await self._call_model(
+                    prompt,
+                    config,
+                    timeout=settings.GEMINI_ANALYSIS_TIMEOUT_SECONDS
+                )
+    
+    async def _analyze_shards(
+        self,
+        current: Dict[str, np.ndarray],
+        previous: Optional[Dict[str, np.ndarray]],
+        designations: Optional[Dict[str, str]]
+    ) -> List[str]:
+        """
+        Map step of map-reduce analysis: analyze each shard concurrently
+        
+        Shard answers are cached by a hash of the shard's digest, so re-analyzing a
+        lightly changed draft only calls the model for shards whose content changed.
+        Concurrency is bounded by the analysis semaphore.
+        
+        Returns:
+            One findings block per shard
+        """
+        previous = previous if previous is not None else empty_columns()
+        shards = shard_columns(current, designations, settings.ANALYSIS_SHARD_SIZE)
+        
+        async def _analyze_shard(label: str, rows: np.ndarray) -> str:
+            shard = take(current, rows)
+            previous_rows = take(previous, np.isin(previous["employee_id"], shard["employee_id"]))
+            shard_digest = await self._payroll_digest(shard, previous_rows, designations)
+            cache_key = make_response_cache_key(
+                "payroll_analysis_shard",
+                TEMPLATE_VERSION,
+                shard_digest,
+                label,
+                model=self.model_name,
+                max_output_tokens=settings.ANALYSIS_SHARD_MAX_OUTPUT_TOKENS,
+            )
+            cached = await response_cache.aget(cache_key) if settings.RESPONSE_CACHE_ENABLED else None
+            if cached is not None:
+                return cached
+            
+            prompt = f"""Analyze this shard of a payroll run ({label}) and list anomalies or unusual patterns
+(compensation changes, unusual deductions, potential calculation errors) as short bullet points.
+Reference employees by their ref. Answer "No concerns." if nothing stands out.
+
+Shard Digest (JSON):
+{json.dumps(shard_digest, separators=(",", ":"))}"""
+            response = await self._analysis_call(prompt, settings.ANALYSIS_SHARD_MAX_OUTPUT_TOKENS)
+            text = (response.text or "").strip()
+            if text and settings.RESPONSE_CACHE_ENABLED:
+                await response_cache.aset(cache_key, text)
+            return text
+        
+        results = await asyncio.gather(
+            *(_analyze_shard(label, rows) for label, rows in shards),
+            return_exceptions=True
+        )
+        findings = []
+        for (label, rows), result in zip(shards, results):
+            if isinstance(result, BaseException):
+                logger.warning(f"Shard analysis failed for {label}: {result}")
+                result = "Shard analysis unavailable."
+            findings.append(f"[{label}, {rows.size} employees]\n{result}")
+        logger.info(f"Analyzed {len(shards)} payroll shards")
+        return findings
+    
     def _build_analysis_prompt(
         self,
-        current_payroll: Dict[str, Any],
-        previous_payroll: Optional[Dict[str, Any]]
+        payroll: Dict[str, Any],
+        digest: Dict[str, Any]
     ) -> str:
-        """Build prompt for payroll analysis"""
-        prompt = """Analyze the following payroll data and identify any anomalies or unusual patterns.
+        """Build prompt for payroll analysis from the run's digest"""
+        prompt = f"""Analyze the following payroll digest and identify any anomalies or unusual patterns.
 Focus on:
 - Significant changes in compensation
 - Unusual deductions
 - Potential calculation errors
 
+The digest compares this run with the previous one: totals (with % change), distributions,
+per-designation aggregates, the largest net pay movers and net pay outliers within a designation
+(robust z-score). Employees are referenced by the first 8 characters of their employee ID.
+
 Provide a brief summary and list any concerns.
 
-Current Payroll Data:
+Pay period: {payroll.get("pay_period_start")} to {payroll.get("pay_period_end")}
+
+Payroll Digest (JSON):
 """
-        prompt += str(current_payroll)
-        
-        if previous_payroll:
-            prompt += "\n\nPrevious Payroll Data:\n"
-            prompt += str(previous_payroll)
-        
+        prompt += json.dumps(digest, separators=(",", ":"))
         return prompt
 
 
@@ -0,0 +1,63 @@
+"""
+Local routing of chat queries to the rule-based explainer or the model
+
+No model call is involved: a query goes to the explainer when its intent is
+payslip_explain and it asks for something the explainer covers exactly
+(explanation, breakdown, month-over-month comparison, YTD totals). Questions
+asking why, for advice or for what-if reasoning go to Gemini.
+"""
+
+from app.services.response_cache import normalize_query
+from typing import Optional
+import re
+
+ROUTE_EXPLAINER = "explainer"
+ROUTE_MODEL = "model"
+
+# Intents the explainer can answer
+EXPLAINER_INTENTS = {"payslip_explain"}
+
+# Queries sent by the UI or typed most often
+DEFAULT_QUERIES = {
+    normalize_query(q) for q in (
+        "Please explain the provided payslip",
+        "Explain my payslip",
+        "Explain this payslip",
+        "Explain my latest payslip",
+        "Break down my payslip",
+        "Show my payslip breakdown",
+    )
+}
+
+_COVERED = re.compile(
+    r"\b(explain|explanation|breakdown|break down|itemi[sz]e|summar(y|ize|ise)|"
+    r"earnings|deductions|components|compare|comparison|last month|previous month|"
+    r"ytd|year to date|so far this year)\b"
+)
+
+# Free-form asks that need reasoning beyond the payslip's numbers
+_FREE_FORM = re.compile(
+    r"\b(why|should|could|would|how (can|do|much can)|save|saving|reduce|lower|"
+    r"advice|advise|suggest|recommend|plan|what if|if i|regime|invest|80c|80d|hra exemption)\b"
+)
+
+
+def route_query(intent: Optional[str], query: Optional[str]) -> str:
+    """
+    Pick the handler for a chat query
+
+    Args:
+        intent: Request intent
+        query: Raw user query
+
+    Returns:
+        ROUTE_EXPLAINER or ROUTE_MODEL
+    """
+    if intent not in EXPLAINER_INTENTS:
+        return ROUTE_MODEL
+    normalized = normalize_query(query)
+    if not normalized or normalized in DEFAULT_QUERIES:
+        return ROUTE_EXPLAINER
+    if _FREE_FORM.search(normalized) or not _COVERED.search(normalized):
+        return ROUTE_MODEL
+    return ROUTE_EXPLAINER
@@ -0,0 +1,126 @@
+"""
+Payslip amounts from salary structures
+
+Shared by the payroll run (all active employees of a company) and by
+single-employee recalculation: both go through calculate_payslips(), which
+computes every amount for all given employees as arrays.
+
+- gross = base pay + numeric allowances
+- unpaid leave = base pay / DAYS_PER_MONTH per approved unpaid leave day
+- deductions = unpaid leave + fixed + percent of gross + TDS, where TDS comes
+  from the progressive slab table of the structure's tax_regime for the pay
+  period's fiscal year, on gross pay annualized over PERIODS_PER_YEAR
+"""
+
+from app.core.db import execute
+from app.services.tax_engine import TaxTables
+from typing import Any, Dict, List, Optional
+import numpy as np
+
+DAYS_PER_MONTH = 30
+PERIODS_PER_YEAR = 12
+
+
+def _numeric_total(values: Optional[Dict[str, Any]]) -> float:
+    return sum(float(v) for v in (values or {}).values() if isinstance(v, (int, float)))
+
+
+def salary_structure(employee: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """The employee's embedded salary structure (EMPLOYEE_PAY_INPUTS), or None"""
+    structures = employee.get("salary_structures")
+    if isinstance(structures, dict):
+        return structures
+    return structures[0] if structures else None
+
+
+def fetch_unpaid_leave_days(
+    supabase,
+    period_start: str,
+    period_end: str,
+    employee_id: Optional[str] = None
+) -> Dict[str, float]:
+    """
+    Approved unpaid leave days within a pay period
+
+    Args:
+        supabase: Supabase client
+        period_start: Pay period start (ISO date)
+        period_end: Pay period end (ISO date)
+        employee_id: Only this employee (default: everyone)
+
+    Returns:
+        Map employee ID -> days
+    """
+    query = supabase.table("leave_requests").select(
+        "employee_id, days_requested"
+    ).eq("status", "approved").eq("leave_type", "unpaid").gte(
+        "start_date", period_start
+    ).lte("end_date", period_end)
+    if employee_id:
+        query = query.eq("employee_id", employee_id)
+    leave_days: Dict[str, float] = {}
+    for leave in (execute(query).data or []):
+        emp_id = leave["employee_id"]
+        leave_days[emp_id] = leave_days.get(emp_id, 0) + (leave.get("days_requested", 0) or 0)
+    return leave_days
+
+
+def calculate_payslips(
+    employees: List[Dict[str, Any]],
+    leave_days: Dict[str, float],
+    tax_tables: TaxTables
+) -> List[Dict[str, Any]]:
+    """
+    Compute payslip amounts for employees that have a salary structure
+
+    Args:
+        employees: EMPLOYEE_PAY_INPUTS rows (with a salary structure)
+        leave_days: Employee ID -> unpaid leave days in the period
+        tax_tables: Slab tables covering the structures' tax regimes
+
+    Returns:
+        One {"pay_data_snapshot", "gross_pay", "total_deductions", "net_pay"}
+        per employee, in order
+    """
+    if not employees:
+        return []
+    structures = [salary_structure(e) or {} for e in employees]
+    base_pay = np.array([float(s.get("base_pay", 0) or 0) for s in structures])
+    allowances = np.array([_numeric_total(s.get("allowances")) for s in structures])
+    fixed = np.array([_numeric_total(s.get("deductions_fixed")) for s in structures])
+    percent = np.array([_numeric_total(s.get("deductions_percent")) for s in structures])
+    unpaid_days = np.array([float(leave_days.get(e["id"], 0) or 0) for e in employees])
+
+    gross = base_pay + allowances
+    leave = base_pay / DAYS_PER_MONTH * unpaid_days
+    percent_deductions = gross * percent / 100
+    rows = tax_tables.index(s.get("tax_regime") for s in structures)
+    tax = tax_tables.monthly_tds(rows, gross, PERIODS_PER_YEAR)
+    total_deductions = leave + fixed + percent_deductions + tax
+    net = gross - total_deductions
+
+    results = []
+    for i, structure in enumerate(structures):
+        table = tax_tables.tables[rows[i]]
+        results.append({
+            "pay_data_snapshot": {
+                "base_pay": float(base_pay[i]),
+                "allowances": structure.get("allowances", {}),
+                "deductions_fixed": structure.get("deductions_fixed", {}),
+                "deductions_percent": structure.get("deductions_percent", {}),
+                "unpaid_leave_days": leave_days.get(employees[i]["id"], 0),
+                "leave_deduction": float(leave[i]),
+                "tax_deduction": float(tax[i]),
+                "tax_bracket_id": table.id,
+                "tax_regime": table.regime,
+            },
+            "gross_pay": float(gross[i]),
+            "total_deductions": float(total_deductions[i]),
+            "net_pay": float(net[i]),
+        })
+    return results
+
+
+def calculate_payslip(employee: Dict[str, Any], unpaid_leave_days: float, tax_tables: TaxTables) -> Dict[str, Any]:
+    """calculate_payslips() for one employee"""
+    return calculate_payslips([employee], {employee["id"]: unpaid_leave_days}, tax_tables)[0]
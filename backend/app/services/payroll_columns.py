@@ -0,0 +1,101 @@
+"""
+Columnar (numpy) representation of a payroll run's payslips
+
+A run is a dict of equal-length arrays: "employee_id", "payslip_id" and
+"correction_of" (str, "" for none) plus one float64 array per metric and one
+per allowance line ("allowance.<name>", NaN where an employee doesn't have the
+line). The analysis loader builds runs page by page from PAYSLIP_ANALYSIS rows;
+the digest and the anomaly engine only read arrays.
+"""
+
+from typing import Any, Dict, List, Sequence
+import numpy as np
+
+METRICS = ("gross_pay", "total_deductions", "net_pay", "tax_deduction", "leave_deduction")
+ALLOWANCE_PREFIX = "allowance."
+
+# Metrics stored on the payslip row; the rest come from the calculation snapshot
+_ROW_METRICS = ("gross_pay", "total_deductions", "net_pay")
+
+_ID_COLUMNS = ("employee_id", "payslip_id", "correction_of")
+
+
+def _num(value: Any) -> float:
+    try:
+        return float(value or 0)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def empty_columns() -> Dict[str, np.ndarray]:
+    columns = {metric: np.empty(0, dtype=np.float64) for metric in METRICS}
+    for key in _ID_COLUMNS:
+        columns[key] = np.empty(0, dtype=str)
+    return columns
+
+
+def payslip_columns(payslips: List[Dict[str, Any]]) -> Dict[str, np.ndarray]:
+    """
+    Convert payslip rows into columnar arrays (one pass over the rows)
+
+    Accepts PAYSLIP_ANALYSIS rows (snapshot amounts as top-level fields) or
+    full rows with pay_data_snapshot. Superseded payslips are kept; see
+    drop_superseded().
+    """
+    count = len(payslips)
+    if not count:
+        return empty_columns()
+    columns: Dict[str, np.ndarray] = {metric: np.empty(count, dtype=np.float64) for metric in METRICS}
+    ids = {key: np.empty(count, dtype=object) for key in _ID_COLUMNS}
+    for i, payslip in enumerate(payslips):
+        snapshot = payslip.get("pay_data_snapshot") or payslip
+        ids["employee_id"][i] = str(payslip.get("employee_id") or "")
+        ids["payslip_id"][i] = str(payslip.get("id") or "")
+        ids["correction_of"][i] = str(payslip.get("correction_of") or "")
+        for metric in _ROW_METRICS:
+            columns[metric][i] = _num(payslip.get(metric))
+        columns["tax_deduction"][i] = _num(snapshot.get("tax_deduction"))
+        columns["leave_deduction"][i] = _num(snapshot.get("leave_deduction"))
+        for name, value in (snapshot.get("allowances") or {}).items():
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                key = f"{ALLOWANCE_PREFIX}{name}"
+                if key not in columns:
+                    columns[key] = np.full(count, np.nan)
+                columns[key][i] = value
+    for key, values in ids.items():
+        columns[key] = values.astype(str)
+    return columns
+
+
+def drop_superseded(columns: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+    """Remove payslips replaced by a correction in the same run (one row per employee)"""
+    corrected = columns["correction_of"][columns["correction_of"] != ""]
+    if corrected.size == 0:
+        return columns
+    return take(columns, ~np.isin(columns["payslip_id"], corrected))
+
+
+def concat_columns(parts: Sequence[Dict[str, np.ndarray]]) -> Dict[str, np.ndarray]:
+    """Concatenate runs (e.g. pages); allowance lines missing from a part are NaN"""
+    parts = [p for p in parts if p["employee_id"].size]
+    if not parts:
+        return empty_columns()
+    if len(parts) == 1:
+        return parts[0]
+    keys = list(dict.fromkeys(key for part in parts for key in part))
+    columns = {}
+    for key in keys:
+        columns[key] = np.concatenate([
+            part[key] if key in part else np.full(part["employee_id"].size, np.nan)
+            for part in parts
+        ])
+    return columns
+
+
+def take(columns: Dict[str, np.ndarray], index: np.ndarray) -> Dict[str, np.ndarray]:
+    """Rows of a run by index (or boolean mask)"""
+    return {key: values[index] for key, values in columns.items()}
+
+
+def headcount(columns: Dict[str, np.ndarray]) -> int:
+    return int(columns["employee_id"].size)
@@ -0,0 +1,235 @@
+"""
+Bounded-size statistical digest of a payroll run for AI analysis
+
+- Totals, distributions and per-designation aggregates for the current run,
+  compared with the previous run
+- Top movers (largest net pay changes) and robust outliers (median/MAD within
+  each designation)
+- All statistics are computed with numpy over columnar arrays, and the digest
+  size is capped (MAX_DESIGNATIONS, MAX_MOVERS, MAX_OUTLIERS) so the analysis
+  prompt stays the same size from 10 to 100,000 employees
+- shard_columns() splits very large runs into bounded shards for map-reduce analysis
+
+Employees appear only as short references (first 8 characters of the employee
+ID, as printed on payslips).
+"""
+
+from app.services.payroll_columns import METRICS, empty_columns
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+
+# Caps that bound the digest size
+MAX_DESIGNATIONS = 20
+MAX_MOVERS = 10
+MAX_OUTLIERS = 10
+
+# Robust z-score above which a net pay is an outlier within its designation
+OUTLIER_Z_THRESHOLD = 3.5
+
+PERCENTILES = (0, 10, 25, 50, 75, 90, 100)
+PERCENTILE_LABELS = ("min", "p10", "p25", "median", "p75", "p90", "max")
+
+UNASSIGNED = "Unassigned"
+
+
+def shard_columns(
+    columns: Dict[str, np.ndarray],
+    designations: Optional[Dict[str, str]],
+    shard_size: int
+) -> List[Tuple[str, np.ndarray]]:
+    """
+    Split a run into shards of at most shard_size rows
+
+    Large designations get their own shard(s); small ones are packed together.
+    Rows are ordered by employee ID so an unchanged shard keeps the same content
+    (and cache key) between re-analyses.
+
+    Returns:
+        [(shard label, row indices into columns), ...]
+    """
+    designations = designations or {}
+    employee_ids = columns["employee_id"]
+    labels = np.array([designations.get(e) or UNASSIGNED for e in employee_ids.tolist()], dtype=str)
+    names, groups = np.unique(labels, return_inverse=True)
+    order = np.lexsort((employee_ids, groups))
+    bounds = np.cumsum(np.bincount(groups, minlength=names.size))[:-1]
+    by_label = dict(zip(names.tolist(), np.split(order, bounds)))
+
+    shards: List[Tuple[str, np.ndarray]] = []
+    packed: List[np.ndarray] = []
+    packed_size = 0
+    packed_labels: List[str] = []
+    for label, rows in by_label.items():
+        if rows.size >= shard_size // 2:
+            parts = range(0, rows.size, shard_size)
+            for n, start in enumerate(parts, 1):
+                name = f"{label} ({n}/{len(parts)})" if len(parts) > 1 else label
+                shards.append((name, rows[start:start + shard_size]))
+            continue
+        if packed_size + rows.size > shard_size:
+            shards.append((", ".join(packed_labels), np.concatenate(packed)))
+            packed, packed_size, packed_labels = [], 0, []
+        packed.append(rows)
+        packed_size += rows.size
+        packed_labels.append(label)
+    if packed:
+        shards.append((", ".join(packed_labels), np.concatenate(packed)))
+    return shards
+
+
+def _round(value: float) -> Optional[float]:
+    value = float(value)
+    return round(value, 2) if np.isfinite(value) else None
+
+
+def _change_pct(current: float, previous: float) -> Optional[float]:
+    return _round((current - previous) / previous * 100) if previous else None
+
+
+def _distribution(values: np.ndarray) -> Dict[str, Optional[float]]:
+    if values.size == 0:
+        return {}
+    stats = dict(zip(PERCENTILE_LABELS, (_round(v) for v in np.percentile(values, PERCENTILES))))
+    stats["mean"] = _round(values.mean())
+    stats["std"] = _round(values.std())
+    return stats
+
+
+def group_medians(values: np.ndarray, groups: np.ndarray, group_count: int) -> np.ndarray:
+    """Median of values per group code (groups are 0..group_count-1)"""
+    by_value = np.argsort(values, kind="stable")
+    order = by_value[np.argsort(groups[by_value], kind="stable")]
+    sorted_values = values[order]
+    counts = np.bincount(groups, minlength=group_count)
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    medians = np.full(group_count, np.nan)
+    present = counts > 0
+    low = starts[present] + (counts[present] - 1) // 2
+    high = starts[present] + counts[present] // 2
+    medians[present] = (sorted_values[low] + sorted_values[high]) / 2
+    return medians
+
+
+def build_payroll_digest(
+    current: Dict[str, np.ndarray],
+    previous: Optional[Dict[str, np.ndarray]] = None,
+    designations: Optional[Dict[str, str]] = None
+) -> Dict[str, Any]:
+    """
+    Summarize a payroll run (and its predecessor) into a bounded-size digest
+
+    Args:
+        current: Columns (payroll_columns) of the run being analyzed
+        previous: Columns of the previous run, if any
+        designations: employee_id -> designation
+
+    Returns:
+        JSON-serializable digest
+    """
+    designations = designations or {}
+    cur = current
+    prev = previous if previous is not None else empty_columns()
+    headcount = cur["net_pay"].size
+
+    # Employees present in both runs
+    _, cur_idx, prev_idx = np.intersect1d(cur["employee_id"], prev["employee_id"], return_indices=True)
+
+    digest: Dict[str, Any] = {
+        "headcount": headcount,
+        "previous_headcount": prev["net_pay"].size,
+        "joiners": headcount - cur_idx.size,
+        "leavers": prev["net_pay"].size - prev_idx.size,
+        "totals": {},
+        "distribution": {},
+    }
+    for metric in METRICS:
+        current_total = float(cur[metric].sum())
+        previous_total = float(prev[metric].sum())
+        digest["totals"][metric] = {
+            "current": _round(current_total),
+            "previous": _round(previous_total),
+            "change_pct": _change_pct(current_total, previous_total),
+        }
+    for metric in ("gross_pay", "total_deductions", "net_pay"):
+        digest["distribution"][metric] = _distribution(cur[metric])
+
+    if headcount == 0:
+        digest.update({"by_designation": [], "top_movers": [], "outliers": []})
+        return digest
+
+    # Designation codes for the current run
+    labels = np.array([designations.get(e) or UNASSIGNED for e in cur["employee_id"]], dtype=str)
+    names, groups = np.unique(labels, return_inverse=True)
+    group_count = names.size
+    counts = np.bincount(groups, minlength=group_count)
+    gross_totals = np.bincount(groups, weights=cur["gross_pay"], minlength=group_count)
+    net_totals = np.bincount(groups, weights=cur["net_pay"], minlength=group_count)
+    net_medians = group_medians(cur["net_pay"], groups, group_count)
+
+    # Net pay change per matched employee, averaged per designation
+    change = np.full(headcount, np.nan)
+    prev_net = prev["net_pay"][prev_idx]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        change[cur_idx] = np.where(prev_net > 0, (cur["net_pay"][cur_idx] - prev_net) / prev_net * 100, np.nan)
+    has_change = ~np.isnan(change)
+    change_sums = np.bincount(groups[has_change], weights=change[has_change], minlength=group_count)
+    change_counts = np.bincount(groups[has_change], minlength=group_count)
+
+    # Largest designations first; the rest are rolled up into "Other"
+    order = np.argsort(-counts, kind="stable")
+    by_designation = []
+    for g in order[:MAX_DESIGNATIONS]:
+        by_designation.append({
+            "designation": str(names[g]),
+            "headcount": int(counts[g]),
+            "gross_total": _round(gross_totals[g]),
+            "net_total": _round(net_totals[g]),
+            "net_median": _round(net_medians[g]),
+            "avg_net_change_pct": _round(change_sums[g] / change_counts[g]) if change_counts[g] else None,
+        })
+    rest = order[MAX_DESIGNATIONS:]
+    if rest.size:
+        by_designation.append({
+            "designation": "Other",
+            "designations": int(rest.size),
+            "headcount": int(counts[rest].sum()),
+            "gross_total": _round(gross_totals[rest].sum()),
+            "net_total": _round(net_totals[rest].sum()),
+        })
+    digest["by_designation"] = by_designation
+
+    # Top movers by absolute net pay change
+    movers = []
+    changed = np.flatnonzero(has_change)
+    if changed.size:
+        top = changed[np.argsort(-np.abs(change[changed]), kind="stable")[:MAX_MOVERS]]
+        prev_by_cur = dict(zip(cur_idx.tolist(), prev_idx.tolist()))
+        for i in top:
+            movers.append({
+                "ref": cur["employee_id"][i][:8],
+                "designation": str(labels[i]),
+                "previous_net": _round(prev["net_pay"][prev_by_cur[int(i)]]),
+                "current_net": _round(cur["net_pay"][i]),
+                "change_pct": _round(change[i]),
+            })
+    digest["top_movers"] = movers
+
+    # Robust outliers within each designation (median / MAD)
+    deviation = np.abs(cur["net_pay"] - net_medians[groups])
+    mad = group_medians(deviation, groups, group_count)[groups]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        robust_z = np.where(mad > 0, 0.6745 * (cur["net_pay"] - net_medians[groups]) / mad, 0.0)
+    flagged = np.flatnonzero(np.abs(robust_z) > OUTLIER_Z_THRESHOLD)
+    outliers = []
+    for i in flagged[np.argsort(-np.abs(robust_z[flagged]), kind="stable")[:MAX_OUTLIERS]]:
+        outliers.append({
+            "ref": cur["employee_id"][i][:8],
+            "designation": str(labels[i]),
+            "net_pay": _round(cur["net_pay"][i]),
+            "designation_median": _round(net_medians[groups[i]]),
+            "robust_z": _round(robust_z[i]),
+        })
+    digest["outliers"] = outliers
+    digest["outlier_count"] = int(flagged.size)
+
+    return digest
@@ -0,0 +1,203 @@
+"""
+Rule-based payslip explanations (no model call)
+
+Itemizes earnings and deductions from pay_data_snapshot, compares with the
+previous payslip and adds the fiscal-year YTD totals, using the same formulas
+as payroll processing:
+
+- gross = base pay + allowances
+- percentage deductions are a percentage of gross
+- leave deduction = base pay / 30 per unpaid leave day
+
+build_explanation() returns the PayslipExplainResponse fields; render_explanation()
+turns them into the markdown answer served by /chat and /chat/stream.
+"""
+
+from typing import Any, Dict, List, Optional
+
+# Comparisons shown against the previous payslip
+COMPARED_METRICS = (
+    ("gross_pay", "Gross pay"),
+    ("total_deductions", "Total deductions"),
+    ("net_pay", "Net pay"),
+)
+
+# Changes smaller than this (in %) are described as unchanged
+UNCHANGED_PCT = 0.5
+
+
+def _num(value: Any) -> float:
+    try:
+        return float(value or 0)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def _label(key: str) -> str:
+    """hra -> HRA, professional_tax -> Professional Tax"""
+    if len(key) <= 3:
+        return key.upper()
+    return key.replace("_", " ").title()
+
+
+def _money(amount: float) -> str:
+    return f"₹{amount:,.2f}"
+
+
+def _period(payslip: Dict[str, Any]) -> Optional[str]:
+    payrolls = payslip.get("payrolls") or {}
+    start, end = payrolls.get("pay_period_start"), payrolls.get("pay_period_end")
+    if start and end:
+        return f"{start} to {end}"
+    return None
+
+
+def _period_start(payslip: Dict[str, Any]) -> str:
+    return (payslip.get("payrolls") or {}).get("pay_period_start") or ""
+
+
+def _previous(current: Dict[str, Any], payslips: List[Any]) -> Optional[Dict[str, Any]]:
+    """The payslip for the pay period just before the current payslip's"""
+    start = _period_start(current)
+    earlier = [p for p in payslips if isinstance(p, dict) and "" < _period_start(p) < start]
+    return max(earlier, key=_period_start, default=None)
+
+
+def _earnings(snapshot: Dict[str, Any]) -> List[Dict[str, Any]]:
+    items = [{"component": "Base Pay", "amount": round(_num(snapshot.get("base_pay")), 2)}]
+    for key, value in (snapshot.get("allowances") or {}).items():
+        if isinstance(value, (int, float)):
+            items.append({"component": _label(key), "amount": round(float(value), 2)})
+    return items
+
+
+def _deductions(snapshot: Dict[str, Any], gross: float) -> List[Dict[str, Any]]:
+    items = []
+    for key, value in (snapshot.get("deductions_fixed") or {}).items():
+        if isinstance(value, (int, float)):
+            items.append({"component": _label(key), "amount": round(float(value), 2)})
+    for key, value in (snapshot.get("deductions_percent") or {}).items():
+        if isinstance(value, (int, float)):
+            items.append({
+                "component": _label(key),
+                "amount": round(gross * float(value) / 100, 2),
+                "basis": f"{float(value):g}% of gross",
+            })
+    leave_deduction = _num(snapshot.get("leave_deduction"))
+    if leave_deduction:
+        days = snapshot.get("unpaid_leave_days") or 0
+        items.append({
+            "component": "Unpaid Leave",
+            "amount": round(leave_deduction, 2),
+            "basis": f"{days} unpaid day(s) at base pay / 30",
+        })
+    tax = _num(snapshot.get("tax_deduction"))
+    if tax:
+        items.append({"component": "Income Tax (TDS)", "amount": round(tax, 2)})
+    return items
+
+
+def _comparisons(current: Dict[str, Any], previous: Optional[Dict[str, Any]], ytd: Optional[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    comparisons = []
+    if previous:
+        for field, label in COMPARED_METRICS:
+            now, before = _num(current.get(field)), _num(previous.get(field))
+            comparisons.append({
+                "metric": label,
+                "current": round(now, 2),
+                "previous": round(before, 2),
+                "change": round(now - before, 2),
+                "change_pct": round((now - before) / before * 100, 1) if before else None,
+            })
+    if ytd:
+        for field, label in (("gross_ytd", "Gross pay YTD"), ("net_ytd", "Net pay YTD"), ("tax_ytd", "Tax YTD")):
+            if field in ytd:
+                comparisons.append({
+                    "metric": label,
+                    "current": round(_num(ytd[field]), 2),
+                    "fiscal_year": ytd.get("fiscal_year"),
+                    "months_included": ytd.get("months_included"),
+                })
+    return comparisons
+
+
+def _trend(change_pct: Optional[float]) -> str:
+    if change_pct is None:
+        return ""
+    if abs(change_pct) < UNCHANGED_PCT:
+        return "about the same as last month"
+    return f"{'up' if change_pct > 0 else 'down'} {abs(change_pct):.1f}% from last month"
+
+
+def build_explanation(context: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """
+    Explain the current payslip of an enriched payslip_explain context
+
+    Args:
+        context: Context from enrich_context_by_intent (data.current_payslip,
+            data.previous_payslips, data.ytd_totals)
+
+    Returns:
+        PayslipExplainResponse fields, or None if there is no payslip to explain
+    """
+    data = (context or {}).get("data") or {}
+    current = data.get("current_payslip")
+    if not isinstance(current, dict):
+        return None
+    snapshot = current.get("pay_data_snapshot") or {}
+    gross = _num(current.get("gross_pay"))
+    total_deductions = _num(current.get("total_deductions"))
+    net = _num(current.get("net_pay"))
+    previous = _previous(current, data.get("previous_payslips") or [])
+
+    comparisons = _comparisons(current, previous, data.get("ytd_totals"))
+    net_change = next((c for c in comparisons if c["metric"] == "Net pay" and "change_pct" in c), None)
+
+    period = _period(current)
+    summary = (
+        f"Your net pay{f' for {period}' if period else ''} is {_money(net)}: "
+        f"gross earnings of {_money(gross)} less {_money(total_deductions)} in deductions."
+    )
+    trend = _trend(net_change["change_pct"]) if net_change else ""
+    if trend:
+        summary += f" Net pay is {trend}."
+
+    return {
+        "summary": summary,
+        "earnings": _earnings(snapshot),
+        "deductions": _deductions(snapshot, gross),
+        "comparisons": comparisons,
+        "advice": None,
+        "raw_ai_text": None,
+    }
+
+
+def render_explanation(explanation: Dict[str, Any]) -> str:
+    """Markdown answer for the chat endpoints"""
+    lines = [explanation["summary"], "", "**Earnings**"]
+    for item in explanation.get("earnings") or []:
+        lines.append(f"- {item['component']}: {_money(item['amount'])}")
+    lines += ["", "**Deductions**"]
+    deductions = explanation.get("deductions") or []
+    if not deductions:
+        lines.append("- None")
+    for item in deductions:
+        basis = f" ({item['basis']})" if item.get("basis") else ""
+        lines.append(f"- {item['component']}: {_money(item['amount'])}{basis}")
+
+    month_over_month = [c for c in explanation.get("comparisons") or [] if "previous" in c]
+    if month_over_month:
+        lines += ["", "**Compared with last month**"]
+        for c in month_over_month:
+            pct = f" ({c['change_pct']:+.1f}%)" if c.get("change_pct") is not None else ""
+            lines.append(f"- {c['metric']}: {_money(c['current'])} vs {_money(c['previous'])}{pct}")
+
+    ytd = [c for c in explanation.get("comparisons") or [] if "previous" not in c]
+    if ytd:
+        fiscal_year = ytd[0].get("fiscal_year")
+        lines += ["", f"**Year to date{f' (FY {fiscal_year})' if fiscal_year else ''}**"]
+        for c in ytd:
+            lines.append(f"- {c['metric'].replace(' YTD', '')}: {_money(c['current'])}")
+
+    lines += ["", "Ask a follow-up question for tax-saving suggestions or details on any item."]
+    return "\n".join(lines)
@@ -205,7 +205,9 @@ class PDFService:
             deductions_data.append([label, _format_currency(amount)])
         if leave_deduction > 0:
             deductions_data.append([f'Unpaid Leave ({unpaid_leave_days} days)', _format_currency(leave_deduction)])
-        deductions_data.append(['Tax (10%)', _format_currency(tax_deduction)])
+        tax_regime = pay_data.get('tax_regime')
+        tax_label = f"Income Tax (TDS, {tax_regime} regime)" if tax_regime else 'Income Tax (TDS)'
+        deductions_data.append([tax_label, _format_currency(tax_deduction)])
         total_deductions = float(payslip_data.get('total_deductions', 0) or 0)
         deductions_data.append(['TOTAL DEDUCTIONS', _format_currency(total_deductions)])
 
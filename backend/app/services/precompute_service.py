@@ -0,0 +1,289 @@
+"""
+Background precomputation of AI answers after payroll processing
+
+- schedule_payroll() queues dashboard_insights answers for every new payslip;
+  a small worker pool drains the queue at a bounded rate (default payslip_explain
+  queries are answered by app.services.payslip_explainer without the model)
+- Answers are stored per (intent, query, payslip) together with a fingerprint
+  of the payslip, so a corrected payslip is never served a stale answer; only
+  the exact (normalized) query an answer was generated for is served from it
+- get_precomputed() lets /chat and /chat/stream answer default queries instantly
+- stats() exposes progress and backlog for the diagnostics API
+"""
+
+from app.core.config import settings
+from app.services.context_service import enrich_context_by_intent, build_conversation_context
+from app.services.gemini_service import gemini_service
+from app.services.response_cache import ResponseCache, normalize_query
+from typing import Any, Dict, List, Optional
+import asyncio
+import hashlib
+import json
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+# Queries answered ahead of time per intent (the dashboard assistant's suggested prompts)
+PRECOMPUTE_QUERIES = {
+    "dashboard_insights": (
+        "Explain my latest payslip",
+        "Why did my net pay change?",
+    ),
+}
+
+# normalize_query(query) -> query, per intent
+_PRECOMPUTED = {
+    intent: {normalize_query(q): q for q in queries}
+    for intent, queries in PRECOMPUTE_QUERIES.items()
+}
+
+
+def payslip_fingerprint(payslip: Dict[str, Any]) -> str:
+    """Hash of the payslip fields an answer depends on"""
+    relevant = {
+        "id": payslip.get("id"),
+        "gross_pay": payslip.get("gross_pay"),
+        "total_deductions": payslip.get("total_deductions"),
+        "net_pay": payslip.get("net_pay"),
+        "pay_data_snapshot": payslip.get("pay_data_snapshot"),
+        "correction_of": payslip.get("correction_of"),
+    }
+    encoded = json.dumps(relevant, sort_keys=True, default=str)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+def _payslip_for_intent(intent: str, enriched_context: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """The payslip an intent's answer is about, taken from the (unsanitized) enriched context"""
+    data = (enriched_context or {}).get("data") or {}
+    if intent == "dashboard_insights":
+        recent = data.get("recent_payslips") or []
+        return recent[0] if recent else None
+    return None
+
+
+class PrecomputeService:
+    """Bounded-rate background generation of default AI answers"""
+
+    def __init__(
+        self,
+        store: ResponseCache,
+        rate_per_second: float,
+        concurrency: int,
+        max_backlog: int
+    ):
+        self._store = store
+        self._rate_per_second = rate_per_second
+        self._concurrency = concurrency
+        self._max_backlog = max_backlog
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: List["asyncio.Task"] = []
+        self._rate_lock = asyncio.Lock()
+        self._next_slot = 0.0
+        self._in_progress = 0
+        self._metrics = {
+            "scheduled": 0,
+            "completed": 0,
+            "failed": 0,
+            "skipped": 0,
+            "dropped": 0,
+            "served": 0,
+            "invalidated": 0,
+        }
+        # payroll_id -> {"total", "completed", "failed", "skipped", "scheduled_at"}
+        self._payrolls: Dict[str, Dict[str, Any]] = {}
+
+    # ---- scheduling ----------------------------------------------------
+
+    def _ensure_workers(self) -> None:
+        if self._queue is None:
+            self._queue = asyncio.Queue(maxsize=self._max_backlog)
+        self._workers = [w for w in self._workers if not w.done()]
+        while len(self._workers) < self._concurrency:
+            self._workers.append(asyncio.ensure_future(self._worker()))
+
+    def schedule_payroll(self, payroll_id: str, payslips: List[Dict[str, Any]]) -> int:
+        """
+        Queue default answers for a processed payroll's payslips
+
+        Args:
+            payroll_id: Payroll run ID (for progress reporting)
+            payslips: [{"id": payslip_id, "profile_id": employee's profile id}, ...]
+
+        Returns:
+            Number of jobs queued
+        """
+        if not settings.PRECOMPUTE_ENABLED or not payslips:
+            return 0
+        self._ensure_workers()
+
+        progress = {"total": 0, "completed": 0, "failed": 0, "skipped": 0, "scheduled_at": time.time()}
+        self._payrolls[payroll_id] = progress
+        # Keep progress for the most recent payrolls only
+        while len(self._payrolls) > 20:
+            self._payrolls.pop(next(iter(self._payrolls)))
+
+        queued = 0
+        for payslip in payslips:
+            if not payslip.get("id") or not payslip.get("profile_id"):
+                continue
+            for intent, queries in PRECOMPUTE_QUERIES.items():
+                for query in queries:
+                    try:
+                        self._queue.put_nowait((payroll_id, intent, query, payslip["id"], payslip["profile_id"]))
+                    except asyncio.QueueFull:
+                        self._metrics["dropped"] += 1
+                        continue
+                    queued += 1
+        progress["total"] = queued
+        self._metrics["scheduled"] += queued
+        logger.info(f"Queued {queued} precompute jobs for payroll {payroll_id}")
+        return queued
+
+    def _store_key(self, intent: str, query: str, payslip_id: str) -> str:
+        return hashlib.sha256(f"{intent}:{normalize_query(query)}:{payslip_id}".encode("utf-8")).hexdigest()
+
+    # ---- workers -------------------------------------------------------
+
+    async def _throttle(self) -> None:
+        """Space job starts so the pool never exceeds PRECOMPUTE_RATE_PER_SECOND"""
+        async with self._rate_lock:
+            loop = asyncio.get_running_loop()
+            now = loop.time()
+            wait = self._next_slot - now
+            self._next_slot = max(now, self._next_slot) + 1.0 / self._rate_per_second
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    async def _worker(self) -> None:
+        while True:
+            job = await self._queue.get()
+            payroll_id = job[0]
+            try:
+                await self._throttle()
+                self._in_progress += 1
+                outcome = await self._run_job(*job)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Precompute job {job[1]} for payslip {job[3]} failed: {e}")
+                outcome = "failed"
+            finally:
+                self._in_progress = max(0, self._in_progress - 1)
+                self._queue.task_done()
+
+            self._metrics[outcome] += 1
+            progress = self._payrolls.get(payroll_id)
+            if progress is not None:
+                progress[outcome] += 1
+
+    async def _run_job(self, payroll_id: str, intent: str, query: str, payslip_id: str, profile_id: str) -> str:
+        """Generate and store one answer; returns the outcome metric name"""
+        enriched = await enrich_context_by_intent(
+            intent,
+            {"payslip_id": payslip_id},
+            {"user_id": profile_id}
+        )
+        payslip = _payslip_for_intent(intent, enriched)
+        # dashboard_insights is about the latest payslip; skip if a newer one exists
+        if not payslip or payslip.get("id") != payslip_id:
+            return "skipped"
+
+        conversation_context = build_conversation_context(None, enriched)
+        answer = await gemini_service.precompute_response(query, conversation_context, intent)
+        if answer is None:
+            return "failed"
+
+        await self._store.aset(self._store_key(intent, query, payslip_id), json.dumps({
+            "fingerprint": payslip_fingerprint(payslip),
+            "answer": answer,
+        }))
+        return "completed"
+
+    # ---- serving -------------------------------------------------------
+
+    async def get_precomputed(
+        self,
+        intent: Optional[str],
+        query: Optional[str],
+        chat_history: Optional[list],
+        enriched_context: Optional[Dict[str, Any]]
+    ) -> Optional[str]:
+        """
+        Return a stored answer if this request is a default query about a precomputed payslip
+
+        Args:
+            intent: Request intent
+            query: Raw user query
+            chat_history: Conversation so far (follow-ups are never served from here)
+            enriched_context: Context from enrich_context_by_intent (before sanitization)
+        """
+        if not settings.PRECOMPUTE_ENABLED or chat_history:
+            return None
+        if normalize_query(query) not in _PRECOMPUTED.get(intent, {}):
+            return None
+
+        payslip = _payslip_for_intent(intent, enriched_context)
+        if not payslip or not payslip.get("id"):
+            return None
+
+        key = self._store_key(intent, query, payslip["id"])
+        raw = await self._store.aget(key)
+        if raw is None:
+            return None
+        try:
+            entry = json.loads(raw)
+        except ValueError:
+            self._store.invalidate(key)
+            return None
+
+        if entry.get("fingerprint") != payslip_fingerprint(payslip):
+            # Payslip changed since the answer was generated
+            self._store.invalidate(key)
+            self._metrics["invalidated"] += 1
+            return None
+
+        self._metrics["served"] += 1
+        return entry.get("answer")
+
+    def invalidate_payslip(self, payslip_id: str) -> None:
+        """Drop every stored answer for a payslip (e.g. after a correction)"""
+        for intent, queries in PRECOMPUTE_QUERIES.items():
+            for query in queries:
+                self._store.invalidate(self._store_key(intent, query, payslip_id))
+        self._metrics["invalidated"] += 1
+
+    # ---- lifecycle / metrics ------------------------------------------
+
+    async def stop(self) -> None:
+        """Cancel background workers (application shutdown)"""
+        for worker in self._workers:
+            worker.cancel()
+        if self._workers:
+            await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": settings.PRECOMPUTE_ENABLED,
+            "rate_per_second": self._rate_per_second,
+            "workers": len([w for w in self._workers if not w.done()]),
+            "backlog": self._queue.qsize() if self._queue is not None else 0,
+            "in_progress": self._in_progress,
+            **self._metrics,
+            "payrolls": {payroll_id: dict(progress) for payroll_id, progress in self._payrolls.items()},
+        }
+
+
+# Singleton instance
+precompute_service = PrecomputeService(
+    store=ResponseCache(
+        max_entries=settings.PRECOMPUTE_MAX_MEMORY_ENTRIES,
+        ttl_seconds=settings.PRECOMPUTE_TTL_SECONDS,
+        disk_dir=settings.PRECOMPUTE_STORE_DIR or None,
+        disk_max_entries=settings.PRECOMPUTE_DISK_MAX_ENTRIES,
+    ),
+    rate_per_second=settings.PRECOMPUTE_RATE_PER_SECOND,
+    concurrency=settings.PRECOMPUTE_CONCURRENCY,
+    max_backlog=settings.PRECOMPUTE_MAX_BACKLOG,
+)
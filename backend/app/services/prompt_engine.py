@@ -0,0 +1,288 @@
+"""
+Token-budgeted prompt assembly for chat intents
+
+- Templates are compiled once per process: text, version (TEMPLATE_VERSION plus
+  a hash of the wording, so cached answers never outlive a template edit) and
+  token estimate
+- estimate_tokens() is a local estimate; no tokenizer or API call is involved
+- Each intent has an input budget and an output limit (INTENT_BUDGETS). When a
+  prompt is over budget, context is trimmed lowest priority first
+  (SECTION_PRIORITIES): data the intent doesn't rank goes first, then older
+  conversation messages, then the ranked sections from the bottom up. Lists are
+  shortened before a section is dropped; the top-ranked section is only shortened
+- Context sections are encoded per intent (INTENT_ENCODINGS, see
+  context_encoder): compact tables for the known intents, indented JSON otherwise
+- assemble() returns the prompt text with its token accounting, which
+  gemini_service logs for every request
+"""
+
+from app.core.config import settings
+from app.services.ai_templates import AITemplates, TEMPLATE_VERSION
+from app.services.context_encoder import COMPACT_LEGEND, ENCODING_COMPACT, ENCODING_JSON, encode_section
+from typing import Any, Dict, List, Optional, Tuple
+import hashlib
+import math
+
+# Conservative characters-per-token ratio for mixed English/JSON/number text
+CHARS_PER_TOKEN = 3.5
+
+# Older conversation messages are dropped down to this many when trimming
+MIN_HISTORY_MESSAGES = 2
+
+# (input token budget, max output tokens); output limits include the model's thinking tokens
+INTENT_BUDGETS: Dict[str, Tuple[int, int]] = {
+    "payslip_explain": (6000, 4096),
+    "payslip_tax_suggestions": (5000, 4096),
+    "leave_advice": (6000, 2048),
+    "dashboard_insights": (3000, 1024),
+    "general": (4000, 2048),
+}
+
+# Data sections by importance (first = most important) per intent
+SECTION_PRIORITIES: Dict[str, List[str]] = {
+    "payslip_explain": ["current_payslip", "ytd_totals", "previous_payslips"],
+    "payslip_tax_suggestions": ["recent_payslips", "ytd_totals", "leave_balance"],
+    "leave_advice": [
+        "leave_balances", "pending_leaves", "leaves_taken", "salary_structure",
+        "upcoming_holidays", "approved_leaves", "rejected_leaves", "revoked_leaves",
+    ],
+    "dashboard_insights": ["recent_payslips", "ytd_totals", "leave_balance"],
+}
+
+# Context encoding per intent; intents not listed (free-form client context) use JSON
+INTENT_ENCODINGS: Dict[str, str] = {
+    "payslip_explain": ENCODING_COMPACT,
+    "payslip_tax_suggestions": ENCODING_COMPACT,
+    "leave_advice": ENCODING_COMPACT,
+    "dashboard_insights": ENCODING_COMPACT,
+}
+
+_ANSWER_INSTRUCTION = (
+    "Please provide a helpful, accurate response based on the context provided. "
+    "Return a human-friendly response, and where possible return a short structured JSON snippet "
+    "summarizing key fields (summary, earnings, deductions, comparisons, advice)."
+)
+
+_HISTORY_KEY = "(conversation history)"
+
+
+def estimate_tokens(text: Optional[str]) -> int:
+    """Approximate token count of a text"""
+    return math.ceil(len(text) / CHARS_PER_TOKEN) if text else 0
+
+
+class CompiledTemplate:
+    """A template's text with its version and token estimate"""
+
+    def __init__(self, key: str, text: str):
+        self.key = key
+        self.text = text
+        self.version = f"{TEMPLATE_VERSION}.{hashlib.sha256(text.encode('utf-8')).hexdigest()[:8]}"
+        self.tokens = estimate_tokens(text)
+
+
+class Prompt:
+    """An assembled prompt, the context it was built from and its token accounting"""
+
+    def __init__(
+        self,
+        text: str,
+        template: CompiledTemplate,
+        context: Dict[str, Any],
+        history: Dict[str, Any],
+        encoding: str,
+        max_output_tokens: int,
+        accounting: Dict[str, Any]
+    ):
+        self.text = text
+        self.template = template
+        self.context = context
+        self.encoding = encoding
+        self.history = history
+        self.max_output_tokens = max_output_tokens
+        self.accounting = accounting
+
+    def log_line(self) -> str:
+        a = self.accounting
+        trimmed = f" trimmed=[{', '.join(a['trimmed'])}]" if a["trimmed"] else ""
+        over = " OVER BUDGET" if a["input_tokens"] > a["input_budget"] else ""
+        return (
+            f"Prompt tokens intent={a['intent']} template={a['template_version']} encoding={a['encoding']} "
+            f"input~{a['input_tokens']}/{a['input_budget']}{over} "
+            f"(template={a['template_tokens']} context={a['context_tokens']} "
+            f"history={a['history_tokens']} query={a['query_tokens']}) "
+            f"max_output={a['max_output_tokens']}{trimmed}"
+        )
+
+
+def render_history(history: Dict[str, Any]) -> str:
+    """Render the rolling summary and recent messages as a prompt prefix"""
+    parts = []
+    if history.get("summary"):
+        parts.append(f"Summary of the earlier conversation:\n{history['summary']}\n")
+    if history.get("messages"):
+        lines = "\n".join(
+            f"{msg.get('role', 'user').upper()}: {msg.get('content', '')}"
+            for msg in history["messages"]
+        )
+        parts.append(f"Previous conversation:\n{lines}\n")
+    return "\n".join(parts) + "\n" if parts else ""
+
+
+def _message_tokens(msg: Dict[str, Any]) -> int:
+    return estimate_tokens(f"{msg.get('role', 'user').upper()}: {msg.get('content', '')}\n")
+
+
+class PromptEngine:
+    """Compiled templates plus budgeted assembly"""
+
+    def __init__(self):
+        self._templates = {
+            key: CompiledTemplate(key, text) for key, text in AITemplates.all_templates().items()
+        }
+
+    def template(self, intent: Optional[str]) -> CompiledTemplate:
+        return self._templates.get(intent or "", self._templates["general"])
+
+    def budget(self, intent: Optional[str]) -> Tuple[int, int]:
+        return INTENT_BUDGETS.get(intent or "", INTENT_BUDGETS["general"])
+
+    def encoding(self, intent: Optional[str]) -> str:
+        """Context encoding for an intent (PROMPT_CONTEXT_ENCODING forces one for all)"""
+        if settings.PROMPT_CONTEXT_ENCODING in (ENCODING_JSON, ENCODING_COMPACT):
+            return settings.PROMPT_CONTEXT_ENCODING
+        return INTENT_ENCODINGS.get(intent or "", ENCODING_JSON)
+
+    def versions(self) -> Dict[str, str]:
+        return {key: template.version for key, template in self._templates.items()}
+
+    def assemble(
+        self,
+        query: str,
+        context: Optional[Dict[str, Any]],
+        intent: Optional[str],
+        history: Optional[Dict[str, Any]] = None,
+        system_instruction: Optional[str] = None
+    ) -> Prompt:
+        """
+        Build the prompt for a prepared (projected, sanitized, masked) context
+
+        Args:
+            query: User question
+            context: {"data": {...}, "page_view"?} from prepare_context()
+            intent: Intent key (selects template, budget and section priorities)
+            history: {"summary", "messages"} of the conversation
+            system_instruction: Optional custom system instruction
+
+        Returns:
+            The prompt with its trimmed context/history and token accounting
+        """
+        template = self.template(intent)
+        input_budget, max_output_tokens = self.budget(intent)
+        encoding = self.encoding(intent)
+        context = context or {}
+        data = dict(context.get("data") or {})
+        summary = (history or {}).get("summary") or ""
+        messages = list((history or {}).get("messages") or [])
+
+        # Token estimates per part; only the trimmable parts are re-estimated while trimming
+        section_tokens = {key: estimate_tokens(encode_section(key, value, encoding)) for key, value in data.items()}
+        message_tokens = [_message_tokens(msg) for msg in messages]
+        fixed_tokens = (
+            template.tokens
+            + estimate_tokens(query)
+            + estimate_tokens(system_instruction)
+            + estimate_tokens(summary)
+            + estimate_tokens(_ANSWER_INSTRUCTION)
+            + 40  # headings, intent and page lines
+        )
+
+        def total() -> int:
+            return fixed_tokens + sum(section_tokens.values()) + sum(message_tokens)
+
+        trimmed: List[str] = []
+        ranked = SECTION_PRIORITIES.get(intent or "", [])
+        unranked = [key for key in data if key not in ranked]
+        order = unranked[::-1] + [_HISTORY_KEY] + [key for key in ranked[::-1] if key in data]
+
+        for key in order:
+            if total() <= input_budget:
+                break
+            if key == _HISTORY_KEY:
+                before = len(messages)
+                while len(messages) > MIN_HISTORY_MESSAGES and total() > input_budget:
+                    messages.pop(0)
+                    message_tokens.pop(0)
+                if len(messages) < before:
+                    trimmed.append(f"history:{before}->{len(messages)}")
+                continue
+
+            value = data[key]
+            if isinstance(value, list) and len(value) > 1:
+                before = len(value)
+                while len(value) > 1 and total() > input_budget:
+                    value = value[:len(value) // 2]
+                    data[key] = value
+                    section_tokens[key] = estimate_tokens(encode_section(key, value, encoding))
+                if len(value) < before:
+                    trimmed.append(f"{key}:{before}->{len(value)}")
+            if total() > input_budget and key != (ranked[0] if ranked else None):
+                del data[key]
+                del section_tokens[key]
+                trimmed.append(f"-{key}")
+
+        prepared = {**context, "data": data}
+        kept_history = {"summary": summary, "messages": messages}
+        text = self._render(template, query, prepared, intent, kept_history, system_instruction, encoding)
+
+        accounting = {
+            "intent": intent or "general",
+            "template_version": template.version,
+            "encoding": encoding,
+            "template_tokens": template.tokens,
+            "context_tokens": sum(section_tokens.values()),
+            "history_tokens": estimate_tokens(summary) + sum(message_tokens),
+            "query_tokens": estimate_tokens(query),
+            "input_tokens": estimate_tokens(text),
+            "input_budget": input_budget,
+            "max_output_tokens": max_output_tokens,
+            "trimmed": trimmed,
+        }
+        return Prompt(text, template, prepared, kept_history, encoding, max_output_tokens, accounting)
+
+    def _render(
+        self,
+        template: CompiledTemplate,
+        query: str,
+        context: Dict[str, Any],
+        intent: Optional[str],
+        history: Dict[str, Any],
+        system_instruction: Optional[str],
+        encoding: str
+    ) -> str:
+        lines = []
+        if intent:
+            lines += [f"Intent: {intent}", ""]
+        if "page_view" in context:
+            lines += [f"Page: {context['page_view']}", ""]
+        if context.get("data"):
+            lines.append(COMPACT_LEGEND if encoding == ENCODING_COMPACT else "Data:")
+            lines += [encode_section(key, value, encoding) for key, value in context["data"].items()]
+        context_str = "\n".join(lines) if lines else "No additional context provided."
+
+        prompt = f"""{template.text}
+
+Context Information:
+{context_str}
+
+User Question: {query}
+
+{_ANSWER_INSTRUCTION}"""
+        prompt = render_history(history) + prompt
+        if system_instruction:
+            prompt = f"SYSTEM INSTRUCTION: {system_instruction}\n\n{prompt}"
+        return prompt
+
+
+# Singleton instance (templates compiled at import)
+prompt_engine = PromptEngine()
@@ -0,0 +1,229 @@
+"""
+Resilience helpers for calls to the model endpoint
+
+- CircuitBreaker: fail fast after repeated retryable failures, probe again later
+- call_with_resilience(): per-attempt deadline, jittered exponential backoff on
+  retryable errors, optional hedged second request for slow attempts
+- resilient_stream(): same policy for streams; retries only happen before the
+  first chunk has been handed to the caller
+"""
+
+from typing import Any, AsyncIterator, Awaitable, Callable, Optional
+import asyncio
+import logging
+import random
+import time
+
+logger = logging.getLogger(__name__)
+
+# HTTP status codes worth retrying (timeouts, rate limits, transient server errors)
+RETRYABLE_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling the model while the circuit is open"""
+
+
+class CircuitBreaker:
+    """Closed -> open after failure_threshold consecutive failures -> half-open after recovery_seconds"""
+
+    def __init__(self, name: str, failure_threshold: int, recovery_seconds: float):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_seconds = recovery_seconds
+        self.state = "closed"
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+
+    def before_call(self) -> None:
+        """Raise CircuitOpenError unless a call may proceed"""
+        if self.state == "closed":
+            return
+        if self.state == "open":
+            if time.monotonic() - self._opened_at < self.recovery_seconds:
+                raise CircuitOpenError(f"{self.name} is temporarily unavailable")
+            self.state = "half_open"
+            self._probe_in_flight = False
+        # Half-open: let exactly one probe through
+        if self._probe_in_flight:
+            raise CircuitOpenError(f"{self.name} is temporarily unavailable")
+        self._probe_in_flight = True
+
+    def record_success(self) -> None:
+        if self.state != "closed":
+            logger.info(f"Circuit {self.name} closed after successful probe")
+        self.state = "closed"
+        self._failures = 0
+        self._probe_in_flight = False
+
+    def record_failure(self) -> None:
+        self._failures += 1
+        self._probe_in_flight = False
+        if self.state == "half_open" or self._failures >= self.failure_threshold:
+            if self.state != "open":
+                logger.warning(f"Circuit {self.name} opened after {self._failures} failures")
+            self.state = "open"
+            self._opened_at = time.monotonic()
+
+    def release_probe(self) -> None:
+        """Give back a half-open probe slot that ended without a verdict"""
+        self._probe_in_flight = False
+
+    def stats(self) -> dict:
+        return {"name": self.name, "state": self.state, "consecutive_failures": self._failures}
+
+
+def is_retryable(exc: BaseException) -> bool:
+    """Timeouts, connection problems and retryable HTTP statuses"""
+    if isinstance(exc, (asyncio.TimeoutError, ConnectionError)):
+        return True
+    code = getattr(exc, "code", None) or getattr(exc, "status_code", None)
+    if isinstance(code, int):
+        return code in RETRYABLE_STATUS_CODES
+    try:
+        import httpx
+        if isinstance(exc, httpx.TransportError):
+            return True
+    except ImportError:
+        pass
+    return False
+
+
+def backoff_delay(attempt: int, base_delay: float, max_delay: float) -> float:
+    """Full-jitter exponential backoff"""
+    return random.uniform(0, min(max_delay, base_delay * (2 ** attempt)))
+
+
+async def _hedged_attempt(
+    factory: Callable[[], Awaitable[Any]],
+    timeout: float,
+    hedge_after: float
+) -> Any:
+    """Start a second identical request if the first hasn't finished after hedge_after seconds"""
+    first = asyncio.ensure_future(asyncio.wait_for(factory(), timeout))
+    tasks = {first}
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=hedge_after)
+        if not done:
+            logger.info("Model call slow, sending hedged request")
+            tasks.add(asyncio.ensure_future(asyncio.wait_for(factory(), timeout)))
+
+        last_error: Optional[BaseException] = None
+        pending = set(tasks)
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    return task.result()
+                last_error = task.exception()
+        raise last_error
+    finally:
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+
+
+async def call_with_resilience(
+    factory: Callable[[], Awaitable[Any]],
+    *,
+    breaker: CircuitBreaker,
+    timeout: float,
+    retries: int,
+    base_delay: float,
+    max_delay: float,
+    hedge_after: Optional[float] = None
+) -> Any:
+    """
+    Run factory() with a deadline, retries and circuit breaking
+
+    Args:
+        factory: Zero-argument callable creating a fresh awaitable per attempt
+        breaker: Circuit breaker shared by calls to the same endpoint
+        timeout: Deadline per attempt (seconds)
+        retries: Extra attempts after the first for retryable errors
+        base_delay / max_delay: Backoff parameters (seconds)
+        hedge_after: If set, send a hedged duplicate after this many seconds
+    """
+    attempt = 0
+    while True:
+        breaker.before_call()
+        try:
+            if hedge_after:
+                result = await _hedged_attempt(factory, timeout, hedge_after)
+            else:
+                result = await asyncio.wait_for(factory(), timeout)
+        except asyncio.CancelledError:
+            breaker.release_probe()
+            raise
+        except Exception as e:
+            retryable = is_retryable(e)
+            if retryable:
+                breaker.record_failure()
+            else:
+                breaker.release_probe()
+            if not retryable or attempt >= retries:
+                raise
+            delay = backoff_delay(attempt, base_delay, max_delay)
+            logger.warning(f"Retryable model error ({type(e).__name__}: {e}); retry {attempt + 1}/{retries} in {delay:.2f}s")
+            attempt += 1
+            await asyncio.sleep(delay)
+            continue
+        breaker.record_success()
+        return result
+
+
+async def resilient_stream(
+    open_stream: Callable[[], Awaitable[AsyncIterator[Any]]],
+    *,
+    breaker: CircuitBreaker,
+    first_chunk_timeout: float,
+    idle_timeout: float,
+    retries: int,
+    base_delay: float,
+    max_delay: float
+) -> AsyncIterator[Any]:
+    """
+    Yield from a model stream with deadlines, retries and circuit breaking
+
+    Args:
+        open_stream: Zero-argument callable that opens a fresh stream per attempt
+        first_chunk_timeout: Deadline for opening the stream and receiving the first chunk
+        idle_timeout: Maximum gap between later chunks
+    """
+    attempt = 0
+    while True:
+        breaker.before_call()
+        started = False
+        try:
+            stream = await asyncio.wait_for(open_stream(), first_chunk_timeout)
+            iterator = stream.__aiter__()
+            while True:
+                try:
+                    chunk = await asyncio.wait_for(
+                        iterator.__anext__(),
+                        idle_timeout if started else first_chunk_timeout
+                    )
+                except StopAsyncIteration:
+                    break
+                started = True
+                yield chunk
+        except (asyncio.CancelledError, GeneratorExit):
+            breaker.release_probe()
+            raise
+        except Exception as e:
+            retryable = is_retryable(e)
+            if retryable:
+                breaker.record_failure()
+            else:
+                breaker.release_probe()
+            # Once text has reached the caller a retry would duplicate it
+            if started or not retryable or attempt >= retries:
+                raise
+            delay = backoff_delay(attempt, base_delay, max_delay)
+            logger.warning(f"Retryable stream error ({type(e).__name__}: {e}); retry {attempt + 1}/{retries} in {delay:.2f}s")
+            attempt += 1
+            await asyncio.sleep(delay)
+            continue
+        breaker.record_success()
+        return
@@ -0,0 +1,254 @@
+"""
+Two-tier cache for AI responses
+
+- Memory tier: LRU with per-entry TTL, read and written inline
+- Disk tier: one JSON file per key under RESPONSE_CACHE_DIR, shared by workers
+  on the same host and surviving restarts; also TTL-bound and capped in size.
+  aget()/aset() do its file I/O in a worker thread, and the periodic eviction
+  sweep runs in a background thread, so the event loop never waits on disk
+
+Keys are a stable SHA-256 of intent, template version, compacted context,
+normalized query and generation settings (see make_response_cache_key).
+"""
+
+from app.core.config import settings
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_query(query: Optional[str]) -> str:
+    """Case-fold, collapse whitespace and drop trailing punctuation"""
+    if not query:
+        return ""
+    return _WHITESPACE.sub(" ", query).strip().rstrip("?.! ").casefold()
+
+
+def make_response_cache_key(
+    intent: Optional[str],
+    template_version: str,
+    context: Optional[Dict[str, Any]],
+    query: Optional[str],
+    **extra: Any
+) -> str:
+    """
+    Build a stable cache key
+
+    Args:
+        intent: Intent key (None for general queries)
+        template_version: Version of the prompt templates
+        context: Compacted, sanitized context actually sent to the model
+        query: Raw user query (normalized here)
+        extra: Anything else that changes the answer (model, system instruction, history)
+
+    Returns:
+        Hex digest
+    """
+    payload = {
+        "intent": intent or "",
+        "template_version": template_version,
+        "context": context or {},
+        "query": normalize_query(query),
+        "extra": extra,
+    }
+    encoded = json.dumps(payload, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """LRU + TTL memory cache backed by an optional local-disk tier"""
+
+    def __init__(
+        self,
+        max_entries: int,
+        ttl_seconds: float,
+        disk_dir: Optional[str] = None,
+        disk_max_entries: int = 10000
+    ):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.disk_dir = disk_dir
+        self.disk_max_entries = disk_max_entries
+        self._memory: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk_writes = 0
+        self._evicting = False
+        self.hits = 0
+        self.misses = 0
+
+    # ---- memory tier -------------------------------------------------
+
+    def _memory_get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.time():
+                del self._memory[key]
+                return None
+            self._memory.move_to_end(key)
+            return value
+
+    def _memory_set(self, key: str, value: str, expires_at: float) -> None:
+        with self._lock:
+            self._memory[key] = (expires_at, value)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+
+    # ---- disk tier ---------------------------------------------------
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, key[:2], f"{key}.json")
+
+    def _disk_get(self, key: str) -> Optional[Tuple[float, str]]:
+        if not self.disk_dir:
+            return None
+        path = self._disk_path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning(f"Discarding unreadable response cache entry {key}: {e}")
+            self._disk_delete(key)
+            return None
+
+        expires_at = float(entry.get("expires_at", 0))
+        if expires_at < time.time():
+            self._disk_delete(key)
+            return None
+        try:
+            # Touch so disk eviction follows access order
+            os.utime(path, None)
+        except OSError:
+            pass
+        return expires_at, entry.get("value", "")
+
+    def _disk_set(self, key: str, value: str, expires_at: float) -> None:
+        if not self.disk_dir:
+            return
+        path = self._disk_path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"expires_at": expires_at, "value": value}, f)
+            os.replace(tmp_path, path)
+        except Exception as e:
+            logger.warning(f"Could not write response cache entry {key}: {e}")
+            return
+
+        with self._lock:
+            self._disk_writes += 1
+            start_eviction = self._disk_writes % 100 == 0 and not self._evicting
+            if start_eviction:
+                self._evicting = True
+        if start_eviction:
+            threading.Thread(target=self._evict_disk, name="response-cache-evict", daemon=True).start()
+
+    def _disk_delete(self, key: str) -> None:
+        if not self.disk_dir:
+            return
+        try:
+            os.remove(self._disk_path(key))
+        except OSError:
+            pass
+
+    def _evict_disk(self) -> None:
+        """Drop expired files, then least recently used ones above the cap (background thread)"""
+        try:
+            self._sweep_disk()
+        except Exception as e:
+            logger.warning(f"Response cache eviction failed: {e}")
+        finally:
+            with self._lock:
+                self._evicting = False
+
+    def _sweep_disk(self) -> None:
+        entries = []
+        now = time.time()
+        for root, _dirs, files in os.walk(self.disk_dir):
+            for name in files:
+                if not name.endswith(".json"):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    mtime = os.path.getmtime(path)
+                except OSError:
+                    continue
+                if mtime + self.ttl_seconds < now:
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        pass
+                    continue
+                entries.append((mtime, path))
+
+        overflow = len(entries) - self.disk_max_entries
+        if overflow > 0:
+            entries.sort()
+            for _mtime, path in entries[:overflow]:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    # ---- public API --------------------------------------------------
+
+    async def aget(self, key: str) -> Optional[str]:
+        """Return a cached response, promoting disk hits into memory"""
+        value = self._memory_get(key)
+        if value is not None:
+            self.hits += 1
+            return value
+
+        disk_entry = await asyncio.to_thread(self._disk_get, key) if self.disk_dir else None
+        if disk_entry is not None:
+            expires_at, value = disk_entry
+            self._memory_set(key, value, expires_at)
+            self.hits += 1
+            return value
+
+        self.misses += 1
+        return None
+
+    async def aset(self, key: str, value: str, ttl_seconds: Optional[float] = None) -> None:
+        """Store a response in both tiers"""
+        expires_at = time.time() + (ttl_seconds if ttl_seconds is not None else self.ttl_seconds)
+        self._memory_set(key, value, expires_at)
+        if self.disk_dir:
+            await asyncio.to_thread(self._disk_set, key, value, expires_at)
+
+    def invalidate(self, key: str) -> None:
+        """Remove a key from both tiers"""
+        with self._lock:
+            self._memory.pop(key, None)
+        self._disk_delete(key)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            size = len(self._memory)
+        return {"memory_entries": size, "hits": self.hits, "misses": self.misses}
+
+
+# Singleton instance
+response_cache = ResponseCache(
+    max_entries=settings.RESPONSE_CACHE_MAX_ENTRIES,
+    ttl_seconds=settings.RESPONSE_CACHE_TTL_SECONDS,
+    disk_dir=settings.RESPONSE_CACHE_DIR or None,
+    disk_max_entries=settings.RESPONSE_CACHE_DISK_MAX_ENTRIES,
+)
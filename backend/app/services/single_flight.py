@@ -0,0 +1,154 @@
+"""
+Single-flight coalescing of identical concurrent async work
+
+- SingleFlight.do(key, factory): concurrent callers with the same key await one
+  shared task
+- StreamSingleFlight.subscribe(key, factory): concurrent stream consumers with
+  the same key fan out from one shared chunk buffer; late joiners replay the
+  buffer from the start
+
+In both cases the shared upstream work is cancelled only once every caller or
+subscriber has gone away.
+"""
+
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class _Call:
+    def __init__(self, task: "asyncio.Task"):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Share one in-flight coroutine among concurrent callers with the same key"""
+
+    def __init__(self):
+        self._calls: Dict[str, _Call] = {}
+
+    def in_flight(self) -> int:
+        return len(self._calls)
+
+    async def do(self, key: str, factory: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Run factory() once per key at a time and return its result to every caller
+
+        Args:
+            key: Coalescing key (identical requests must produce identical keys)
+            factory: Zero-argument callable returning the awaitable to share
+        """
+        call = self._calls.get(key)
+        if call is None:
+            call = _Call(asyncio.ensure_future(factory()))
+            self._calls[key] = call
+            call.task.add_done_callback(lambda _task, c=call: self._forget(key, c))
+        else:
+            logger.debug(f"Joining in-flight call {key[:12]}")
+
+        call.waiters += 1
+        try:
+            # shield() so one caller's cancellation doesn't cancel the shared task
+            return await asyncio.shield(call.task)
+        finally:
+            call.waiters -= 1
+            if call.waiters == 0 and not call.task.done():
+                call.task.cancel()
+                self._forget(key, call)
+
+    def _forget(self, key: str, call: _Call) -> None:
+        if self._calls.get(key) is call:
+            del self._calls[key]
+
+
+class _StreamFlight:
+    def __init__(self):
+        self.chunks: List[str] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.changed = asyncio.Condition()
+        self.subscribers = 0
+        self.task: Optional["asyncio.Task"] = None
+
+
+class StreamSingleFlight:
+    """Share one upstream async stream among concurrent subscribers with the same key"""
+
+    def __init__(self):
+        self._flights: Dict[str, _StreamFlight] = {}
+
+    def in_flight(self) -> int:
+        return len(self._flights)
+
+    async def subscribe(
+        self,
+        key: str,
+        factory: Callable[[], AsyncIterator[str]]
+    ) -> AsyncIterator[str]:
+        """
+        Yield the shared stream's chunks, starting the upstream if needed
+
+        Args:
+            key: Coalescing key
+            factory: Zero-argument callable returning the upstream async iterator
+        """
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = _StreamFlight()
+            self._flights[key] = flight
+            flight.task = asyncio.ensure_future(self._pump(key, flight, factory))
+        else:
+            logger.debug(f"Joining in-flight stream {key[:12]}")
+
+        flight.subscribers += 1
+        index = 0
+        try:
+            while True:
+                async with flight.changed:
+                    while index >= len(flight.chunks) and not flight.done:
+                        await flight.changed.wait()
+                    pending = flight.chunks[index:]
+                    finished = flight.done
+                index += len(pending)
+                for chunk in pending:
+                    yield chunk
+                if finished and index >= len(flight.chunks):
+                    if flight.error is not None:
+                        raise flight.error
+                    return
+        finally:
+            flight.subscribers -= 1
+            if flight.subscribers == 0 and flight.task is not None and not flight.task.done():
+                flight.task.cancel()
+                self._forget(key, flight)
+
+    async def _pump(
+        self,
+        key: str,
+        flight: _StreamFlight,
+        factory: Callable[[], AsyncIterator[str]]
+    ) -> None:
+        """Pull the upstream into the shared buffer and wake subscribers"""
+        try:
+            async for chunk in factory():
+                async with flight.changed:
+                    flight.chunks.append(chunk)
+                    flight.changed.notify_all()
+        except asyncio.CancelledError:
+            flight.error = asyncio.CancelledError()
+            raise
+        except Exception as e:
+            flight.error = e
+        finally:
+            flight.done = True
+            self._forget(key, flight)
+            if flight.subscribers:
+                async with flight.changed:
+                    flight.changed.notify_all()
+
+    def _forget(self, key: str, flight: _StreamFlight) -> None:
+        if self._flights.get(key) is flight:
+            del self._flights[key]
@@ -0,0 +1,178 @@
+"""
+Content-addressed pay structure snapshots
+
+A payslip's calculation snapshot is stored in two parts:
+
+- structure (STRUCTURE_FIELDS: base pay, allowances, deduction dicts, tax
+  bracket): stored once in pay_structure_snapshots under structure_hash, a
+  SHA-256 of its canonical JSON and SNAPSHOT_FORMAT_VERSION
+- per-payslip fields (leave days, leave and tax deductions): kept in
+  payslips.pay_data_snapshot next to structure_hash
+
+dehydrate() splits a snapshot before a payslip is written and
+store_structures() inserts the structures a batch references (once per hash).
+Readers call rehydrate()/arehydrate() on fetched rows: structures resolve
+through an LRU cache (content-addressed rows never change, so there is no
+TTL) with one query for all misses. Rows without structure_hash (not yet
+backfilled) pass through unchanged.
+"""
+
+from app.core.config import settings
+from app.core.db import execute
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+import asyncio
+import hashlib
+import json
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+STRUCTURE_FIELDS = (
+    "base_pay",
+    "allowances",
+    "deductions_fixed",
+    "deductions_percent",
+    "tax_bracket_id",
+    "tax_regime",
+)
+
+# Bump when the split or canonical form changes; it is part of every hash
+SNAPSHOT_FORMAT_VERSION = 1
+
+# Hashes per lookup query (keeps the in.(...) filter well within URL limits)
+_LOOKUP_CHUNK = 100
+
+
+def _canonical(value: Any) -> Any:
+    """Stable JSON form: integral floats as ints (50000.0 and 50000 hash alike)"""
+    if isinstance(value, dict):
+        return {str(k): _canonical(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_canonical(v) for v in value]
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+
+def structure_hash(structure: Dict[str, Any]) -> str:
+    payload = {"format_version": SNAPSHOT_FORMAT_VERSION, "structure": _canonical(structure)}
+    encoded = json.dumps(payload, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+def dehydrate(snapshot: Dict[str, Any]) -> Tuple[str, Dict[str, Any], Dict[str, Any]]:
+    """
+    Split a full snapshot
+
+    Returns:
+        (structure_hash, structure, per-payslip fields)
+    """
+    structure = {key: snapshot[key] for key in STRUCTURE_FIELDS if key in snapshot}
+    variable = {key: value for key, value in snapshot.items() if key not in STRUCTURE_FIELDS}
+    return structure_hash(structure), structure, variable
+
+
+class SnapshotStore:
+    """Writes structures once and resolves structure_hash -> structure through an LRU cache"""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._cache: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._metrics = {"hits": 0, "misses": 0, "stored": 0}
+
+    def _get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            structure = self._cache.get(key)
+            if structure is not None:
+                self._cache.move_to_end(key)
+            return structure
+
+    def _put(self, key: str, structure: Dict[str, Any]) -> None:
+        with self._lock:
+            self._cache[key] = structure
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+
+    def store_structures(self, supabase, structures: Dict[str, Dict[str, Any]]) -> int:
+        """
+        Insert structures not known to exist yet (existing hashes are left alone)
+
+        Args:
+            supabase: Supabase client
+            structures: structure_hash -> structure (dehydrate())
+
+        Returns:
+            Number of structures sent to the database
+        """
+        new = {key: s for key, s in structures.items() if self._get(key) is None}
+        if new:
+            execute(supabase.table("pay_structure_snapshots").upsert([
+                {"structure_hash": key, "format_version": SNAPSHOT_FORMAT_VERSION, "structure": s}
+                for key, s in new.items()
+            ], on_conflict="structure_hash", ignore_duplicates=True))
+            self._metrics["stored"] += len(new)
+        for key, s in new.items():
+            self._put(key, s)
+        return len(new)
+
+    def structures(self, supabase, hashes: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        """structure_hash -> structure, from the cache or one query per chunk of misses"""
+        found: Dict[str, Dict[str, Any]] = {}
+        missing: List[str] = []
+        for key in set(hashes):
+            structure = self._get(key)
+            if structure is None:
+                missing.append(key)
+            else:
+                found[key] = structure
+        self._metrics["hits"] += len(found)
+        self._metrics["misses"] += len(missing)
+        for start in range(0, len(missing), _LOOKUP_CHUNK):
+            response = execute(supabase.table("pay_structure_snapshots").select(
+                "structure_hash, structure"
+            ).in_("structure_hash", missing[start:start + _LOOKUP_CHUNK]))
+            for row in response.data or []:
+                self._put(row["structure_hash"], row["structure"])
+                found[row["structure_hash"]] = row["structure"]
+        return found
+
+    def rehydrate(self, supabase, rows: Iterable[Optional[Dict[str, Any]]]) -> None:
+        """
+        Restore full snapshots on fetched payslip rows, in place
+
+        Rows with pay_data_snapshot get structure fields merged under their
+        per-payslip fields; flattened rows (e.g. PAYSLIP_ANALYSIS) get selected
+        structure fields that came back empty filled in.
+        """
+        rows = [row for row in rows if row and row.get("structure_hash")]
+        if not rows:
+            return
+        structures = self.structures(supabase, (row["structure_hash"] for row in rows))
+        for row in rows:
+            structure = structures.get(row["structure_hash"])
+            if structure is None:
+                logger.warning(f"Pay structure {row['structure_hash'][:12]} not found for payslip {row.get('id')}")
+                continue
+            if "pay_data_snapshot" in row:
+                row["pay_data_snapshot"] = {**structure, **(row.get("pay_data_snapshot") or {})}
+            else:
+                for key, value in structure.items():
+                    if key in row and row[key] is None:
+                        row[key] = value
+
+    async def arehydrate(self, supabase, rows: Iterable[Optional[Dict[str, Any]]]) -> None:
+        """rehydrate() in a worker thread (cache misses query the database)"""
+        await asyncio.to_thread(self.rehydrate, supabase, list(rows))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            size = len(self._cache)
+        return {"entries": size, "max_entries": self.max_entries, **self._metrics}
+
+
+# Singleton instance
+snapshot_store = SnapshotStore(settings.SNAPSHOT_CACHE_MAX_ENTRIES)
@@ -0,0 +1,161 @@
+"""
+Server-Sent Events framing for streamed AI responses
+
+- Typed events: delta ({"text"}), usage (stream metrics), error ({"error"}), done
+- Event data is always JSON, so multi-line model output can't break framing
+- Small model chunks are coalesced into one frame by size or by age
+- A bounded queue between the model and the client applies backpressure
+- Comment heartbeats keep proxies from closing idle connections
+- Client disconnects cancel the upstream generation immediately
+"""
+
+from starlette.requests import Request
+from app.core.config import settings
+from typing import Any, AsyncIterator, Dict, Optional
+import asyncio
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Headers that stop proxies/CDNs from buffering or caching the stream
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "X-Accel-Buffering": "no",
+}
+
+HEARTBEAT = b": keep-alive\n\n"
+
+# How often to check for a client disconnect while waiting on the model
+DISCONNECT_POLL_SECONDS = 0.5
+
+_END = object()
+
+
+class _Failure:
+    def __init__(self, error: BaseException):
+        self.error = error
+
+
+def format_event(event: str, data: Any) -> bytes:
+    """Encode one SSE event with a JSON data line"""
+    payload = json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+    return f"event: {event}\ndata: {payload}\n\n".encode("utf-8")
+
+
+async def sse_event_stream(
+    request: Request,
+    chunks: AsyncIterator[str],
+    *,
+    meta: Optional[Dict[str, Any]] = None,
+    heartbeat_seconds: Optional[float] = None,
+    coalesce_chars: Optional[int] = None,
+    coalesce_delay_ms: Optional[float] = None,
+    queue_size: Optional[int] = None
+) -> AsyncIterator[bytes]:
+    """
+    Frame a text chunk stream as SSE events
+
+    Args:
+        request: Incoming request (used to detect client disconnects)
+        chunks: Upstream text chunks (model stream or cached replay)
+        meta: Extra fields for the usage event (e.g. {"source": "model"})
+        heartbeat_seconds / coalesce_chars / coalesce_delay_ms / queue_size:
+            Override the SSE_* settings
+
+    Yields:
+        Encoded SSE frames
+    """
+    heartbeat_seconds = heartbeat_seconds or settings.SSE_HEARTBEAT_SECONDS
+    coalesce_chars = coalesce_chars or settings.SSE_COALESCE_CHARS
+    coalesce_delay = (coalesce_delay_ms if coalesce_delay_ms is not None else settings.SSE_COALESCE_DELAY_MS) / 1000
+    queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size or settings.SSE_QUEUE_SIZE)
+
+    async def _produce() -> None:
+        # put() blocks while the queue is full, so a slow client slows the model read
+        try:
+            async for chunk in chunks:
+                if chunk:
+                    await queue.put(chunk)
+            await queue.put(_END)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            await queue.put(_Failure(e))
+
+    loop = asyncio.get_running_loop()
+    producer = asyncio.ensure_future(_produce())
+    getter: Optional["asyncio.Future"] = None
+    started = last_sent = last_poll = loop.time()
+    buffer = []
+    buffered_chars = 0
+    buffered_since: Optional[float] = None
+    usage = {"chunks": 0, "frames": 0, "characters": 0}
+
+    def _flush() -> bytes:
+        nonlocal buffer, buffered_chars, buffered_since
+        frame = format_event("delta", {"text": "".join(buffer)})
+        usage["frames"] += 1
+        buffer, buffered_chars, buffered_since = [], 0, None
+        return frame
+
+    try:
+        while True:
+            now = loop.time()
+            deadline = min(last_sent + heartbeat_seconds, last_poll + DISCONNECT_POLL_SECONDS)
+            if buffered_since is not None:
+                deadline = min(deadline, buffered_since + coalesce_delay)
+
+            # Keep one pending get() across timeouts so no chunk is lost
+            if getter is None:
+                getter = asyncio.ensure_future(queue.get())
+            done, _ = await asyncio.wait({getter}, timeout=max(0.0, deadline - now))
+            item = None
+            if done:
+                item = getter.result()
+                getter = None
+
+            if item is _END:
+                break
+            if isinstance(item, _Failure):
+                logger.error(f"Error during streaming response: {item.error}")
+                if buffer:
+                    yield _flush()
+                yield format_event("error", {"error": "Streaming terminated due to server error."})
+                return
+            if item is not None:
+                if buffered_since is None:
+                    buffered_since = loop.time()
+                buffer.append(item)
+                buffered_chars += len(item)
+                usage["chunks"] += 1
+                usage["characters"] += len(item)
+
+            now = loop.time()
+            if now - last_poll >= DISCONNECT_POLL_SECONDS:
+                last_poll = now
+                if await request.is_disconnected():
+                    logger.info("SSE client disconnected; cancelling upstream generation")
+                    return
+            if buffer and (buffered_chars >= coalesce_chars or now - buffered_since >= coalesce_delay):
+                yield _flush()
+                last_sent = now
+            elif item is None and now - last_sent >= heartbeat_seconds:
+                yield HEARTBEAT
+                last_sent = now
+
+        if buffer:
+            yield _flush()
+        yield format_event("usage", {
+            **usage,
+            "duration_ms": round((loop.time() - started) * 1000, 1),
+            **(meta or {}),
+        })
+        yield format_event("done", {})
+    finally:
+        # Runs on completion, client disconnect, or cancellation of the response task
+        if getter is not None:
+            getter.cancel()
+        if not producer.done():
+            producer.cancel()
+            await asyncio.gather(producer, return_exceptions=True)
@@ -0,0 +1,254 @@
+"""
+Progressive slab income tax (TDS on salary)
+
+- A tax_brackets row becomes a SlabTable: slab lower bounds, marginal rates and
+  the cumulative tax owed at each lower bound, computed once per bracket
+- TaxTables stacks the slab tables a payroll needs (padded to the longest), so
+  TDS for a whole company is one vectorized pass: annualize pay, subtract the
+  standard deduction, locate each employee's slab, then apply the rebate,
+  marginal relief and cess
+- A salary structure names its tax_regime, and the bracket is looked up by
+  (regime, fiscal year of the pay period): the latest row at or before that
+  fiscal year, the company's own row winning over the statutory one within a
+  year. Structures without a regime take the regime of the fiscal year's
+  statutory default
+- tax_bracket_service caches slab tables by (company, regime, fiscal year), and
+  the statutory default by fiscal year, for TAX_BRACKET_CACHE_TTL_SECONDS
+- Without any tax_brackets row (e.g. migration not applied) the previous flat
+  FLAT_TAX_RATE of gross pay applies
+"""
+
+from app.core.config import settings
+from app.core.db import execute
+from typing import Any, Dict, Iterable, Optional, Sequence, Tuple
+import logging
+import threading
+import time
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+TAX_BRACKET_COLUMNS = (
+    "id, company_id, name, regime, fiscal_year, slabs, standard_deduction, "
+    "rebate_limit, rebate_max, rebate_marginal_relief, cess_percent"
+)
+
+FLAT_TAX_RATE = 0.10
+
+
+def _num(value: Any) -> float:
+    try:
+        return float(value or 0)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+class SlabTable:
+    """Precomputed slab table of one tax bracket (annual amounts)"""
+
+    def __init__(self, bracket: Dict[str, Any]):
+        self.id: Optional[str] = bracket.get("id")
+        self.name: str = bracket.get("name") or "Unnamed"
+        self.regime: Optional[str] = bracket.get("regime")
+        self.fiscal_year: Optional[int] = bracket.get("fiscal_year")
+        self.standard_deduction = _num(bracket.get("standard_deduction"))
+        self.rebate_limit = _num(bracket.get("rebate_limit"))
+        self.rebate_max = _num(bracket.get("rebate_max"))
+        self.marginal_relief = bool(bracket.get("rebate_marginal_relief"))
+        self.cess = _num(bracket.get("cess_percent")) / 100
+
+        # Open-ended slab last; a last slab with a limit extends to infinity
+        slabs = sorted(
+            bracket.get("slabs") or [{"up_to": None, "rate": 0}],
+            key=lambda s: float("inf") if s.get("up_to") is None else _num(s["up_to"])
+        )
+        self.rates = np.array([_num(s.get("rate")) / 100 for s in slabs])
+        self.lower = np.array([0.0] + [_num(s.get("up_to")) for s in slabs[:-1]])
+        self.base = np.concatenate(([0.0], np.cumsum(np.diff(self.lower) * self.rates[:-1])))
+
+    @property
+    def label(self) -> str:
+        return f"{self.regime} regime" if self.regime else self.name
+
+
+# Previous behaviour: a flat share of gross pay, no deduction, rebate or cess
+FLAT_TABLE = SlabTable({
+    "id": None,
+    "name": f"Flat {FLAT_TAX_RATE:.0%}",
+    "slabs": [{"up_to": None, "rate": FLAT_TAX_RATE * 100}],
+})
+
+
+class TaxTables:
+    """Slab tables stacked into padded arrays; row 0 is the default table"""
+
+    def __init__(self, tables: Sequence[SlabTable]):
+        self.tables = list(tables)
+        width = max(len(t.rates) for t in self.tables)
+        count = len(self.tables)
+        self.lower = np.full((count, width), np.inf)
+        self.base = np.zeros((count, width))
+        self.rates = np.zeros((count, width))
+        for i, table in enumerate(self.tables):
+            n = len(table.rates)
+            self.lower[i, :n] = table.lower
+            self.base[i, :n] = table.base
+            self.rates[i, :n] = table.rates
+        self.standard_deduction = np.array([t.standard_deduction for t in self.tables])
+        self.rebate_limit = np.array([t.rebate_limit for t in self.tables])
+        self.rebate_max = np.array([t.rebate_max for t in self.tables])
+        self.marginal_relief = np.array([t.marginal_relief for t in self.tables])
+        self.cess = np.array([t.cess for t in self.tables])
+        # Later tables override the default's regime (e.g. a company's own "new" slabs)
+        self._rows = {t.regime: i for i, t in enumerate(self.tables) if t.regime}
+
+    def index(self, regimes: Iterable[Optional[str]]) -> np.ndarray:
+        """Table row per employee; a missing regime is the default's, unknown ones use row 0"""
+        default_regime = self.tables[0].regime
+        return np.array([self._rows.get(r or default_regime, 0) for r in regimes], dtype=np.intp)
+
+    def annual_tax(self, rows: np.ndarray, income: np.ndarray) -> np.ndarray:
+        """
+        Annual tax including cess
+
+        Args:
+            rows: Table row per employee (index())
+            income: Annual gross income per employee
+        """
+        taxable = np.maximum(income - self.standard_deduction[rows], 0.0)
+        lower = self.lower[rows]
+        slab = (taxable[:, None] >= lower).sum(axis=1) - 1
+        pick = np.arange(taxable.size)
+        tax = self.base[rows, slab] + (taxable - lower[pick, slab]) * self.rates[rows, slab]
+
+        limit = self.rebate_limit[rows]
+        rebated = taxable <= limit
+        tax = np.where(rebated, np.maximum(tax - self.rebate_max[rows], 0.0), tax)
+        # Marginal relief: tax above the rebate limit can't exceed the income above it
+        relief = self.marginal_relief[rows] & ~rebated
+        tax = np.where(relief, np.minimum(tax, taxable - limit), tax)
+        return tax * (1 + self.cess[rows])
+
+    def monthly_tds(self, rows: np.ndarray, gross_pay: np.ndarray, periods_per_year: int = 12) -> np.ndarray:
+        """Per-period TDS: annual tax on pay annualized over periods_per_year, spread evenly"""
+        annual = self.annual_tax(rows, np.asarray(gross_pay, dtype=np.float64) * periods_per_year)
+        return np.round(annual / periods_per_year, 2)
+
+
+class TaxBracketService:
+    """Slab tables by (company, regime, fiscal year) and statutory defaults by fiscal year, cached with a TTL"""
+
+    def __init__(self, ttl_seconds: float):
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._brackets: Dict[Tuple[Optional[str], str, int], Tuple[float, Optional[SlabTable]]] = {}
+        self._defaults: Dict[int, Tuple[float, SlabTable]] = {}
+
+    def tables(
+        self,
+        supabase,
+        company_id: Optional[str],
+        regimes: Iterable[Optional[str]],
+        fiscal_year: int
+    ) -> TaxTables:
+        """
+        Slab tables for a payroll
+
+        Args:
+            supabase: Supabase client
+            company_id: The payroll's company (its own brackets take precedence)
+            regimes: salary_structures.tax_regime values (None allowed)
+            fiscal_year: Start year of the fiscal year of the payroll's pay period
+
+        Returns:
+            TaxTables with the fiscal year's default in row 0
+        """
+        default = self._default(supabase, fiscal_year)
+        wanted = {r for r in regimes if r} | ({default.regime} if default.regime else set())
+        keys = [(company_id, r, fiscal_year) for r in wanted]
+        cached = {key[1]: table for key, table in self._cached(self._brackets, keys).items()}
+        missing = wanted - set(cached)
+        if missing:
+            cached.update(self._fetch(supabase, company_id, missing, fiscal_year))
+        tables = [default] + [t for t in cached.values() if t is not None and t.id != default.id]
+        unknown = [r for r, t in cached.items() if t is None]
+        if unknown:
+            logger.warning(f"No tax brackets for regimes {sorted(unknown)} in {fiscal_year}: using {default.name}")
+        return TaxTables(tables)
+
+    def invalidate(self, bracket_id: Optional[str] = None) -> None:
+        """Forget one bracket (after it was edited) or everything"""
+        with self._lock:
+            if bracket_id is None:
+                self._brackets.clear()
+                self._defaults.clear()
+            else:
+                self._brackets = {k: v for k, v in self._brackets.items() if v[1] is None or v[1].id != bracket_id}
+                self._defaults = {k: v for k, v in self._defaults.items() if v[1].id != bracket_id}
+
+    def _cached(self, store: Dict, keys: Iterable) -> Dict:
+        now = time.monotonic()
+        with self._lock:
+            return {k: store[k][1] for k in keys if k in store and store[k][0] > now}
+
+    def _fetch(
+        self,
+        supabase,
+        company_id: Optional[str],
+        regimes: Iterable[str],
+        fiscal_year: int
+    ) -> Dict[str, Optional[SlabTable]]:
+        regimes = sorted(regimes)
+        try:
+            # Every candidate at or before the fiscal year, statutory and the company's own
+            query = supabase.table("tax_brackets").select(TAX_BRACKET_COLUMNS).in_(
+                "regime", regimes
+            ).lte("fiscal_year", fiscal_year)
+            if company_id:
+                query = query.or_(f"company_id.is.null,company_id.eq.{company_id}")
+            else:
+                query = query.is_("company_id", "null")
+            response = execute(query.order("fiscal_year", desc=True).order("created_at"))
+        except Exception as e:
+            logger.warning(f"Could not load tax brackets: {e}")
+            return {r: None for r in regimes}  # not cached: retried next time
+        # Latest fiscal year wins; within a year the company's row beats the statutory one
+        best: Dict[str, Dict[str, Any]] = {}
+        for row in response.data or []:
+            rank = (row.get("fiscal_year") or 0, row.get("company_id") is not None)
+            current = best.get(row["regime"])
+            if current is None or rank > (current.get("fiscal_year") or 0, current.get("company_id") is not None):
+                best[row["regime"]] = row
+        result = {r: SlabTable(best[r]) if r in best else None for r in regimes}
+        expires = time.monotonic() + self.ttl_seconds
+        with self._lock:
+            for r, table in result.items():
+                self._brackets[(company_id, r, fiscal_year)] = (expires, table)
+        return result
+
+    def _default(self, supabase, fiscal_year: int) -> SlabTable:
+        cached = self._cached(self._defaults, [fiscal_year])
+        if fiscal_year in cached:
+            return cached[fiscal_year]
+        try:
+            # Latest statutory default at or before the fiscal year
+            response = execute(supabase.table("tax_brackets").select(TAX_BRACKET_COLUMNS).is_(
+                "company_id", "null"
+            ).eq("is_default", True).lte("fiscal_year", fiscal_year).order(
+                "fiscal_year", desc=True
+            ).limit(1))
+        except Exception as e:
+            logger.warning(f"Could not load default tax bracket for {fiscal_year}: {e}; using flat {FLAT_TAX_RATE:.0%}")
+            return FLAT_TABLE
+        if not response.data:
+            logger.warning(f"No default tax bracket for fiscal year {fiscal_year}; using flat {FLAT_TAX_RATE:.0%}")
+            table = FLAT_TABLE
+        else:
+            table = SlabTable(response.data[0])
+        with self._lock:
+            self._defaults[fiscal_year] = (time.monotonic() + self.ttl_seconds, table)
+        return table
+
+
+# Singleton instance
+tax_bracket_service = TaxBracketService(settings.TAX_BRACKET_CACHE_TTL_SECONDS)
@@ -0,0 +1,67 @@
+"""
+Fiscal-year YTD totals per employee
+
+- Totals live in employee_ytd_totals (one row per employee and fiscal year,
+  April-March), kept up to date by triggers on payslips, corrections included
+- ytd_query() builds the single primary-key lookup (for concurrent plans);
+  get_ytd_totals() runs it
+- format_ytd() shapes a row for AI contexts, dashboards and exports
+"""
+
+from app.core.db import aexecute
+from app.core.supabase import get_supabase_admin_client
+from datetime import date, datetime
+from typing import Any, Dict, Optional
+
+YTD_COLUMNS = "fiscal_year, gross_ytd, deductions_ytd, tax_ytd, net_ytd, payslip_count, last_pay_period_end"
+
+# Fiscal years start in April
+FISCAL_YEAR_START_MONTH = 4
+
+
+def fiscal_year_of(day: Optional[date] = None) -> int:
+    """Calendar year in which the fiscal year containing `day` (default today) starts"""
+    day = day or datetime.utcnow().date()
+    return day.year if day.month >= FISCAL_YEAR_START_MONTH else day.year - 1
+
+
+def fiscal_year_start(fiscal_year: int) -> date:
+    return date(fiscal_year, FISCAL_YEAR_START_MONTH, 1)
+
+
+def ytd_query(supabase, employee_id: str, fiscal_year: Optional[int] = None):
+    """Query builder for one employee's YTD row (returns 0 or 1 rows)"""
+    return supabase.table("employee_ytd_totals").select(YTD_COLUMNS).eq(
+        "employee_id", employee_id
+    ).eq("fiscal_year", fiscal_year if fiscal_year is not None else fiscal_year_of()).limit(1)
+
+
+def format_ytd(row: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """Shape a YTD row, e.g. {"fiscal_year": "2025-26", "gross_ytd": ..., "months_included": 7}"""
+    if not row:
+        return None
+    fiscal_year = int(row["fiscal_year"])
+    return {
+        "fiscal_year": f"{fiscal_year}-{(fiscal_year + 1) % 100:02d}",
+        "gross_ytd": float(row.get("gross_ytd") or 0),
+        "deductions_ytd": float(row.get("deductions_ytd") or 0),
+        "tax_ytd": float(row.get("tax_ytd") or 0),
+        "net_ytd": float(row.get("net_ytd") or 0),
+        "months_included": int(row.get("payslip_count") or 0),
+        "last_pay_period_end": row.get("last_pay_period_end"),
+    }
+
+
+async def get_ytd_totals(employee_id: str, fiscal_year: Optional[int] = None) -> Optional[Dict[str, Any]]:
+    """
+    Fetch an employee's YTD totals
+
+    Args:
+        employee_id: Employee ID
+        fiscal_year: Start year of the fiscal year (default: the current one)
+
+    Returns:
+        format_ytd() of the row, or None if the employee has no payslips that year
+    """
+    response = await aexecute(ytd_query(get_supabase_admin_client(), employee_id, fiscal_year))
+    return format_ytd(response.data[0] if response.data else None)
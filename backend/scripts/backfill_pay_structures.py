@@ -0,0 +1,97 @@
+"""
+Convert payslips written before pay structure deduplication
+
+Reads payslips whose structure_hash is NULL in batches (keyset by ID), splits
+each full pay_data_snapshot with app.services.snapshot_store.dehydrate(),
+inserts the batch's distinct structures into pay_structure_snapshots and
+writes structure_hash plus the slimmed per-payslip snapshot back in one upsert
+per batch. Rehydrated snapshots equal the originals, so readers (and the
+fingerprints of stored AI answers) see no change. Safe to stop and re-run.
+
+Usage (from backend/, with the Supabase service key in .env):
+    python scripts/backfill_pay_structures.py [--batch-size 500] [--max-batches N] [--dry-run]
+"""
+
+from pathlib import Path
+import argparse
+import json
+import sys
+import time
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app.core.db import execute  # noqa: E402
+from app.core.supabase import get_supabase_admin_client  # noqa: E402
+from app.services.snapshot_store import dehydrate, snapshot_store  # noqa: E402
+
+# Every NOT NULL column is sent so the upsert's insert path is valid; only these are updated
+BACKFILL_COLUMNS = "id, payroll_id, employee_id, gross_pay, total_deductions, net_pay, pay_data_snapshot"
+
+
+def _size(value) -> int:
+    return len(json.dumps(value, separators=(",", ":")).encode("utf-8"))
+
+
+def backfill_batch(supabase, after_id, batch_size: int, dry_run: bool):
+    """
+    Convert one batch
+
+    Returns:
+        (rows read, distinct structures, snapshot bytes before, bytes after, last ID)
+    """
+    query = supabase.table("payslips").select(BACKFILL_COLUMNS).is_("structure_hash", "null")
+    if after_id:
+        query = query.gt("id", after_id)
+    rows = execute(query.order("id").limit(batch_size)).data or []
+    if not rows:
+        return 0, 0, 0, 0, after_id
+
+    structures = {}
+    updates = []
+    before = after = 0
+    for row in rows:
+        snapshot = row.get("pay_data_snapshot") or {}
+        structure_hash, structure, variable = dehydrate(snapshot)
+        structures[structure_hash] = structure
+        updates.append({**row, "pay_data_snapshot": variable, "structure_hash": structure_hash})
+        before += _size(snapshot)
+        after += _size(variable)
+    after += sum(_size(s) for s in structures.values())
+
+    if not dry_run:
+        snapshot_store.store_structures(supabase, structures)
+        execute(supabase.table("payslips").upsert(updates, on_conflict="id"))
+    return len(rows), len(structures), before, after, rows[-1]["id"]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--max-batches", type=int, default=0, help="Stop after N batches (0: until done)")
+    parser.add_argument("--dry-run", action="store_true", help="Read and report only")
+    args = parser.parse_args()
+
+    supabase = get_supabase_admin_client()
+    after_id = None
+    batches = converted = before_total = after_total = 0
+    started = time.perf_counter()
+    while not args.max_batches or batches < args.max_batches:
+        count, distinct, before, after, after_id = backfill_batch(supabase, after_id, args.batch_size, args.dry_run)
+        if not count:
+            break
+        batches += 1
+        converted += count
+        before_total += before
+        after_total += after
+        print(f"batch {batches}: {count} payslips, {distinct} structures, last id {after_id}")
+
+    elapsed = time.perf_counter() - started
+    verb = "would convert" if args.dry_run else "converted"
+    print(f"{verb} {converted} payslips in {batches} batches ({elapsed:.1f} s)")
+    if converted:
+        print(f"snapshot bytes: {before_total / 1024:.1f} KB -> {after_total / 1024:.1f} KB "
+              f"(at most; structures shared with other batches are counted once per batch)")
+
+
+if __name__ == "__main__":
+    main()
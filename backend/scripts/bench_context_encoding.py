@@ -0,0 +1,136 @@
+"""
+Prompt size and encoding latency: JSON vs compact context encoding
+
+Prepares synthetic contexts for each intent with prepare_context() (as the chat
+endpoints do), then assembles the full prompt with each encoding and reports
+the estimated input tokens of the context block and of the whole prompt, plus
+the time to encode the context and to assemble the prompt.
+
+Token counts are prompt_engine.estimate_tokens() estimates (characters / 3.5);
+the compact form saves whitespace and repeated keys, which real tokenizers
+charge for as well, so the ratio is the meaningful number.
+
+Usage (from backend/):
+    python scripts/bench_context_encoding.py [--repeat 5] [--months 12]
+"""
+
+from pathlib import Path
+import argparse
+import random
+import sys
+import timeit
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app.core.config import settings  # noqa: E402
+from app.services.context_encoder import ENCODING_COMPACT, ENCODING_JSON, encode_section  # noqa: E402
+from app.services.context_transform import prepare_context  # noqa: E402
+from app.services.prompt_engine import estimate_tokens, prompt_engine  # noqa: E402
+
+QUERY = "Explain my payslip and how it compares with previous months"
+
+
+def _payslip(rng: random.Random, month: int) -> dict:
+    base = rng.uniform(30000, 150000)
+    unpaid = rng.randint(0, 3)
+    end = f"2025-{month:02d}-28"
+    return {
+        "id": f"payslip-{month}",
+        "employee_id": "employee-1",
+        "created_at": f"{end}T10:22:33.123456+00:00",
+        "gross_pay": round(base * 1.3, 2),
+        "total_deductions": round(base * 0.25, 2),
+        "net_pay": round(base * 1.05, 2),
+        "pay_data_snapshot": {
+            "base_pay": round(base, 2),
+            "allowances": {"hra": round(base * 0.2, 2), "meal": 2000, "transport": 1600, "other": 500},
+            "deductions_fixed": {"pf": 1800, "professional_tax": 200},
+            "deductions_percent": {"esi": 0.75},
+            "unpaid_leave_days": unpaid,
+            "leave_deduction": round(base / 30 * unpaid, 2),
+            "tax_deduction": round(base * 0.1, 2),
+        },
+        "payrolls": {"pay_period_start": f"2025-{month:02d}-01", "pay_period_end": end},
+    }
+
+
+def _leave(rng: random.Random, status: str, i: int) -> dict:
+    day = 1 + i % 27
+    return {
+        "id": f"leave-{status}-{i}",
+        "leave_type": rng.choice(["casual", "sick", "earned"]),
+        "start_date": f"2025-{1 + i % 12:02d}-{day:02d}",
+        "end_date": f"2025-{1 + i % 12:02d}-{min(day + 2, 28):02d}",
+        "days": rng.randint(1, 3),
+        "status": status,
+        "reason": "Family function",
+    }
+
+
+def build_contexts(rng: random.Random, months: int) -> dict:
+    payslips = [_payslip(rng, 12 - i % 12) for i in range(months)]
+    ytd = {
+        "fiscal_year": "2025-26", "gross_ytd": 812400.5, "deductions_ytd": 160210.25,
+        "tax_ytd": 61000, "net_ytd": 652190.25, "months_included": 7, "last_pay_period_end": "2025-10-31",
+    }
+    balance = {"total_granted": 24, "leaves_taken": 6, "remaining_leaves": 18}
+    return {
+        "payslip_explain": {
+            "data": {"current_payslip": payslips[0], "previous_payslips": payslips[1:], "ytd_totals": ytd},
+            "page_view": "payslip_explain",
+        },
+        "payslip_tax_suggestions": {
+            "data": {"recent_payslips": payslips, "ytd_totals": ytd, "leave_balance": balance},
+        },
+        "leave_advice": {
+            "data": {
+                "leave_balances": [dict(balance, leave_type=t) for t in ("casual", "sick", "earned")],
+                "pending_leaves": [_leave(rng, "pending", i) for i in range(3)],
+                "approved_leaves": [_leave(rng, "approved", i) for i in range(10)],
+                "upcoming_holidays": [{"date": f"2025-12-{d:02d}", "name": "Holiday"} for d in (1, 8, 25)],
+            },
+        },
+        "dashboard_insights": {
+            "data": {"recent_payslips": payslips[:6], "ytd_totals": ytd, "leave_balance": balance},
+        },
+    }
+
+
+def _encode(data: dict, encoding: str) -> str:
+    return "\n".join(encode_section(key, value, encoding) for key, value in data.items())
+
+
+def _measure(intent: str, prepared: dict, encoding: str, repeat: int) -> tuple:
+    settings.PROMPT_CONTEXT_ENCODING = encoding
+    context_tokens = estimate_tokens(_encode(prepared["data"], encoding))
+    prompt_tokens = estimate_tokens(prompt_engine.assemble(QUERY, prepared, intent).text)
+    encode_s = min(timeit.repeat(lambda: _encode(prepared["data"], encoding), number=200, repeat=repeat)) / 200
+    assemble_s = min(timeit.repeat(lambda: prompt_engine.assemble(QUERY, prepared, intent), number=200, repeat=repeat)) / 200
+    return context_tokens, prompt_tokens, encode_s, assemble_s
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--months", type=int, default=12, help="Payslips of history in each context")
+    args = parser.parse_args()
+
+    contexts = build_contexts(random.Random(42), args.months)
+    print(
+        f"{'intent':<26}{'ctx json':>10}{'ctx compact':>13}{'prompt json':>13}{'prompt compact':>16}"
+        f"{'reduction':>11}{'encode ms json/compact':>25}{'assemble ms json/compact':>27}"
+    )
+    for intent, context in contexts.items():
+        prepared = prepare_context(context, intent)
+        j_ctx, j_prompt, j_enc, j_asm = _measure(intent, prepared, ENCODING_JSON, args.repeat)
+        c_ctx, c_prompt, c_enc, c_asm = _measure(intent, prepared, ENCODING_COMPACT, args.repeat)
+        print(
+            f"{intent:<26}{j_ctx:>10}{c_ctx:>13}{j_prompt:>13}{c_prompt:>16}"
+            f"{(1 - c_prompt / j_prompt) * 100:>10.0f}%"
+            f"{f'{j_enc * 1000:.3f} / {c_enc * 1000:.3f}':>25}"
+            f"{f'{j_asm * 1000:.3f} / {c_asm * 1000:.3f}':>27}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+"""
+Micro-benchmarks for AI context preparation
+
+Compares the previous three-pass pipeline (sanitize_context -> regex masking ->
+payslip compaction) with the fused single pass in app.services.context_transform
+on synthetic contexts, including a large payroll context.
+
+Usage (from backend/):
+    python scripts/bench_context_transform.py [--repeat 5]
+"""
+
+from pathlib import Path
+import argparse
+import random
+import re
+import sys
+import timeit
+import uuid
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app.services.context_transform import prepare_context, sanitize_and_mask  # noqa: E402
+
+
+# ---- previous pipeline (kept here for comparison) --------------------------
+
+_LEGACY_SENSITIVE = [
+    "bank_account", "bank_account_number", "account_number", "ifsc", "ifsc_code", "ssn",
+    "tax_id", "pan", "pan_number", "aadhaar", "aadhaar_number", "passport", "password",
+    "token", "api_key", "secret", "profile_id", "id", "employee_id", "payroll_id",
+    "created_by", "updated_by", "pdf_blob", "blob",
+]
+
+
+def _legacy_sanitize(data):
+    if isinstance(data, dict):
+        return {
+            k: _legacy_sanitize(v) for k, v in data.items()
+            if not any(s in k.lower() for s in _LEGACY_SENSITIVE)
+        }
+    if isinstance(data, list):
+        return [_legacy_sanitize(i) for i in data]
+    return data
+
+
+def _legacy_mask(data):
+    if isinstance(data, dict):
+        return {k: _legacy_mask(v) for k, v in data.items()}
+    if isinstance(data, list):
+        return [_legacy_mask(i) for i in data]
+    if isinstance(data, str):
+        if "@" in data and re.match(r".+@.+\..+", data):
+            return "***@***.***"
+        if re.search(r"\d{6,}", data):
+            return re.sub(r"\D", "", data)[:2] + "****"
+    return data
+
+
+def _legacy_compact(context):
+    data = context.get("data") if "data" in context else context
+    compact = {}
+    cur = data.get("current_payslip")
+    if cur:
+        snap = cur.get("pay_data_snapshot", {}) or {}
+        allowances = snap.get("allowances") or {}
+        payrolls = cur.get("payrolls") or {}
+        compact["current_payslip"] = {
+            "base_pay": snap.get("base_pay"),
+            "allowances": {k: allowances.get(k) for k in ("hra", "meal", "transport", "other") if k in allowances},
+            "gross_pay": cur.get("gross_pay"),
+            "total_deductions": cur.get("total_deductions") or snap.get("total_deductions"),
+            "net_pay": cur.get("net_pay"),
+            "pay_period_start": payrolls.get("pay_period_start"),
+            "pay_period_end": payrolls.get("pay_period_end"),
+        }
+    prev = data.get("previous_payslips")
+    if prev:
+        compact["previous_payslips"] = [{
+            "created_at": p.get("created_at"),
+            "gross_pay": p.get("gross_pay"),
+            "net_pay": p.get("net_pay"),
+            "leave_deduction": (p.get("pay_data_snapshot") or {}).get("leave_deduction"),
+            "total_deductions": p.get("total_deductions"),
+        } for p in prev[:12]]
+    return {"data": compact}
+
+
+def legacy_pipeline(context):
+    return _legacy_compact(_legacy_mask(_legacy_sanitize(context)))
+
+
+# ---- synthetic data ----------------------------------------------------------
+
+def _payslip(rng: random.Random) -> dict:
+    base = rng.uniform(30000, 150000)
+    return {
+        "id": str(uuid.uuid4()),
+        "payroll_id": str(uuid.uuid4()),
+        "employee_id": str(uuid.uuid4()),
+        "created_by": str(uuid.uuid4()),
+        "created_at": "2025-01-31T10:22:33.123456+00:00",
+        "pdf_blob": "JVBERi0xLjQK" * 400,
+        "gross_pay": base * 1.3,
+        "total_deductions": base * 0.25,
+        "net_pay": base * 1.05,
+        "pay_data_snapshot": {
+            "base_pay": base,
+            "allowances": {"hra": base * 0.2, "meal": 2000, "transport": 1600, "other": 500, "bank_account": "123456789012"},
+            "deductions_fixed": {"pf": 1800, "professional_tax": 200},
+            "deductions_percent": {"esi": 0.75},
+            "unpaid_leave_days": rng.randint(0, 3),
+            "leave_deduction": rng.uniform(0, 5000),
+            "tax_deduction": base * 0.1,
+        },
+        "payrolls": {"pay_period_start": "2025-01-01", "pay_period_end": "2025-01-31"},
+    }
+
+
+def build_contexts(rng: random.Random, payroll_size: int) -> dict:
+    payslips = [_payslip(rng) for _ in range(12)]
+    meta = {"employee_name": "Asha Rao", "employee_email": "asha.rao@example.com", "employee_phone": "+91 98765 43210"}
+    return {
+        "payslip_explain": {
+            "data": {
+                "current_payslip": payslips[0],
+                "previous_payslips": payslips[1:],
+                "ytd_totals": {"gross_ytd": 1.2e6, "net_ytd": 9.8e5, "months_included": 12},
+            },
+            "meta": meta,
+            "page_view": "payslip_explain",
+        },
+        "dashboard_insights": {
+            "data": {
+                "recent_payslips": payslips,
+                "leave_balance": {"id": str(uuid.uuid4()), "total_granted": 24, "leaves_taken": 6, "remaining_leaves": 18},
+            },
+            "meta": meta,
+            "page_view": "dashboard_insights",
+        },
+        f"large payroll ({payroll_size} payslips)": {
+            "data": {"payslips": [_payslip(rng) for _ in range(payroll_size)]},
+            "meta": meta,
+        },
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--payroll-size", type=int, default=5000)
+    args = parser.parse_args()
+
+    contexts = build_contexts(random.Random(42), args.payroll_size)
+    print(f"{'context':<32}{'legacy ms':>12}{'fused ms':>12}{'sanitize+mask ms':>18}{'speedup':>10}")
+    for name, context in contexts.items():
+        intent = name if name in ("payslip_explain", "dashboard_insights") else None
+        number = 1 if intent is None else 200
+        legacy = min(timeit.repeat(lambda: legacy_pipeline(context), number=number, repeat=args.repeat)) / number
+        fused = min(timeit.repeat(lambda: prepare_context(context, intent), number=number, repeat=args.repeat)) / number
+        walk = min(timeit.repeat(lambda: sanitize_and_mask(context), number=number, repeat=args.repeat)) / number
+        print(f"{name:<32}{legacy * 1000:>12.3f}{fused * 1000:>12.3f}{walk * 1000:>18.3f}{legacy / fused:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
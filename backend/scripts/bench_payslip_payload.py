@@ -0,0 +1,165 @@
+"""
+Payload size of payslip reads: select("*") vs the named projections
+
+Builds payslip rows the way PostgREST returns them (the base64 PDF in a BYTEA
+column comes back hex-encoded) and compares the JSON response size of each hot
+read path before and after moving PDFs to payslip_documents. The analysis
+loader case compares payslips(*) with PAYSLIP_ANALYSIS. The stored snapshots
+case compares a year of full pay_data_snapshot values with per-payslip fields
+plus one content-addressed structure per employee (snapshot_store).
+
+Usage (from backend/):
+    python scripts/bench_payslip_payload.py [--employees 500] [--pdf-kb 4]
+"""
+
+from pathlib import Path
+import argparse
+import base64
+import json
+import os
+import random
+import sys
+import uuid
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app.core.projections import PAYSLIP_ANALYSIS, PAYSLIP_DETAIL, PAYSLIP_SUMMARY  # noqa: E402
+from app.services.snapshot_store import dehydrate  # noqa: E402
+
+PERIOD = {"pay_period_start": "2025-01-01", "pay_period_end": "2025-01-31"}
+
+
+def _columns(projection: str) -> list:
+    """Top-level column names of a projection (embedded resources excluded)"""
+    return [c.strip() for c in projection.split(",") if c.strip() and "(" not in c and ")" not in c]
+
+
+def _pdf_blob(pdf_kb: int) -> str:
+    """A PDF as stored by process_payroll and returned by PostgREST (hex of base64)"""
+    pdf = b"%PDF-1.4\n" + os.urandom(pdf_kb * 1024)
+    return "\\x" + base64.b64encode(pdf).hex()
+
+
+def _payslip(rng: random.Random, pdf_kb: int) -> dict:
+    base = rng.uniform(30000, 150000)
+    return {
+        "id": str(uuid.uuid4()),
+        "payroll_id": str(uuid.uuid4()),
+        "employee_id": str(uuid.uuid4()),
+        "pay_data_snapshot": {
+            "base_pay": base,
+            "allowances": {"hra": base * 0.2, "meal": 2000, "transport": 1600},
+            "deductions_fixed": {"pf": 1800, "professional_tax": 200},
+            "deductions_percent": {"esi": 0.75},
+            "unpaid_leave_days": rng.randint(0, 3),
+            "leave_deduction": rng.uniform(0, 5000),
+            "tax_deduction": base * 0.1,
+        },
+        "gross_pay": round(base * 1.3, 2),
+        "total_deductions": round(base * 0.25, 2),
+        "net_pay": round(base * 1.05, 2),
+        "pdf_blob": _pdf_blob(pdf_kb),
+        "correction_of": None,
+        "created_by": str(uuid.uuid4()),
+        "created_at": "2025-01-31T10:22:33.123456+00:00",
+    }
+
+
+def _project(rows: list, projection: str) -> list:
+    columns = _columns(projection)
+    return [{c: row[c] for c in columns if c in row} for row in rows]
+
+
+def _project_analysis(rows: list) -> list:
+    """PAYSLIP_ANALYSIS rows: plain columns plus alias:pay_data_snapshot->key extractions"""
+    projected = []
+    for row in rows:
+        out = {}
+        for column in (c.strip() for c in PAYSLIP_ANALYSIS.split(",")):
+            if ":" in column:
+                alias, path = column.split(":", 1)
+                out[alias] = row["pay_data_snapshot"].get(path.split("->", 1)[1])
+            else:
+                out[column] = row.get(column)
+        projected.append(out)
+    return projected
+
+
+def _year_of_snapshots(run: list, rng: random.Random) -> list:
+    """The run's snapshots (as payroll_calculator writes them) for 12 months: same structures, different leave"""
+    bracket_id = str(uuid.uuid4())
+    snapshots = []
+    for _ in range(12):
+        for row in run:
+            leave_days = rng.randint(0, 3) if rng.random() < 0.1 else 0
+            snapshot = row["pay_data_snapshot"]
+            snapshots.append(dict(
+                snapshot,
+                base_pay=round(snapshot["base_pay"], 2),
+                allowances={k: round(v, 2) for k, v in snapshot["allowances"].items()},
+                unpaid_leave_days=leave_days,
+                leave_deduction=round(snapshot["base_pay"] / 30 * leave_days, 2),
+                tax_deduction=round(snapshot["tax_deduction"], 2),
+                tax_bracket_id=bracket_id,
+                tax_regime="new",
+            ))
+    return snapshots
+
+
+def _deduplicated(snapshots: list) -> dict:
+    """Per-payslip fields plus each distinct structure once"""
+    structures, variable = {}, []
+    for snapshot in snapshots:
+        structure_hash, structure, fields = dehydrate(snapshot)
+        structures[structure_hash] = structure
+        variable.append({"structure_hash": structure_hash, "pay_data_snapshot": fields})
+    return {"payslips": variable, "pay_structure_snapshots": structures}
+
+
+def _size(payload) -> int:
+    return len(json.dumps(payload, separators=(",", ":")).encode("utf-8"))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--employees", type=int, default=500)
+    parser.add_argument("--pdf-kb", type=int, default=4, help="Size of each generated PDF")
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    history = [dict(_payslip(rng, args.pdf_kb), payrolls=PERIOD) for _ in range(12)]
+    run = [_payslip(rng, args.pdf_kb) for _ in range(args.employees)]
+
+    year = _year_of_snapshots(run, rng)
+
+    cases = {
+        "chat enrichment (12 payslips)": (
+            history,
+            [dict(row, payrolls=PERIOD) for row in _project(history, PAYSLIP_DETAIL)],
+        ),
+        f"payroll analysis ({args.employees} payslips)": (
+            {"payslips": run},
+            {"payslips": _project(run, PAYSLIP_DETAIL)},
+        ),
+        f"analysis loader ({args.employees} payslips)": (
+            {"payslips": run},
+            _project_analysis(run),
+        ),
+        f"payslip list ({args.employees} payslips)": (
+            run,
+            _project(run, PAYSLIP_SUMMARY),
+        ),
+        f"stored snapshots ({len(year)} payslips)": (
+            [{"pay_data_snapshot": snapshot} for snapshot in year],
+            _deduplicated(year),
+        ),
+    }
+
+    print(f"{'read path':<36}{'select(*) KB':>14}{'projection KB':>15}{'reduction':>11}")
+    for name, (before, after) in cases.items():
+        size_before, size_after = _size(before), _size(after)
+        print(f"{name:<36}{size_before / 1024:>14.1f}{size_after / 1024:>15.1f}{size_before / size_after:>10.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+TDS throughput: per-employee slab loop vs the vectorized slab tables
+
+Builds the statutory FY 2025-26 new and old regime tables, assigns N employees
+to them at random with monthly gross pay between 20k and 5 lakh, and times
+app.services.tax_engine (one pass over all employees) against a per-employee
+loop over the slabs. Both must agree to the paisa.
+
+Usage (from backend/):
+    python scripts/bench_tax_engine.py [--employees 50000] [--repeat 3]
+"""
+
+from pathlib import Path
+import argparse
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app.services.tax_engine import SlabTable, TaxTables  # noqa: E402
+
+NEW_REGIME = {
+    "id": "new-2025", "name": "New regime FY 2025-26", "regime": "new", "fiscal_year": 2025,
+    "slabs": [
+        {"up_to": 400000, "rate": 0}, {"up_to": 800000, "rate": 5}, {"up_to": 1200000, "rate": 10},
+        {"up_to": 1600000, "rate": 15}, {"up_to": 2000000, "rate": 20}, {"up_to": 2400000, "rate": 25},
+        {"up_to": None, "rate": 30},
+    ],
+    "standard_deduction": 75000, "rebate_limit": 1200000, "rebate_max": 60000,
+    "rebate_marginal_relief": True, "cess_percent": 4,
+}
+OLD_REGIME = {
+    "id": "old-2025", "name": "Old regime FY 2025-26", "regime": "old", "fiscal_year": 2025,
+    "slabs": [
+        {"up_to": 250000, "rate": 0}, {"up_to": 500000, "rate": 5}, {"up_to": 1000000, "rate": 20},
+        {"up_to": None, "rate": 30},
+    ],
+    "standard_deduction": 50000, "rebate_limit": 500000, "rebate_max": 12500,
+    "rebate_marginal_relief": False, "cess_percent": 4,
+}
+
+
+def _loop_tds(bracket, monthly_gross: float) -> float:
+    """Per-employee reference: walk the slabs"""
+    taxable = max(monthly_gross * 12 - bracket["standard_deduction"], 0.0)
+    tax, lower = 0.0, 0.0
+    for slab in bracket["slabs"]:
+        upper = float("inf") if slab["up_to"] is None else slab["up_to"]
+        tax += max(0.0, min(taxable, upper) - lower) * slab["rate"] / 100
+        lower = upper
+    if taxable <= bracket["rebate_limit"]:
+        tax = max(tax - bracket["rebate_max"], 0.0)
+    elif bracket["rebate_marginal_relief"]:
+        tax = min(tax, taxable - bracket["rebate_limit"])
+    return round(tax * (1 + bracket["cess_percent"] / 100) / 12, 2)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--employees", type=int, default=50000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(42)
+    gross = rng.uniform(20000, 500000, args.employees)
+    regimes = rng.choice(["new", "old", None], args.employees).tolist()
+    brackets = {"new": NEW_REGIME, "old": OLD_REGIME, None: NEW_REGIME}
+
+    tables = TaxTables([SlabTable(NEW_REGIME), SlabTable(OLD_REGIME)])
+
+    def vectorized():
+        return tables.monthly_tds(tables.index(regimes), gross)
+
+    def loop():
+        return [_loop_tds(brackets[b], g) for b, g in zip(regimes, gross.tolist())]
+
+    loop_s = min(_timed(loop) for _ in range(args.repeat))
+    vector_s = min(_timed(vectorized) for _ in range(args.repeat))
+    mismatches = int(np.sum(np.abs(vectorized() - np.array(loop())) > 0.01))
+
+    print(f"employees: {args.employees}, tables: {len(tables.tables)}")
+    print(f"per-employee slab loop: {loop_s * 1000:8.1f} ms")
+    print(f"vectorized slab tables: {vector_s * 1000:8.1f} ms ({loop_s / vector_s:.0f}x)")
+    print(f"mismatches (> 1 paisa): {mismatches}")
+
+
+def _timed(fn) -> float:
+    start = time.perf_counter()
+    fn()
+    return time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    main()
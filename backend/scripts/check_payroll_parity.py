@@ -0,0 +1,120 @@
+"""
+Parity of in-database payroll computation with the Python calculator
+
+Computes one company's pay period both ways without writing anything: the
+payroll_amounts() SQL function (what process_payroll_in_db inserts) through
+RPC, and app.services.payroll_calculator.calculate_payslips() on the same
+employees, leave and tax regimes (what process_payroll computes below
+PAYROLL_IN_DB_MIN_EMPLOYEES). Every employee's gross pay, leave deduction,
+TDS, total deductions and net pay must agree to the paisa; exits non-zero
+otherwise. Run it against a local stack (supabase start) with seeded data or
+against a staging project.
+
+Usage (from backend/, with the Supabase service key in .env):
+    python scripts/check_payroll_parity.py --company-id <uuid> --period-start 2025-06-01 --period-end 2025-06-30
+"""
+
+from pathlib import Path
+from datetime import date
+import argparse
+import sys
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app.core.db import execute  # noqa: E402
+from app.core.projections import EMPLOYEE_PAY_INPUTS  # noqa: E402
+from app.core.supabase import get_supabase_admin_client  # noqa: E402
+from app.services.payroll_calculator import calculate_payslips, fetch_unpaid_leave_days, salary_structure  # noqa: E402
+from app.services.tax_engine import tax_bracket_service  # noqa: E402
+from app.services.ytd_service import fiscal_year_of  # noqa: E402
+
+TOLERANCE = 0.01
+
+COMPARED = (
+    ("gross_pay", lambda row: row["gross_pay"]),
+    ("leave_deduction", lambda row: row["pay_data_snapshot"]["leave_deduction"]),
+    ("tax_deduction", lambda row: row["pay_data_snapshot"]["tax_deduction"]),
+    ("total_deductions", lambda row: row["total_deductions"]),
+    ("net_pay", lambda row: row["net_pay"]),
+)
+
+
+def _paged(query_for_page, page_size: int):
+    """All rows of a query, page by page (PostgREST caps rows per response)"""
+    rows, start = [], 0
+    while True:
+        page = execute(query_for_page().range(start, start + page_size - 1)).data or []
+        rows.extend(page)
+        if len(page) < page_size:
+            return rows
+        start += page_size
+
+
+def python_amounts(supabase, company_id: str, period_start: str, period_end: str, page_size: int):
+    """Employee ID -> calculate_payslips() result, as process_payroll computes it"""
+    employees = _paged(lambda: supabase.table("employees").select(EMPLOYEE_PAY_INPUTS).eq(
+        "company_id", company_id
+    ).eq("is_active", True).order("id"), page_size)
+    payable = [e for e in employees if salary_structure(e) is not None]
+    leave_days = fetch_unpaid_leave_days(supabase, period_start, period_end)
+    tax_tables = tax_bracket_service.tables(
+        supabase,
+        company_id,
+        (salary_structure(e).get("tax_regime") for e in payable),
+        fiscal_year_of(date.fromisoformat(period_end))
+    )
+    calculated = calculate_payslips(payable, leave_days, tax_tables)
+    return {e["id"]: row for e, row in zip(payable, calculated)}
+
+
+def database_amounts(supabase, company_id: str, period_start: str, period_end: str, page_size: int):
+    """Employee ID -> payroll_amounts() row, as process_payroll_in_db inserts it"""
+    params = {"p_company_id": company_id, "p_period_start": period_start, "p_period_end": period_end}
+    rows = _paged(lambda: supabase.rpc("payroll_amounts", params).order("employee_id"), page_size)
+    return {row["employee_id"]: row for row in rows}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--company-id", required=True)
+    parser.add_argument("--period-start", required=True, help="ISO date")
+    parser.add_argument("--period-end", required=True, help="ISO date")
+    parser.add_argument("--page-size", type=int, default=1000)
+    parser.add_argument("--show", type=int, default=10, help="Mismatches to print")
+    args = parser.parse_args()
+
+    supabase = get_supabase_admin_client()
+    expected = python_amounts(supabase, args.company_id, args.period_start, args.period_end, args.page_size)
+    actual = database_amounts(supabase, args.company_id, args.period_start, args.period_end, args.page_size)
+
+    missing = sorted(set(expected) - set(actual))
+    extra = sorted(set(actual) - set(expected))
+    mismatches = []
+    for employee_id in sorted(set(expected) & set(actual)):
+        for field, value_of in COMPARED:
+            py_value = float(value_of(expected[employee_id]) or 0)
+            db_value = float(value_of(actual[employee_id]) or 0)
+            if abs(py_value - db_value) > TOLERANCE:
+                mismatches.append((employee_id, field, py_value, db_value))
+        py_bracket = expected[employee_id]["pay_data_snapshot"].get("tax_bracket_id")
+        db_bracket = actual[employee_id]["pay_data_snapshot"].get("tax_bracket_id")
+        if py_bracket != db_bracket:
+            mismatches.append((employee_id, "tax_bracket_id", py_bracket, db_bracket))
+
+    print(f"employees: {len(expected)} in Python, {len(actual)} in database")
+    print(f"only in Python: {len(missing)}, only in database: {len(extra)}")
+    print(f"mismatches (> {TOLERANCE} on {', '.join(f for f, _ in COMPARED)}, or tax bracket): {len(mismatches)}")
+    for employee_id in (missing + extra)[:args.show]:
+        print(f"  {employee_id}: computed by one path only")
+    for employee_id, field, py_value, db_value in mismatches[:args.show]:
+        print(f"  {employee_id} {field}: python {py_value} database {db_value}")
+    for label, values in (("gross", "gross_pay"), ("net", "net_pay")):
+        py_total = sum(float(row[values]) for row in expected.values())
+        db_total = sum(float(row[values]) for row in actual.values())
+        print(f"total {label}: python {py_total:.2f} database {db_total:.2f}")
+
+    sys.exit(1 if missing or extra or mismatches else 0)
+
+
+if __name__ == "__main__":
+    main()
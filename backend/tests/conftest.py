@@ -0,0 +1,64 @@
+"""
+Shared test setup
+
+Settings are read when app modules are imported, so the required variables get
+placeholder values before any test imports the app.
+"""
+
+from pathlib import Path
+import os
+import sys
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+for name in ("SUPABASE_URL", "SUPABASE_ANON_KEY", "SUPABASE_SERVICE_KEY", "GEMINI_API_KEY"):
+    os.environ.setdefault(name, "http://localhost" if name == "SUPABASE_URL" else "test")
+
+from google import genai  # noqa: E402
+import pytest  # noqa: E402
+
+from app.core.config import settings  # noqa: E402
+from app.services.gemini_service import GeminiService  # noqa: E402
+
+from tests.gemini_stub import StubGemini  # noqa: E402
+
+
+@pytest.fixture
+def stub_gemini():
+    """A local fake Gemini endpoint (see tests/gemini_stub.py)"""
+    stub = StubGemini()
+    stub.start()
+    try:
+        yield stub
+    finally:
+        stub.stop()
+
+
+@pytest.fixture
+def make_service(stub_gemini, monkeypatch):
+    """GeminiService built from settings overrides, pointed at the stub"""
+    def make(**overrides):
+        values = {
+            "GEMINI_BASE_URL": stub_gemini.url,
+            "GEMINI_MAX_RETRIES": 0,
+            "GEMINI_RETRY_BASE_DELAY_SECONDS": 0.01,
+            "GEMINI_RETRY_MAX_DELAY_SECONDS": 0.01,
+            "GEMINI_TIMEOUT_SECONDS": 5.0,
+            "GEMINI_HEDGE_AFTER_SECONDS": 0.0,
+            "RESPONSE_CACHE_ENABLED": False,
+            **overrides,
+        }
+        for name, value in values.items():
+            monkeypatch.setattr(settings, name, value)
+        return GeminiService()
+    return make
+
+
+def stream_into(service: GeminiService, received: list):
+    """Coroutine consuming one _stream_model() generation into received"""
+    config = genai.types.GenerateContentConfig(max_output_tokens=100)
+
+    async def consume():
+        async for piece in service._stream_model("prompt", config, "cache-key"):
+            received.append(piece)
+    return consume()
@@ -0,0 +1,150 @@
+"""
+In-memory stand-in for the Supabase client's query builder
+
+Supports the subset of PostgREST filters the services use on reads
+(eq/neq/gt/gte/lt/lte/in_/is_, not_, or_ over eq/is, order, limit, range,
+single). Rows are plain dicts; embedded resources are stored on the row (e.g.
+"payrolls": {...}) and filtered with dotted names ("payrolls.pay_period_start").
+Selected columns are ignored: every row comes back whole.
+
+Writes: insert, upsert (on_conflict column) and filtered update. An exception
+set in FakeSupabase.errors[table] is raised by writes to that table.
+"""
+
+from typing import Any, Callable, Dict, List, Optional
+import operator
+
+
+class _Response:
+    def __init__(self, data: Any, count: Optional[int] = None):
+        self.data = data
+        self.count = count
+
+
+def _value(row: Dict[str, Any], column: str) -> Any:
+    for part in column.split("."):
+        row = (row or {}).get(part) if isinstance(row, dict) else None
+    return row
+
+
+class _Query:
+    def __init__(self, rows: List[Dict[str, Any]], error: Optional[Exception] = None):
+        self._rows = rows
+        self._error = error
+        self._write: Optional[Callable[[List[Dict[str, Any]]], List[Dict[str, Any]]]] = None
+        self._filters: List[Callable[[Dict[str, Any]], bool]] = []
+        self._order: List[tuple] = []
+        self._limit: Optional[int] = None
+        self._offset = 0
+        self._single = False
+        self._negate = False
+
+    def select(self, *columns, **kwargs) -> "_Query":
+        return self
+
+    def insert(self, rows, **kwargs) -> "_Query":
+        new = [dict(row) for row in (rows if isinstance(rows, list) else [rows])]
+        self._write = lambda matched: self._rows.extend(new) or new
+        return self
+
+    def upsert(self, rows, on_conflict: str = "id", ignore_duplicates: bool = False, **kwargs) -> "_Query":
+        def write(matched):
+            written = []
+            for row in (rows if isinstance(rows, list) else [rows]):
+                existing = next((r for r in self._rows if r.get(on_conflict) == row.get(on_conflict)), None)
+                if existing is None:
+                    self._rows.append(dict(row))
+                    written.append(dict(row))
+                elif not ignore_duplicates:
+                    existing.update(row)
+                    written.append(existing)
+            return written
+        self._write = write
+        return self
+
+    def update(self, values: Dict[str, Any], **kwargs) -> "_Query":
+        self._write = lambda matched: [row.update(values) or row for row in matched]
+        return self
+
+    def _filter(self, column: str, test: Callable[[Any], bool]) -> "_Query":
+        negate, self._negate = self._negate, False
+        self._filters.append(lambda row: test(_value(row, column)) != negate)
+        return self
+
+    def _compare(self, op) -> Callable:
+        return lambda column, value: self._filter(column, lambda v: v is not None and op(v, value))
+
+    def __getattr__(self, name: str):
+        ops = {"eq": operator.eq, "neq": operator.ne, "gt": operator.gt, "gte": operator.ge, "lt": operator.lt, "lte": operator.le}
+        if name in ops:
+            return self._compare(ops[name])
+        raise AttributeError(name)
+
+    def in_(self, column: str, values) -> "_Query":
+        values = list(values)
+        return self._filter(column, lambda v: v in values)
+
+    def is_(self, column: str, value) -> "_Query":
+        expected = None if value in (None, "null") else value
+        return self._filter(column, lambda v: v is expected or v == expected)
+
+    def or_(self, filters: str) -> "_Query":
+        """Comma-separated column.operator.value filters, e.g. "company_id.is.null,company_id.eq.x" """
+        tests = []
+        for item in filters.split(","):
+            column, op, value = item.split(".", 2)
+            if op == "is":
+                tests.append(lambda row, c=column, v=value: _value(row, c) is None if v == "null" else _value(row, c) == v)
+            elif op == "eq":
+                tests.append(lambda row, c=column, v=value: str(_value(row, c)) == v)
+            else:
+                raise NotImplementedError(f"or_ operator {op}")
+        self._filters.append(lambda row: any(test(row) for test in tests))
+        return self
+
+    @property
+    def not_(self) -> "_Query":
+        self._negate = True
+        return self
+
+    def order(self, column: str, desc: bool = False, **kwargs) -> "_Query":
+        self._order.append((column, desc))
+        return self
+
+    def limit(self, count: int, **kwargs) -> "_Query":
+        self._limit = count
+        return self
+
+    def range(self, start: int, end: int) -> "_Query":
+        self._offset, self._limit = start, end - start + 1
+        return self
+
+    def single(self) -> "_Query":
+        self._single = True
+        return self
+
+    maybe_single = single
+
+    def execute(self) -> _Response:
+        rows = [row for row in self._rows if all(f(row) for f in self._filters)]
+        if self._write is not None:
+            if self._error is not None:
+                raise self._error
+            return _Response(self._write(rows))
+        for column, desc in reversed(self._order):
+            rows.sort(key=lambda row: (_value(row, column) is None, _value(row, column) or ""), reverse=desc)
+        rows = rows[self._offset:]
+        if self._limit is not None:
+            rows = rows[:self._limit]
+        if self._single:
+            return _Response(rows[0] if rows else None)
+        return _Response(rows, count=len(rows))
+
+
+class FakeSupabase:
+    def __init__(self, tables: Optional[Dict[str, List[Dict[str, Any]]]] = None):
+        self.tables: Dict[str, List[Dict[str, Any]]] = tables or {}
+        self.errors: Dict[str, Exception] = {}
+
+    def table(self, name: str) -> _Query:
+        return _Query(self.tables.setdefault(name, []), self.errors.get(name))
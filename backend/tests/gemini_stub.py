@@ -0,0 +1,113 @@
+"""
+Local fake of the Gemini REST endpoint
+
+Serves generateContent and streamGenerateContent (SSE) for any model on a
+random local port, so GeminiService can be pointed at it with GEMINI_BASE_URL.
+Behaviour is set per test:
+
+- delay: seconds before answering (or failing)
+- failures: HTTP status codes returned by the next requests, in order
+- chunks / chunk_delay: streamed text pieces and the pause before each one
+  after the first
+
+It counts requests and the peak number of requests in flight.
+"""
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List
+import json
+import threading
+import time
+
+
+def _response(text: str) -> dict:
+    return {
+        "candidates": [{
+            "content": {"role": "model", "parts": [{"text": text}]},
+            "finishReason": "STOP",
+            "index": 0,
+        }],
+        "usageMetadata": {"promptTokenCount": 1, "candidatesTokenCount": 1, "totalTokenCount": 2},
+    }
+
+
+class StubGemini:
+    def __init__(self):
+        self.text = "stub answer"
+        self.chunks: List[str] = ["Hello", " world"]
+        self.chunk_delay = 0.0
+        self.delay = 0.0
+        self.failures: List[int] = []
+        self.requests = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self._server.server_address[1]}"
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _enter(self):
+        with self._lock:
+            self.requests += 1
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            return self.failures.pop(0) if self.failures else None
+
+    def _leave(self) -> None:
+        with self._lock:
+            self.in_flight -= 1
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get("Content-Length") or 0))
+                failure = stub._enter()
+                try:
+                    time.sleep(stub.delay)
+                    if failure:
+                        self._send_json(failure, {"error": {"code": failure, "message": "stub failure", "status": "UNAVAILABLE"}})
+                    elif "streamGenerateContent" in self.path:
+                        self._stream()
+                    else:
+                        self._send_json(200, _response(stub.text))
+                except (BrokenPipeError, ConnectionResetError):
+                    pass  # the client gave up (deadline)
+                finally:
+                    stub._leave()
+
+            def _send_json(self, code: int, payload: dict) -> None:
+                body = json.dumps(payload).encode("utf-8")
+                self.send_response(code)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _stream(self) -> None:
+                # HTTP/1.0: the body ends when the connection closes
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.end_headers()
+                for i, chunk in enumerate(stub.chunks):
+                    if i:
+                        time.sleep(stub.chunk_delay)
+                    self.wfile.write(f"data: {json.dumps(_response(chunk))}\r\n\r\n".encode("utf-8"))
+                    self.wfile.flush()
+
+        return Handler
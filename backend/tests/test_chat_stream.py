@@ -0,0 +1,46 @@
+"""
+Streamed chat answers when the model fails
+"""
+
+import asyncio
+
+from app.api.v1.endpoints.chat import _record_stream
+from app.services.conversation_store import conversation_store
+from app.services.sse import sse_event_stream
+
+
+class _ConnectedRequest:
+    async def is_disconnected(self) -> bool:
+        return False
+
+
+def _frames(service, conversation, query):
+    chunks = service.generate_response_chunks(query=query, context={"user_role": "employee"})
+
+    async def collect():
+        return [frame async for frame in sse_event_stream(_ConnectedRequest(), _record_stream(conversation, query, chunks))]
+    return b"".join(asyncio.run(collect())).decode("utf-8")
+
+
+def test_model_failure_is_an_error_event_and_not_recorded(make_service, stub_gemini):
+    service = make_service()
+    stub_gemini.failures = [400]
+    conversation = conversation_store.open("test-user", None)
+
+    body = _frames(service, conversation, "Why did my net pay change?")
+
+    assert "event: error" in body
+    assert "Streaming terminated due to server error." in body
+    assert "event: delta" not in body
+    assert "stub failure" not in body
+    assert conversation.messages == []
+
+
+def test_completed_stream_is_recorded(make_service, stub_gemini):
+    service = make_service()
+    conversation = conversation_store.open("test-user", None)
+
+    body = _frames(service, conversation, "Why did my net pay change?")
+
+    assert "event: done" in body
+    assert conversation.messages[-1] == {"role": "assistant", "content": "Hello world"}
@@ -0,0 +1,52 @@
+"""
+Query metrics: response size comes from the PostgREST HTTP response
+"""
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import threading
+
+from postgrest import SyncPostgrestClient
+import pytest
+
+from app.core import db
+
+BODY = json.dumps([{"id": i, "name": f"row {i}"} for i in range(3)]).encode()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        if "with_length" in self.path:
+            self.send_header("Content-Length", str(len(BODY)))
+        self.end_headers()
+        self.wfile.write(BODY)  # without Content-Length the body ends when the connection closes
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def postgrest():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    client = SyncPostgrestClient(f"http://127.0.0.1:{server.server_port}")
+    try:
+        yield client
+    finally:
+        client.session.close()
+        server.shutdown()
+        server.server_close()
+
+
+@pytest.mark.parametrize("table", ["with_length", "without_length"])
+def test_response_bytes_is_the_http_body_size(postgrest, table):
+    db.query_stats.reset()
+
+    response = db.execute(postgrest.from_(table).select("*"))
+
+    assert len(response.data) == 3
+    [entry] = db.query_stats.summary()
+    assert (entry["table"], entry["total_bytes"]) == (table, len(BODY))
@@ -0,0 +1,35 @@
+"""
+GeminiService concurrency limits against a local fake endpoint
+"""
+
+import asyncio
+
+from tests.conftest import stream_into
+
+
+def test_concurrent_generations_are_bounded_by_the_semaphore(stub_gemini, make_service):
+    service = make_service(GEMINI_MAX_CONCURRENT_REQUESTS=2)
+    stub_gemini.delay = 0.2
+
+    async def run():
+        return await asyncio.gather(*(service._generate_text(f"prompt {i}") for i in range(6)))
+
+    results = asyncio.run(run())
+
+    assert [text for text, _ in results] == ["stub answer"] * 6
+    assert stub_gemini.requests == 6
+    assert stub_gemini.max_in_flight == 2
+
+
+def test_concurrent_streams_are_bounded_by_the_semaphore(stub_gemini, make_service):
+    service = make_service(GEMINI_MAX_CONCURRENT_STREAMS=1)
+    stub_gemini.chunk_delay = 0.1
+    received = [[], [], []]
+
+    async def run():
+        await asyncio.gather(*(stream_into(service, r) for r in received))
+
+    asyncio.run(run())
+
+    assert all("".join(r) == "Hello world" for r in received)
+    assert stub_gemini.max_in_flight == 1
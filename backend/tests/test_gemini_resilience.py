@@ -0,0 +1,102 @@
+"""
+GeminiService against a local fake endpoint: retries, deadlines, the circuit
+breaker and stream retry rules
+"""
+
+from google import genai
+import asyncio
+import time
+
+import pytest
+
+from app.services.resilience import CircuitOpenError
+from tests.conftest import stream_into
+
+
+def test_retryable_status_is_retried(stub_gemini, make_service):
+    service = make_service(GEMINI_MAX_RETRIES=2)
+    stub_gemini.failures = [503, 503]
+
+    text, cacheable = asyncio.run(service._generate_text("prompt"))
+
+    assert (text, cacheable) == ("stub answer", True)
+    assert stub_gemini.requests == 3
+
+
+def test_non_retryable_status_is_not_retried(stub_gemini, make_service):
+    service = make_service(GEMINI_MAX_RETRIES=2)
+    stub_gemini.failures = [400]
+
+    with pytest.raises(genai.errors.ClientError):
+        asyncio.run(service._generate_text("prompt"))
+    assert stub_gemini.requests == 1
+
+
+def test_each_attempt_has_a_deadline(stub_gemini, make_service):
+    service = make_service(GEMINI_MAX_RETRIES=1, GEMINI_TIMEOUT_SECONDS=0.2)
+    stub_gemini.delay = 1.0
+
+    started = time.perf_counter()
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(service._generate_text("prompt"))
+
+    assert time.perf_counter() - started < 0.9
+    assert stub_gemini.requests == 2
+
+
+def test_circuit_breaker_opens_and_half_opens(stub_gemini, make_service):
+    service = make_service(GEMINI_CIRCUIT_FAILURE_THRESHOLD=2, GEMINI_CIRCUIT_RECOVERY_SECONDS=0.3)
+    stub_gemini.failures = [503, 503, 503]
+
+    async def run():
+        for _ in range(2):
+            with pytest.raises(genai.errors.ServerError):
+                await service._generate_text("prompt")
+        assert service._breaker.state == "open"
+
+        # Open: fails fast without calling the endpoint
+        with pytest.raises(CircuitOpenError):
+            await service._generate_text("prompt")
+        assert stub_gemini.requests == 2
+
+        # Half-open: one probe; its failure opens the circuit again
+        await asyncio.sleep(0.35)
+        with pytest.raises(genai.errors.ServerError):
+            await service._generate_text("prompt")
+        assert service._breaker.state == "open"
+        with pytest.raises(CircuitOpenError):
+            await service._generate_text("prompt")
+        assert stub_gemini.requests == 3
+
+        # A successful probe closes it
+        await asyncio.sleep(0.35)
+        text, _ = await service._generate_text("prompt")
+        assert text == "stub answer"
+        assert service._breaker.state == "closed"
+        assert stub_gemini.requests == 4
+
+    asyncio.run(run())
+
+
+def test_stream_is_retried_before_the_first_chunk(stub_gemini, make_service):
+    service = make_service(GEMINI_MAX_RETRIES=2)
+    stub_gemini.failures = [503]
+    received = []
+
+    asyncio.run(stream_into(service, received))
+
+    assert "".join(received) == "Hello world"
+    assert stub_gemini.requests == 2
+
+
+def test_stream_is_not_retried_after_the_first_chunk(stub_gemini, make_service):
+    service = make_service(GEMINI_MAX_RETRIES=2, GEMINI_STREAM_IDLE_TIMEOUT_SECONDS=0.2)
+    stub_gemini.chunk_delay = 1.0
+    received = []
+
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(stream_into(service, received))
+
+    # A retry would replay "Hello" to a client that already has it
+    assert received == ["Hello"]
+    assert stub_gemini.requests == 1
@@ -0,0 +1,129 @@
+"""
+payslip_explain context: the current payslip and the ones before it
+"""
+
+from datetime import date
+import asyncio
+
+import pytest
+
+from app.services import context_service
+from app.services.payslip_explainer import build_explanation
+from app.services.ytd_service import fiscal_year_of, fiscal_year_start
+
+from tests.fake_supabase import FakeSupabase
+
+USER = {"user_id": "user-1"}
+
+
+def _payslip(payslip_id: str, start: date, net: float, created_at: str) -> dict:
+    end = date(start.year + (start.month == 12), start.month % 12 + 1, 1)
+    return {
+        "id": payslip_id,
+        "employee_id": "emp-1",
+        "gross_pay": net + 1000,
+        "total_deductions": 1000,
+        "net_pay": net,
+        "pay_data_snapshot": {"base_pay": net + 1000},
+        "structure_hash": None,
+        "correction_of": None,
+        "created_at": created_at,
+        "payrolls": {"pay_period_start": start.isoformat(), "pay_period_end": end.isoformat()},
+    }
+
+
+def _supabase(payslips: list) -> FakeSupabase:
+    return FakeSupabase({
+        "employees": [{"id": "emp-1", "company_id": "co-1", "designation": "Engineer", "profile_id": "user-1"}],
+        "profiles": [{"id": "user-1", "full_name": "Test User", "email": "t@example.com", "phone": None}],
+        "payslips": payslips,
+        "employee_ytd_totals": [],
+    })
+
+
+def _enrich(monkeypatch, payslips: list, payslip_id: str = None) -> dict:
+    monkeypatch.setattr(context_service, "get_supabase_admin_client", lambda: _supabase(payslips))
+    context = {"payslip_id": payslip_id} if payslip_id else {}
+    return asyncio.run(context_service.enrich_context_by_intent("payslip_explain", context, USER))
+
+
+@pytest.fixture
+def fiscal_start() -> date:
+    return fiscal_year_start(fiscal_year_of())
+
+
+def test_explains_a_payslip_that_is_not_the_latest(monkeypatch, fiscal_start):
+    # Created out of period order: a re-run of the first month after the second
+    months = [fiscal_start.replace(month=fiscal_start.month + i) for i in range(3)]
+    payslips = [
+        _payslip("first", months[0], 40000, "2026-01-03T00:00:00"),
+        _payslip("second", months[1], 50000, "2026-01-01T00:00:00"),
+        _payslip("third", months[2], 55000, "2026-01-02T00:00:00"),
+    ]
+
+    data = _enrich(monkeypatch, payslips, "second")["data"]
+
+    assert data["current_payslip"]["id"] == "second"
+    assert [p["id"] for p in data["previous_payslips"]] == ["first"]
+    net = next(c for c in build_explanation({"data": data})["comparisons"] if c["metric"] == "Net pay")
+    assert net["previous"] == 40000
+
+
+def test_latest_payslip_is_by_pay_period(monkeypatch, fiscal_start):
+    months = [fiscal_start.replace(month=fiscal_start.month + i) for i in range(2)]
+    payslips = [
+        _payslip("first", months[0], 40000, "2026-01-02T00:00:00"),
+        _payslip("second", months[1], 50000, "2026-01-01T00:00:00"),
+    ]
+
+    data = _enrich(monkeypatch, payslips)["data"]
+
+    assert data["current_payslip"]["id"] == "second"
+    assert [p["id"] for p in data["previous_payslips"]] == ["first"]
+
+
+def test_payslip_before_the_fiscal_window_is_compared_with_its_predecessor(monkeypatch, fiscal_start):
+    old = date(fiscal_start.year - 2, 6, 1)
+    payslips = [
+        _payslip("older", old.replace(month=5), 30000, "2024-05-31T00:00:00"),
+        _payslip("old", old, 35000, "2024-06-30T00:00:00"),
+        _payslip("now", fiscal_start, 50000, "2026-04-30T00:00:00"),
+    ]
+
+    data = _enrich(monkeypatch, payslips, "old")["data"]
+
+    assert data["current_payslip"]["id"] == "old"
+    assert [p["id"] for p in data["previous_payslips"]] == ["older"]
+
+
+def _corrected(payslip: dict, correction_id: str, net: float, created_at: str) -> dict:
+    start = date.fromisoformat(payslip["payrolls"]["pay_period_start"])
+    return {**_payslip(correction_id, start, net, created_at), "correction_of": payslip["id"]}
+
+
+def test_corrected_payslips_are_left_out(monkeypatch, fiscal_start):
+    months = [fiscal_start.replace(month=fiscal_start.month + i) for i in range(2)]
+    first = _payslip("first", months[0], 40000, "2026-01-01T00:00:00")
+    payslips = [
+        first,
+        _corrected(first, "first-fix", 42000, "2026-01-05T00:00:00"),
+        _payslip("second", months[1], 50000, "2026-01-02T00:00:00"),
+    ]
+
+    data = _enrich(monkeypatch, payslips)["data"]
+
+    assert data["current_payslip"]["id"] == "second"
+    assert [p["id"] for p in data["previous_payslips"]] == ["first-fix"]
+    # No employee_ytd_totals row: the fallback sums each pay period once
+    assert data["ytd_totals"]["net_ytd"] == 92000
+    assert data["ytd_totals"]["months_included"] == 2
+
+
+def test_dashboard_payslips_leave_out_corrected_ones(monkeypatch, fiscal_start):
+    first = _payslip("first", fiscal_start, 40000, "2026-01-01T00:00:00")
+    payslips = [first, _corrected(first, "first-fix", 42000, "2026-01-05T00:00:00")]
+    monkeypatch.setattr(context_service, "get_supabase_admin_client", lambda: _supabase(payslips))
+
+    enriched = asyncio.run(context_service.enrich_context_by_intent("dashboard_insights", {}, USER))
+
+    assert [p["id"] for p in enriched["data"]["recent_payslips"]] == ["first-fix"]
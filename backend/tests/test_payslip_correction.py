@@ -0,0 +1,153 @@
+"""
+Payslip corrections: POST /payslip/{id}/correct
+"""
+
+import asyncio
+
+from fastapi import HTTPException
+from postgrest.exceptions import APIError
+import pytest
+
+from app.api.v1.endpoints import payroll
+
+from tests.fake_supabase import FakeSupabase
+
+ADMIN = {"user_id": "admin-1", "company_id": "co-1", "role": "admin"}
+PAYROLL = {
+    "id": "run-1",
+    "company_id": "co-1",
+    "pay_period_start": "2025-06-01",
+    "pay_period_end": "2025-06-30",
+    "status": "draft",
+    "total_gross": 115000,
+    "total_net": 110000,
+}
+
+
+def _employee(employee_id: str, name: str, base_pay: float) -> dict:
+    return {
+        "id": employee_id,
+        "company_id": "co-1",
+        "profile_id": f"user-{employee_id}",
+        "designation": "Engineer",
+        "profiles": {"full_name": name},
+        "salary_structures": [{
+            "base_pay": base_pay,
+            "allowances": {"hra": 10000},
+            "deductions_fixed": {},
+            "deductions_percent": {},
+            "tax_regime": "new",
+        }],
+    }
+
+
+def _payslip(payslip_id: str, employee_id: str, net_pay: float, payroll: dict = PAYROLL) -> dict:
+    return {
+        "id": payslip_id,
+        "payroll_id": payroll["id"],
+        "employee_id": employee_id,
+        "net_pay": net_pay,
+        "correction_of": None,
+        "payrolls": payroll,
+    }
+
+
+def _supabase(**tables) -> FakeSupabase:
+    return FakeSupabase({
+        "companies": [{"id": "co-1", "name": "Acme Ltd"}],
+        "payrolls": [PAYROLL],
+        "employees": [_employee("emp-1", "First Employee", 50000), _employee("emp-2", "Second Employee", 45000)],
+        "payslips": [_payslip("slip-1", "emp-1", 55000), _payslip("slip-2", "emp-2", 55000)],
+        "leave_requests": [],
+        # A flat 0% slab for the fiscal year: net pay is gross pay
+        "tax_brackets": [{
+            "id": "zero-2025",
+            "company_id": None,
+            "name": "Zero",
+            "regime": "new",
+            "fiscal_year": 2025,
+            "slabs": [{"up_to": None, "rate": 0}],
+            "standard_deduction": 0,
+            "rebate_limit": 0,
+            "rebate_max": 0,
+            "rebate_marginal_relief": False,
+            "cess_percent": 0,
+            "is_default": True,
+            "created_at": "2025-01-01T00:00:00",
+        }],
+        **tables,
+    })
+
+
+@pytest.fixture
+def rendered(monkeypatch) -> list:
+    """(employee_data, company_name) of every PDF rendered"""
+    calls = []
+
+    def generate_payslip_pdf(employee_data, payslip_data, company_name):
+        calls.append((employee_data, company_name))
+        return b"%PDF"
+
+    monkeypatch.setattr(payroll.pdf_service, "generate_payslip_pdf", generate_payslip_pdf)
+    return calls
+
+
+def _correct(monkeypatch, supabase: FakeSupabase, payslip_id: str = "slip-1", user: dict = ADMIN):
+    monkeypatch.setattr(payroll, "get_supabase_admin_client", lambda: supabase)
+    return asyncio.run(payroll.correct_payslip(payslip_id, current_user=user))
+
+
+def test_correction_of_another_companys_payslip_is_forbidden(monkeypatch, rendered):
+    other_run = {**PAYROLL, "id": "run-2", "company_id": "co-2"}
+    supabase = _supabase()
+    supabase.tables["payslips"].append(_payslip("slip-other", "emp-9", 30000, other_run))
+
+    with pytest.raises(HTTPException) as error:
+        _correct(monkeypatch, supabase, "slip-other")
+
+    assert error.value.status_code == 403
+    assert [row["id"] for row in supabase.tables["payslips"]] == ["slip-1", "slip-2", "slip-other"]
+
+
+def test_already_corrected_payslip_is_a_conflict(monkeypatch, rendered):
+    supabase = _supabase()
+    supabase.tables["payslips"].append({**_payslip("slip-1-fix", "emp-1", 56000), "correction_of": "slip-1"})
+
+    with pytest.raises(HTTPException) as error:
+        _correct(monkeypatch, supabase)
+
+    assert error.value.status_code == 409
+    assert "slip-1-fix" in error.value.detail
+    assert rendered == []
+
+
+def test_unique_violation_on_insert_is_a_conflict(monkeypatch, rendered):
+    # Another correction won the race between the check and the insert
+    supabase = _supabase()
+    supabase.errors["payslips"] = APIError({"code": "23505", "message": "duplicate key value"})
+
+    with pytest.raises(HTTPException) as error:
+        _correct(monkeypatch, supabase)
+
+    assert error.value.status_code == 409
+    assert "payslip_documents" not in supabase.tables
+
+
+def test_only_the_corrected_employees_pdf_is_written(monkeypatch, rendered):
+    supabase = _supabase()
+
+    result = _correct(monkeypatch, supabase)
+
+    assert [(data["full_name"], company_name) for data, company_name in rendered] == [("First Employee", "Acme Ltd")]
+    assert [row["payslip_id"] for row in supabase.tables["payslip_documents"]] == [result.payslip_id]
+    correction = next(row for row in supabase.tables["payslips"] if row["id"] == result.payslip_id)
+    assert (correction["employee_id"], correction["correction_of"]) == ("emp-1", "slip-1")
+
+
+def test_net_pay_change_is_against_the_original_payslip(monkeypatch, rendered):
+    result = _correct(monkeypatch, _supabase())
+
+    # 50000 base + 10000 HRA, no deductions or tax; the original paid 55000
+    assert result.net_pay == pytest.approx(60000)
+    assert result.net_pay_change == pytest.approx(5000)
+    assert (result.payroll_total_gross, result.payroll_total_net) == (115000, 110000)
@@ -0,0 +1,55 @@
+"""
+Payslip PDFs rendered on first download (payroll runs computed in the database)
+"""
+
+import base64
+
+from app.api.v1.endpoints import payroll
+
+from tests.fake_supabase import FakeSupabase
+
+
+def _supabase(companies: list) -> FakeSupabase:
+    return FakeSupabase({
+        "companies": companies,
+        "payslips": [{
+            "id": "slip-1",
+            "employee_id": "emp-1-0000",
+            "gross_pay": 50000,
+            "total_deductions": 5000,
+            "net_pay": 45000,
+            "pay_data_snapshot": {"base_pay": 50000},
+            "structure_hash": None,
+            "correction_of": None,
+            "employees": {"designation": "Engineer", "company_id": "co-1", "profiles": {"full_name": "Test User"}},
+        }],
+    })
+
+
+def _render(monkeypatch, supabase: FakeSupabase) -> list:
+    rendered = []
+
+    def generate_payslip_pdf(employee_data, payslip_data, company_name):
+        rendered.append((employee_data, company_name))
+        return b"%PDF"
+
+    monkeypatch.setattr(payroll.pdf_service, "generate_payslip_pdf", generate_payslip_pdf)
+    pdf_blob = payroll._render_missing_pdf(supabase, "slip-1")
+    assert base64.b64decode(pdf_blob) == b"%PDF"
+    return rendered
+
+
+def test_missing_pdf_is_rendered_with_the_company_name_and_stored(monkeypatch):
+    supabase = _supabase([{"id": "co-1", "name": "Acme Ltd"}, {"id": "co-2", "name": "Other"}])
+
+    [(employee_data, company_name)] = _render(monkeypatch, supabase)
+
+    assert company_name == "Acme Ltd"
+    assert employee_data == {"full_name": "Test User", "employee_id": "emp-1-00", "designation": "Engineer"}
+    assert [row["payslip_id"] for row in supabase.tables["payslip_documents"]] == ["slip-1"]
+
+
+def test_company_without_a_name_gets_the_placeholder(monkeypatch):
+    [(_employee_data, company_name)] = _render(monkeypatch, _supabase([]))
+
+    assert company_name == "Your Company"
@@ -0,0 +1,40 @@
+"""
+ResponseCache: async disk tier and background eviction
+"""
+
+from pathlib import Path
+import asyncio
+import time
+
+from app.services.response_cache import ResponseCache
+
+
+def _cache(tmp_path: Path, **overrides) -> ResponseCache:
+    options = {"max_entries": 10, "ttl_seconds": 60, "disk_dir": str(tmp_path)}
+    return ResponseCache(**{**options, **overrides})
+
+
+def test_disk_entries_survive_a_new_instance(tmp_path):
+    asyncio.run(_cache(tmp_path).aset("ab" * 32, "cached answer"))
+
+    fresh = _cache(tmp_path)
+
+    assert asyncio.run(fresh.aget("ab" * 32)) == "cached answer"
+    assert fresh.stats()["memory_entries"] == 1
+    assert asyncio.run(fresh.aget("cd" * 32)) is None
+
+
+def test_eviction_caps_the_disk_tier_in_the_background(tmp_path):
+    cache = _cache(tmp_path, disk_max_entries=40)
+
+    async def fill():
+        for i in range(100):
+            await cache.aset(f"{i:064x}", f"answer {i}")
+
+    asyncio.run(fill())
+    deadline = time.time() + 5
+    while cache._evicting and time.time() < deadline:
+        time.sleep(0.01)
+
+    assert not cache._evicting
+    assert len(list(tmp_path.rglob("*.json"))) == 40
@@ -0,0 +1,55 @@
+"""
+ServerTimingMiddleware: admin-requested profiles
+"""
+
+import asyncio
+
+from app.core import security
+from app.core.config import settings
+from app.core.timing import PROFILE_FILE_HEADER, PROFILE_REQUEST_HEADER, ServerTimingMiddleware
+
+
+def _scope() -> dict:
+    headers = [(PROFILE_REQUEST_HEADER.lower().encode(), b"1"), (b"authorization", b"Bearer admin-token")]
+    return {"type": "http", "method": "GET", "path": "/slow", "headers": headers}
+
+
+def test_concurrent_profile_request_is_served_unprofiled(monkeypatch, tmp_path):
+    monkeypatch.setattr(settings, "PROFILING_ENABLED", True)
+    monkeypatch.setattr(settings, "PROFILE_OUTPUT_DIR", str(tmp_path))
+    monkeypatch.setattr(security, "token_role", lambda authorization: "admin")
+
+    async def run():
+        release = asyncio.Event()
+        started = []
+
+        async def app(scope, receive, send):
+            started.append(scope)
+            if len(started) == 1:
+                await release.wait()
+            await send({"type": "http.response.start", "status": 200, "headers": []})
+            await send({"type": "http.response.body", "body": b"ok"})
+
+        middleware = ServerTimingMiddleware(app)
+
+        async def request() -> dict:
+            sent = []
+
+            async def send(message):
+                sent.append(message)
+
+            await middleware(_scope(), None, send)
+            return dict(sent[0]["headers"])
+
+        # Both pass the admin check before either has started profiling
+        first = asyncio.create_task(request())
+        second = asyncio.create_task(request())
+        second_headers = await asyncio.wait_for(second, timeout=5)
+        release.set()
+        return await first, second_headers
+
+    first_headers, second_headers = asyncio.run(run())
+
+    assert PROFILE_FILE_HEADER.lower().encode() in first_headers
+    assert PROFILE_FILE_HEADER.lower().encode() not in second_headers
+    assert not ServerTimingMiddleware._profiling
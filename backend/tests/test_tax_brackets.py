@@ -0,0 +1,62 @@
+"""
+Tax bracket lookup by (regime, fiscal year)
+"""
+
+import numpy as np
+
+from app.services.tax_engine import TaxBracketService
+
+from tests.fake_supabase import FakeSupabase
+
+
+def _bracket(bracket_id: str, regime: str, fiscal_year: int, company_id: str = None, is_default: bool = False) -> dict:
+    return {
+        "id": bracket_id,
+        "company_id": company_id,
+        "name": bracket_id,
+        "regime": regime,
+        "fiscal_year": fiscal_year,
+        "slabs": [{"up_to": None, "rate": 10}],
+        "standard_deduction": 0,
+        "rebate_limit": 0,
+        "rebate_max": 0,
+        "rebate_marginal_relief": False,
+        "cess_percent": 0,
+        "is_default": is_default,
+        "created_at": f"{fiscal_year}-01-01T00:00:00",
+    }
+
+
+def _supabase() -> FakeSupabase:
+    return FakeSupabase({"tax_brackets": [
+        _bracket("new-2024", "new", 2024, is_default=True),
+        _bracket("old-2024", "old", 2024),
+        _bracket("new-2025", "new", 2025, is_default=True),
+        _bracket("acme-new-2025", "new", 2025, company_id="acme"),
+        _bracket("other-old-2025", "old", 2025, company_id="other"),
+    ]})
+
+
+def _resolved(company_id, regimes, fiscal_year):
+    tables = TaxBracketService(ttl_seconds=60).tables(_supabase(), company_id, regimes, fiscal_year)
+    return [tables.tables[row].id for row in tables.index(regimes)]
+
+
+def test_regime_follows_the_payroll_fiscal_year():
+    assert _resolved(None, ["new", "old"], 2024) == ["new-2024", "old-2024"]
+    assert _resolved(None, ["new", "old"], 2025) == ["new-2025", "old-2024"]
+    # No rows for 2026 yet: the latest year before it
+    assert _resolved(None, ["new"], 2026) == ["new-2025"]
+
+
+def test_company_rows_win_within_a_year():
+    assert _resolved("acme", ["new", "old", None], 2025) == ["acme-new-2025", "old-2024", "acme-new-2025"]
+    assert _resolved("acme", ["new"], 2024) == ["new-2024"]
+    # Another company's brackets are never used
+    assert _resolved("acme", ["old"], 2025) == ["old-2024"]
+
+
+def test_without_a_regime_the_default_regime_applies():
+    tables = TaxBracketService(ttl_seconds=60).tables(_supabase(), None, [None], 2025)
+    assert tables.tables[0].id == "new-2025"
+    assert np.array_equal(tables.index([None, "unknown"]), [0, 0])
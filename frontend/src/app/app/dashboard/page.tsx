@@ -3,6 +3,7 @@ import { redirect } from 'next/navigation'
 import { Card, CardContent, CardDescription, CardHeader, CardTitle } from '@/components/ui/card'
 import { Users, DollarSign, FileText, TrendingUp } from 'lucide-react'
 import { DashboardAIHelper } from '@/components/dashboard-ai-helper'
+import { currentPayslips } from '@/lib/payslips'
 
 export default async function DashboardPage() {
   const supabase = await createClient()
@@ -196,12 +197,15 @@ export default async function DashboardPage() {
       .eq('profile_id', user.id)
       .single()
 
-    const { data: payslips } = await supabase
+    // Over-fetched so corrected payslips can be dropped without losing a
+    // period; a correction is always newer than the payslip it replaces
+    const { data: recentPayslips } = await supabase
       .from('payslips')
       .select('*')
       .eq('employee_id', employee?.id)
       .order('created_at', { ascending: false })
-      .limit(5)
+      .limit(20)
+    const payslips = currentPayslips(recentPayslips).slice(0, 5)
 
     const { data: leaveBalance } = await supabase
       .from('employee_leave_balances')
@@ -4,6 +4,7 @@ import { Card, CardContent, CardDescription, CardHeader, CardTitle } from '@/com
 import { FileText, Sparkles } from 'lucide-react'
 import { DownloadPayslipButton } from '@/components/download-payslip-button'
 import { PayslipsAIHelper } from '@/components/payslips-ai-helper'
+import { currentPayslips } from '@/lib/payslips'
 
 export default async function PayslipsPage() {
   const supabase = await createClient()
@@ -42,11 +43,12 @@ export default async function PayslipsPage() {
     )
   }
 
-  const { data: payslips } = await supabase
+  const { data } = await supabase
     .from('payslips')
     .select('*, payrolls(*)')
     .eq('employee_id', employee.id)
     .order('created_at', { ascending: false })
+  const payslips = currentPayslips(data)
 
   return (
     <div className="space-y-6">
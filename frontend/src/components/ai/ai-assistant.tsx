@@ -201,6 +201,8 @@ export function AIAssistant({
   const [input, setInput] = useState("")
   const [isLoading, setIsLoading] = useState(false)
   const [error, setError] = useState("")
+  // Conversation memory lives on the server; we only keep its session id
+  const [sessionId, setSessionId] = useState<string | null>(null)
   const messagesEndRef = useRef<HTMLDivElement>(null)
   const supabase = createClient()
 
@@ -215,6 +217,7 @@ export function AIAssistant({
       setMessages([])
       setInput("")
       setError("")
+      setSessionId(null)
     }
   }, [open])
 
@@ -284,7 +287,13 @@ export function AIAssistant({
         intent: intent || "default",
         query,
         system_instruction: systemInstruction,
-        chat_history: chatHistory,  // Include chat history for multi-turn conversations
+      }
+
+      // The server remembers the conversation by session id; history only seeds a new session
+      if (sessionId) {
+        requestBody.session_id = sessionId
+      } else if (chatHistory.length > 0) {
+        requestBody.chat_history = chatHistory
       }
 
       // Add payslip_id if available for payslip_explain intent
@@ -305,6 +314,11 @@ export function AIAssistant({
         throw new Error("Failed to start streaming")
       }
 
+      const returnedSessionId = response.headers.get("X-Session-Id")
+      if (returnedSessionId) {
+        setSessionId(returnedSessionId)
+      }
+
       // Create placeholder message that we'll update with streaming content
       let streamedContent = ""
       const messageIndex = messages.length + 1 // user message was already added
@@ -317,59 +331,7 @@ export function AIAssistant({
         throw new Error("No response stream available")
       }
 
-      let done = false
-      while (!done) {
-        const { value, done: doneReading } = await reader.read()
-        done = doneReading
-
-        if (value) {
-          const chunk = decoder.decode(value, { stream: true })
-
-          // Parse SSE format: "data: <payload>\n\n"
-          const lines = chunk.split(/\n/)
-
-          for (const line of lines) {
-            if (line.startsWith('data: ')) {
-              const payload = line.substring(6) // Remove "data: " prefix
-              
-              if (payload.trim()) {
-                // Try to parse as JSON (for error messages)
-                try {
-                  const parsed = JSON.parse(payload)
-                  if (parsed.error) {
-                    throw new Error(parsed.error)
-                  }
-                  // If it's a valid JSON but not an error, treat as text
-                  streamedContent += JSON.stringify(parsed)
-                } catch {
-                  // Plain text chunk - append directly
-                  streamedContent += payload
-                }
-
-                // Update the message in real-time
-                setMessages((prev) => {
-                  const updated = [...prev]
-                  if (updated[messageIndex]) {
-                    updated[messageIndex] = {
-                      role: "assistant",
-                      content: streamedContent,
-                    }
-                  } else {
-                    updated.push({
-                      role: "assistant",
-                      content: streamedContent,
-                    })
-                  }
-                  return updated
-                })
-              }
-            }
-          }
-        }
-      }
-
-      // Ensure final message is set
-      if (streamedContent) {
+      const updateMessage = () => {
         setMessages((prev) => {
           const updated = [...prev]
           if (updated[messageIndex]) {
@@ -386,6 +348,47 @@ export function AIAssistant({
           return updated
         })
       }
+
+      // SSE events are separated by a blank line and may span several reads
+      let buffer = ""
+      let done = false
+      while (!done) {
+        const { value, done: doneReading } = await reader.read()
+        if (doneReading) break
+
+        buffer += decoder.decode(value, { stream: true })
+        const events = buffer.split("\n\n")
+        buffer = events.pop() ?? ""
+
+        for (const rawEvent of events) {
+          let eventType = "message"
+          let data = ""
+          for (const line of rawEvent.split("\n")) {
+            // Lines starting with ":" are heartbeats/comments
+            if (line.startsWith("event: ")) {
+              eventType = line.substring(7)
+            } else if (line.startsWith("data: ")) {
+              data += line.substring(6)
+            }
+          }
+          if (!data) continue
+
+          const payload = JSON.parse(data)
+          if (eventType === "delta") {
+            streamedContent += payload.text ?? ""
+            updateMessage()
+          } else if (eventType === "error") {
+            throw new Error(payload.error)
+          } else if (eventType === "done") {
+            done = true
+          }
+        }
+      }
+
+      // Ensure final message is set
+      if (streamedContent) {
+        updateMessage()
+      }
     } catch (err) {
       console.error("Streaming error:", err)
       throw err
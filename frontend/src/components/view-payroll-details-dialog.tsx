@@ -12,6 +12,7 @@ import {
 } from '@/components/ui/dialog'
 import { Card, CardContent, CardHeader, CardTitle } from '@/components/ui/card'
 import { createClient } from '@/lib/supabase/client'
+import { currentPayslips } from '@/lib/payslips'
 
 interface Payroll {
   id: string
@@ -21,6 +22,10 @@ interface Payroll {
   created_at: string
   company_id: string
   created_by: string
+  // Maintained by database triggers, corrections included
+  total_gross: number | null
+  total_deductions: number | null
+  total_net: number | null
 }
 
 interface Payslip {
@@ -29,6 +34,7 @@ interface Payslip {
   gross_pay: number
   net_pay: number
   total_deductions: number
+  correction_of: string | null
   employees?: {
     profile?: {
       full_name: string
@@ -57,6 +63,7 @@ export function ViewPayrollDetailsDialog({ payroll }: ViewPayrollDetailsDialogPr
         gross_pay,
         net_pay,
         total_deductions,
+        correction_of,
         employees!payslips_employee_id_fkey (
           profile:profiles!employees_profile_id_fkey (
             full_name
@@ -68,7 +75,8 @@ export function ViewPayrollDetailsDialog({ payroll }: ViewPayrollDetailsDialogPr
     if (error) {
       console.error('Error loading payslips:', error)
     } else {
-      setPayslips((data as any) || [])
+      // Corrected payslips are replaced by their correction
+      setPayslips(currentPayslips(data as any))
     }
     setLoading(false)
   }
@@ -80,9 +88,9 @@ export function ViewPayrollDetailsDialog({ payroll }: ViewPayrollDetailsDialogPr
     }
   }
 
-  const totalGrossPay = payslips.reduce((sum, p) => sum + (p.gross_pay || 0), 0)
-  const totalDeductions = payslips.reduce((sum, p) => sum + (p.total_deductions || 0), 0)
-  const totalNetPay = payslips.reduce((sum, p) => sum + (p.net_pay || 0), 0)
+  const totalGrossPay = Number(payroll.total_gross ?? 0)
+  const totalDeductions = Number(payroll.total_deductions ?? 0)
+  const totalNetPay = Number(payroll.total_net ?? 0)
 
   return (
     <Dialog open={open} onOpenChange={handleOpenChange}>
@@ -0,0 +1,13 @@
+/**
+ * Payslips that have not been replaced by a correction
+ *
+ * A correction is a new payslip whose correction_of points at the one it
+ * replaces; the replaced payslip stays in the table for the audit trail.
+ * Same rule as the backend's context_service._current_payslips.
+ */
+export function currentPayslips<T extends { id: string; correction_of?: string | null }>(
+  payslips: T[] | null | undefined
+): T[] {
+  const replaced = new Set((payslips ?? []).map((p) => p.correction_of).filter(Boolean))
+  return (payslips ?? []).filter((p) => !replaced.has(p.id))
+}
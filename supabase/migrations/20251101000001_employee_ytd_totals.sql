@@ -0,0 +1,168 @@
+-- Per-employee fiscal-year (April-March) YTD totals, maintained by triggers on payslips
+--
+-- A payslip counts towards the fiscal year of its payroll's pay_period_end.
+-- A correction (payslips.correction_of) replaces the payslip it corrects, so only
+-- payslips that have not been corrected are included in the totals.
+
+CREATE TABLE IF NOT EXISTS public.employee_ytd_totals (
+    employee_id UUID NOT NULL REFERENCES public.employees(id) ON DELETE CASCADE,
+    fiscal_year INTEGER NOT NULL,  -- calendar year in which the fiscal year starts (FY 2025-26 -> 2025)
+    gross_ytd NUMERIC(14, 2) NOT NULL DEFAULT 0,
+    deductions_ytd NUMERIC(14, 2) NOT NULL DEFAULT 0,
+    tax_ytd NUMERIC(14, 2) NOT NULL DEFAULT 0,
+    net_ytd NUMERIC(14, 2) NOT NULL DEFAULT 0,
+    payslip_count INTEGER NOT NULL DEFAULT 0,
+    last_pay_period_end DATE,
+    updated_at TIMESTAMPTZ DEFAULT NOW(),
+    PRIMARY KEY (employee_id, fiscal_year)
+);
+
+-- Lookups of the payslip a correction replaces
+CREATE INDEX IF NOT EXISTS idx_payslips_correction_of ON public.payslips(correction_of);
+
+-- Fiscal year (start year) of a date: April-December -> same year, January-March -> previous year
+CREATE OR REPLACE FUNCTION public.fiscal_year_of(d DATE)
+RETURNS INTEGER AS $$
+    SELECT CASE WHEN EXTRACT(MONTH FROM d) >= 4
+        THEN EXTRACT(YEAR FROM d)::INTEGER
+        ELSE EXTRACT(YEAR FROM d)::INTEGER - 1
+    END;
+$$ LANGUAGE sql IMMUTABLE;
+
+-- Add (sign = 1) or remove (sign = -1) one payslip's amounts from its employee's YTD row
+CREATE OR REPLACE FUNCTION public.apply_payslip_to_ytd(p public.payslips, sign INTEGER)
+RETURNS VOID AS $$
+DECLARE
+    period_end DATE;
+BEGIN
+    SELECT pay_period_end INTO period_end FROM public.payrolls WHERE id = p.payroll_id;
+    IF period_end IS NULL THEN
+        RETURN;
+    END IF;
+
+    INSERT INTO public.employee_ytd_totals AS t (
+        employee_id, fiscal_year, gross_ytd, deductions_ytd, tax_ytd, net_ytd,
+        payslip_count, last_pay_period_end, updated_at
+    )
+    VALUES (
+        p.employee_id,
+        public.fiscal_year_of(period_end),
+        sign * p.gross_pay,
+        sign * p.total_deductions,
+        sign * COALESCE((p.pay_data_snapshot->>'tax_deduction')::NUMERIC, 0),
+        sign * p.net_pay,
+        sign,
+        CASE WHEN sign > 0 THEN period_end END,
+        NOW()
+    )
+    ON CONFLICT (employee_id, fiscal_year) DO UPDATE SET
+        gross_ytd = t.gross_ytd + EXCLUDED.gross_ytd,
+        deductions_ytd = t.deductions_ytd + EXCLUDED.deductions_ytd,
+        tax_ytd = t.tax_ytd + EXCLUDED.tax_ytd,
+        net_ytd = t.net_ytd + EXCLUDED.net_ytd,
+        payslip_count = t.payslip_count + EXCLUDED.payslip_count,
+        last_pay_period_end = GREATEST(t.last_pay_period_end, EXCLUDED.last_pay_period_end),
+        updated_at = NOW();
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER SET search_path = public;
+
+-- A payslip is counted unless another payslip corrects it
+CREATE OR REPLACE FUNCTION public.payslip_is_current(payslip_id UUID, ignore_id UUID DEFAULT NULL)
+RETURNS BOOLEAN AS $$
+    SELECT NOT EXISTS (
+        SELECT 1 FROM public.payslips
+        WHERE correction_of = payslip_id
+          AND (ignore_id IS NULL OR id <> ignore_id)
+    );
+$$ LANGUAGE sql STABLE;
+
+CREATE OR REPLACE FUNCTION public.maintain_employee_ytd_totals()
+RETURNS TRIGGER AS $$
+DECLARE
+    corrected public.payslips;
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        IF NEW.correction_of IS NOT NULL THEN
+            SELECT * INTO corrected FROM public.payslips WHERE id = NEW.correction_of;
+            -- Corrections form a chain: only the latest payslip can be corrected
+            IF NOT public.payslip_is_current(NEW.correction_of, NEW.id) THEN
+                RAISE EXCEPTION 'Payslip % has already been corrected', NEW.correction_of;
+            END IF;
+            PERFORM public.apply_payslip_to_ytd(corrected, -1);
+        END IF;
+        PERFORM public.apply_payslip_to_ytd(NEW, 1);
+        RETURN NEW;
+
+    ELSIF TG_OP = 'UPDATE' THEN
+        IF public.payslip_is_current(OLD.id) THEN
+            PERFORM public.apply_payslip_to_ytd(OLD, -1);
+            PERFORM public.apply_payslip_to_ytd(NEW, 1);
+        END IF;
+        RETURN NEW;
+
+    ELSE  -- DELETE
+        IF public.payslip_is_current(OLD.id) THEN
+            PERFORM public.apply_payslip_to_ytd(OLD, -1);
+            -- Deleting a correction makes the payslip it replaced current again
+            IF OLD.correction_of IS NOT NULL THEN
+                SELECT * INTO corrected FROM public.payslips WHERE id = OLD.correction_of;
+                IF FOUND THEN
+                    PERFORM public.apply_payslip_to_ytd(corrected, 1);
+                END IF;
+            END IF;
+        END IF;
+        RETURN OLD;
+    END IF;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER SET search_path = public;
+
+-- Only amount/ownership changes affect the totals (e.g. not pdf_blob updates)
+CREATE TRIGGER maintain_employee_ytd_totals_insert AFTER INSERT ON public.payslips
+    FOR EACH ROW EXECUTE FUNCTION public.maintain_employee_ytd_totals();
+
+CREATE TRIGGER maintain_employee_ytd_totals_update
+    AFTER UPDATE OF employee_id, payroll_id, gross_pay, total_deductions, net_pay, pay_data_snapshot
+    ON public.payslips
+    FOR EACH ROW EXECUTE FUNCTION public.maintain_employee_ytd_totals();
+
+CREATE TRIGGER maintain_employee_ytd_totals_delete AFTER DELETE ON public.payslips
+    FOR EACH ROW EXECUTE FUNCTION public.maintain_employee_ytd_totals();
+
+-- Backfill from existing payslips
+INSERT INTO public.employee_ytd_totals (
+    employee_id, fiscal_year, gross_ytd, deductions_ytd, tax_ytd, net_ytd,
+    payslip_count, last_pay_period_end
+)
+SELECT
+    ps.employee_id,
+    public.fiscal_year_of(pr.pay_period_end),
+    SUM(ps.gross_pay),
+    SUM(ps.total_deductions),
+    SUM(COALESCE((ps.pay_data_snapshot->>'tax_deduction')::NUMERIC, 0)),
+    SUM(ps.net_pay),
+    COUNT(*),
+    MAX(pr.pay_period_end)
+FROM public.payslips ps
+JOIN public.payrolls pr ON pr.id = ps.payroll_id
+WHERE NOT EXISTS (SELECT 1 FROM public.payslips c WHERE c.correction_of = ps.id)
+GROUP BY ps.employee_id, public.fiscal_year_of(pr.pay_period_end)
+ON CONFLICT (employee_id, fiscal_year) DO NOTHING;
+
+-- Same visibility as payslips; rows are written only by the trigger
+ALTER TABLE public.employee_ytd_totals ENABLE ROW LEVEL SECURITY;
+
+CREATE POLICY "Employees can view their own YTD totals"
+    ON public.employee_ytd_totals FOR SELECT
+    USING (
+        employee_id IN (
+            SELECT id FROM public.employees WHERE profile_id = auth.uid()
+        )
+    );
+
+CREATE POLICY "Admins can view YTD totals in their company"
+    ON public.employee_ytd_totals FOR SELECT
+    USING (
+        public.is_admin_of_company(
+            (SELECT company_id FROM public.employees WHERE id = employee_id)
+        )
+    );
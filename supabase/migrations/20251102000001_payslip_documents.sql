@@ -0,0 +1,57 @@
+-- Store payslip PDFs outside the payslips table
+--
+-- Payslip rows are read on many hot paths (AI context, analysis, dashboards);
+-- keeping the PDF in its own table means those reads never carry blob bytes.
+-- The PDF is read only when a payslip is downloaded.
+
+CREATE TABLE IF NOT EXISTS public.payslip_documents (
+    payslip_id UUID PRIMARY KEY REFERENCES public.payslips(id) ON DELETE CASCADE,
+    pdf_blob BYTEA NOT NULL,  -- base64-encoded PDF, as previously stored in payslips.pdf_blob
+    created_at TIMESTAMPTZ DEFAULT NOW()
+);
+
+-- Move existing PDFs; payslips.pdf_blob stays (nullable) for rows written by older deployments
+INSERT INTO public.payslip_documents (payslip_id, pdf_blob, created_at)
+SELECT id, pdf_blob, created_at
+FROM public.payslips
+WHERE pdf_blob IS NOT NULL
+ON CONFLICT (payslip_id) DO NOTHING;
+
+UPDATE public.payslips ps
+SET pdf_blob = NULL
+FROM public.payslip_documents d
+WHERE d.payslip_id = ps.id
+  AND ps.pdf_blob IS NOT NULL;
+
+-- Same access as the payslip itself
+ALTER TABLE public.payslip_documents ENABLE ROW LEVEL SECURITY;
+
+CREATE POLICY "Employees can view their own payslip documents"
+    ON public.payslip_documents FOR SELECT
+    USING (
+        payslip_id IN (
+            SELECT ps.id FROM public.payslips ps
+            JOIN public.employees e ON e.id = ps.employee_id
+            WHERE e.profile_id = auth.uid()
+        )
+    );
+
+CREATE POLICY "Admins can view payslip documents in their company"
+    ON public.payslip_documents FOR SELECT
+    USING (
+        public.is_admin_of_company(
+            (SELECT e.company_id FROM public.payslips ps
+             JOIN public.employees e ON e.id = ps.employee_id
+             WHERE ps.id = payslip_id)
+        )
+    );
+
+CREATE POLICY "Admins can manage payslip documents in their company"
+    ON public.payslip_documents FOR INSERT
+    WITH CHECK (
+        public.is_admin_of_company(
+            (SELECT e.company_id FROM public.payslips ps
+             JOIN public.employees e ON e.id = ps.employee_id
+             WHERE ps.id = payslip_id)
+        )
+    );
@@ -0,0 +1,34 @@
+-- Persisted payroll analysis results
+--
+-- /analyze-payroll stores its result per payroll, versioned by a fingerprint of
+-- the run's payslip amounts (and of the prior runs they are compared with).
+-- A repeat call with the same fingerprint returns the stored result; processed
+-- and paid payrolls return it without reloading the run. When a draft changes,
+-- employee_hashes and peer_stats identify the employees whose anomalies must
+-- be recomputed, and the AI summary is regenerated only when the anomaly set
+-- (anomaly_fingerprint) changes.
+
+CREATE TABLE IF NOT EXISTS public.payroll_analyses (
+    payroll_id UUID PRIMARY KEY REFERENCES public.payrolls(id) ON DELETE CASCADE,
+    engine_version TEXT NOT NULL,
+    fingerprint TEXT NOT NULL,                       -- current run + prior runs + engine version
+    history_fingerprint TEXT NOT NULL,               -- prior runs only
+    employee_hashes JSONB NOT NULL DEFAULT '{}',     -- employee_id -> hash of amounts and designation
+    peer_stats JSONB NOT NULL DEFAULT '{}',          -- designation -> metric -> [median, MAD]
+    anomalies JSONB NOT NULL DEFAULT '[]',
+    anomaly_fingerprint TEXT,                        -- anomaly set the summary was written for
+    summary TEXT,
+    payroll_status payroll_status_enum,
+    computed_at TIMESTAMPTZ DEFAULT NOW()
+);
+
+-- Admins of the payroll's company can read results; rows are written by the backend (service role)
+ALTER TABLE public.payroll_analyses ENABLE ROW LEVEL SECURITY;
+
+CREATE POLICY "Admins can view payroll analyses in their company"
+    ON public.payroll_analyses FOR SELECT
+    USING (
+        public.is_admin_of_company(
+            (SELECT p.company_id FROM public.payrolls p WHERE p.id = payroll_id)
+        )
+    );
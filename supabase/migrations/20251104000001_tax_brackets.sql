@@ -0,0 +1,99 @@
+-- Progressive income-tax slabs
+--
+-- One row per tax regime and fiscal year (April-March, identified by its start
+-- year). Rows with company_id NULL are the statutory slabs shared by every
+-- company; a company can add its own rows. salary_structures.tax_regime names
+-- the employee's regime, and each payroll uses the row for that regime and the
+-- fiscal year of its pay period: the latest at or before that year, a company's
+-- own row winning over the statutory one within a year. Structures without a
+-- regime take the regime of the statutory default (is_default) of the year.
+--
+-- slabs: ordered JSON array of {"up_to": <annual taxable income>, "rate": <percent>},
+-- the last slab with "up_to": null. Tax is computed on annualized pay less
+-- standard_deduction; taxable income up to rebate_limit gets a rebate of at
+-- most rebate_max (Section 87A), with marginal relief just above the limit when
+-- rebate_marginal_relief is set; cess_percent is added on the remaining tax.
+
+CREATE TABLE IF NOT EXISTS public.tax_brackets (
+    id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+    company_id UUID REFERENCES public.companies(id) ON DELETE CASCADE,  -- NULL: statutory
+    name TEXT NOT NULL,
+    regime TEXT NOT NULL CHECK (regime IN ('new', 'old')),
+    fiscal_year INTEGER NOT NULL,
+    slabs JSONB NOT NULL CHECK (jsonb_typeof(slabs) = 'array' AND jsonb_array_length(slabs) > 0),
+    standard_deduction NUMERIC(12, 2) NOT NULL DEFAULT 0,
+    rebate_limit NUMERIC(12, 2) NOT NULL DEFAULT 0,
+    rebate_max NUMERIC(12, 2) NOT NULL DEFAULT 0,
+    rebate_marginal_relief BOOLEAN NOT NULL DEFAULT false,
+    cess_percent NUMERIC(5, 2) NOT NULL DEFAULT 0,
+    is_default BOOLEAN NOT NULL DEFAULT false,
+    created_at TIMESTAMPTZ DEFAULT NOW(),
+    updated_at TIMESTAMPTZ DEFAULT NOW()
+);
+
+-- At most one statutory default per fiscal year
+CREATE UNIQUE INDEX IF NOT EXISTS idx_tax_brackets_default
+    ON public.tax_brackets (fiscal_year)
+    WHERE company_id IS NULL AND is_default;
+
+CREATE INDEX IF NOT EXISTS idx_tax_brackets_company ON public.tax_brackets (company_id);
+
+CREATE TRIGGER update_tax_brackets_updated_at BEFORE UPDATE ON public.tax_brackets
+    FOR EACH ROW EXECUTE FUNCTION update_updated_at_column();
+
+CREATE INDEX IF NOT EXISTS idx_tax_brackets_regime_year ON public.tax_brackets (regime, fiscal_year);
+
+-- Existing structures may carry IDs that never pointed anywhere: don't validate them
+ALTER TABLE public.salary_structures
+    ADD CONSTRAINT salary_structures_tax_bracket_id_fkey
+    FOREIGN KEY (tax_bracket_id) REFERENCES public.tax_brackets(id) ON DELETE SET NULL
+    NOT VALID;
+
+-- The regime, not a bracket row, is what carries over from one fiscal year to
+-- the next (tax_bracket_id is no longer read by payroll processing)
+ALTER TABLE public.salary_structures
+    ADD COLUMN IF NOT EXISTS tax_regime TEXT CHECK (tax_regime IN ('new', 'old'));
+
+-- Statutory slabs (Income-tax Act, salaried individuals below 60; surcharge not modelled)
+INSERT INTO public.tax_brackets
+    (name, regime, fiscal_year, slabs, standard_deduction, rebate_limit, rebate_max, rebate_marginal_relief, cess_percent, is_default)
+VALUES
+    ('New regime FY 2024-25', 'new', 2024,
+     '[{"up_to": 300000, "rate": 0}, {"up_to": 700000, "rate": 5}, {"up_to": 1000000, "rate": 10},
+       {"up_to": 1200000, "rate": 15}, {"up_to": 1500000, "rate": 20}, {"up_to": null, "rate": 30}]',
+     75000, 700000, 25000, true, 4, true),
+    ('Old regime FY 2024-25', 'old', 2024,
+     '[{"up_to": 250000, "rate": 0}, {"up_to": 500000, "rate": 5}, {"up_to": 1000000, "rate": 20},
+       {"up_to": null, "rate": 30}]',
+     50000, 500000, 12500, false, 4, false),
+    ('New regime FY 2025-26', 'new', 2025,
+     '[{"up_to": 400000, "rate": 0}, {"up_to": 800000, "rate": 5}, {"up_to": 1200000, "rate": 10},
+       {"up_to": 1600000, "rate": 15}, {"up_to": 2000000, "rate": 20}, {"up_to": 2400000, "rate": 25},
+       {"up_to": null, "rate": 30}]',
+     75000, 1200000, 60000, true, 4, true),
+    ('Old regime FY 2025-26', 'old', 2025,
+     '[{"up_to": 250000, "rate": 0}, {"up_to": 500000, "rate": 5}, {"up_to": 1000000, "rate": 20},
+       {"up_to": null, "rate": 30}]',
+     50000, 500000, 12500, false, 4, false);
+
+-- Structures that pointed at a bracket keep its regime
+UPDATE public.salary_structures s
+SET tax_regime = b.regime
+FROM public.tax_brackets b
+WHERE b.id = s.tax_bracket_id AND s.tax_regime IS NULL;
+
+-- Everyone can read statutory slabs; company admins manage their company's own rows
+ALTER TABLE public.tax_brackets ENABLE ROW LEVEL SECURITY;
+
+CREATE POLICY "Authenticated users can view statutory tax brackets"
+    ON public.tax_brackets FOR SELECT
+    USING (company_id IS NULL AND auth.uid() IS NOT NULL);
+
+CREATE POLICY "Admins can view tax brackets in their company"
+    ON public.tax_brackets FOR SELECT
+    USING (public.is_admin_of_company(company_id));
+
+CREATE POLICY "Admins can manage tax brackets in their company"
+    ON public.tax_brackets FOR ALL
+    USING (public.is_admin_of_company(company_id))
+    WITH CHECK (public.is_admin_of_company(company_id));
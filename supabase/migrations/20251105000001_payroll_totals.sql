@@ -0,0 +1,137 @@
+-- Payroll run totals, maintained incrementally by triggers on payslips
+--
+-- Like employee_ytd_totals, only payslips that have not been corrected count: a
+-- correction (payslips.correction_of) replaces the payslip it corrects, so
+-- inserting one moves the run's totals by the difference between the two.
+-- The triggers are statement-level with transition tables, so a payroll run
+-- inserting all its payslips in one statement updates the payrolls row once,
+-- and a single correction costs one indexed lookup and one row update
+-- regardless of company size.
+
+ALTER TABLE public.payrolls
+    ADD COLUMN IF NOT EXISTS total_gross NUMERIC(14, 2) NOT NULL DEFAULT 0,
+    ADD COLUMN IF NOT EXISTS total_deductions NUMERIC(14, 2) NOT NULL DEFAULT 0,
+    ADD COLUMN IF NOT EXISTS total_net NUMERIC(14, 2) NOT NULL DEFAULT 0,
+    ADD COLUMN IF NOT EXISTS payslip_count INTEGER NOT NULL DEFAULT 0;
+
+-- At most one correction per payslip. Two concurrent corrections can both pass
+-- the YTD trigger's check, so the second insert fails on this index instead.
+-- (Creating it fails if a payslip already has several corrections; keep one
+-- and delete the others first.) It replaces the plain index on correction_of.
+CREATE UNIQUE INDEX IF NOT EXISTS idx_payslips_correction_of_unique ON public.payslips(correction_of);
+DROP INDEX IF EXISTS public.idx_payslips_correction_of;
+
+-- Add summed amount deltas to their payrolls
+CREATE OR REPLACE FUNCTION public.apply_payroll_total_deltas(deltas JSONB)
+RETURNS VOID AS $$
+    UPDATE public.payrolls p SET
+        total_gross = p.total_gross + d.gross,
+        total_deductions = p.total_deductions + d.deductions,
+        total_net = p.total_net + d.net,
+        payslip_count = p.payslip_count + d.count
+    FROM jsonb_to_recordset(deltas) AS d(payroll_id UUID, gross NUMERIC, deductions NUMERIC, net NUMERIC, count INTEGER)
+    WHERE p.id = d.payroll_id;
+$$ LANGUAGE sql SECURITY DEFINER SET search_path = public;
+
+CREATE OR REPLACE FUNCTION public.payroll_totals_after_insert()
+RETURNS TRIGGER AS $$
+BEGIN
+    PERFORM public.apply_payroll_total_deltas(COALESCE(jsonb_agg(d), '[]'))
+    FROM (
+        SELECT payroll_id, SUM(gross) AS gross, SUM(deductions) AS deductions, SUM(net) AS net, SUM(count) AS count
+        FROM (
+            SELECT n.payroll_id, n.gross_pay AS gross, n.total_deductions AS deductions, n.net_pay AS net, 1 AS count
+            FROM new_payslips n
+            UNION ALL
+            -- A correction removes the payslip it replaces
+            SELECT c.payroll_id, -c.gross_pay, -c.total_deductions, -c.net_pay, -1
+            FROM new_payslips n
+            JOIN public.payslips c ON c.id = n.correction_of
+        ) changes
+        GROUP BY payroll_id
+    ) d;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER SET search_path = public;
+
+CREATE OR REPLACE FUNCTION public.payroll_totals_after_update()
+RETURNS TRIGGER AS $$
+BEGIN
+    PERFORM public.apply_payroll_total_deltas(COALESCE(jsonb_agg(d), '[]'))
+    FROM (
+        SELECT payroll_id, SUM(gross) AS gross, SUM(deductions) AS deductions, SUM(net) AS net, SUM(count) AS count
+        FROM (
+            SELECT o.payroll_id, -o.gross_pay AS gross, -o.total_deductions AS deductions, -o.net_pay AS net, -1 AS count
+            FROM old_payslips o
+            JOIN new_payslips n ON n.id = o.id
+            WHERE (o.payroll_id, o.gross_pay, o.total_deductions, o.net_pay)
+                IS DISTINCT FROM (n.payroll_id, n.gross_pay, n.total_deductions, n.net_pay)
+              AND public.payslip_is_current(o.id)
+            UNION ALL
+            SELECT n.payroll_id, n.gross_pay, n.total_deductions, n.net_pay, 1
+            FROM new_payslips n
+            JOIN old_payslips o ON o.id = n.id
+            WHERE (o.payroll_id, o.gross_pay, o.total_deductions, o.net_pay)
+                IS DISTINCT FROM (n.payroll_id, n.gross_pay, n.total_deductions, n.net_pay)
+              AND public.payslip_is_current(n.id)
+        ) changes
+        GROUP BY payroll_id
+    ) d;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER SET search_path = public;
+
+CREATE OR REPLACE FUNCTION public.payroll_totals_after_delete()
+RETURNS TRIGGER AS $$
+BEGIN
+    PERFORM public.apply_payroll_total_deltas(COALESCE(jsonb_agg(d), '[]'))
+    FROM (
+        SELECT payroll_id, SUM(gross) AS gross, SUM(deductions) AS deductions, SUM(net) AS net, SUM(count) AS count
+        FROM (
+            -- Deleted payslips that were counted (no correction before or in this statement)
+            SELECT o.payroll_id, -o.gross_pay AS gross, -o.total_deductions AS deductions, -o.net_pay AS net, -1 AS count
+            FROM old_payslips o
+            WHERE public.payslip_is_current(o.id)
+              AND NOT EXISTS (SELECT 1 FROM old_payslips c WHERE c.correction_of = o.id)
+            UNION ALL
+            -- Deleting a counted correction makes the payslip it replaced current again
+            SELECT t.payroll_id, t.gross_pay, t.total_deductions, t.net_pay, 1
+            FROM old_payslips o
+            JOIN public.payslips t ON t.id = o.correction_of
+            WHERE NOT EXISTS (SELECT 1 FROM old_payslips c WHERE c.correction_of = o.id)
+              AND public.payslip_is_current(o.id)
+              AND public.payslip_is_current(t.id)
+        ) changes
+        GROUP BY payroll_id
+    ) d;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER SET search_path = public;
+
+CREATE TRIGGER maintain_payroll_totals_insert AFTER INSERT ON public.payslips
+    REFERENCING NEW TABLE AS new_payslips
+    FOR EACH STATEMENT EXECUTE FUNCTION public.payroll_totals_after_insert();
+
+-- Transition tables can't be combined with UPDATE OF <columns>; unchanged amounts contribute nothing
+CREATE TRIGGER maintain_payroll_totals_update AFTER UPDATE ON public.payslips
+    REFERENCING OLD TABLE AS old_payslips NEW TABLE AS new_payslips
+    FOR EACH STATEMENT EXECUTE FUNCTION public.payroll_totals_after_update();
+
+CREATE TRIGGER maintain_payroll_totals_delete AFTER DELETE ON public.payslips
+    REFERENCING OLD TABLE AS old_payslips
+    FOR EACH STATEMENT EXECUTE FUNCTION public.payroll_totals_after_delete();
+
+-- Backfill from existing payslips
+UPDATE public.payrolls p SET
+    total_gross = t.gross,
+    total_deductions = t.deductions,
+    total_net = t.net,
+    payslip_count = t.count
+FROM (
+    SELECT ps.payroll_id, SUM(ps.gross_pay) AS gross, SUM(ps.total_deductions) AS deductions,
+           SUM(ps.net_pay) AS net, COUNT(*) AS count
+    FROM public.payslips ps
+    WHERE NOT EXISTS (SELECT 1 FROM public.payslips c WHERE c.correction_of = ps.id)
+    GROUP BY ps.payroll_id
+) t
+WHERE p.id = t.payroll_id;
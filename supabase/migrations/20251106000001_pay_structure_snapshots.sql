@@ -0,0 +1,39 @@
+-- Content-addressed pay structure snapshots
+--
+-- Every payslip used to store the full calculation snapshot, repeating the
+-- same base pay, allowances and deduction dicts for every employee on a
+-- shared structure, every month. The structure part now lives once in
+-- pay_structure_snapshots, keyed by a SHA-256 of its canonical JSON (which
+-- includes format_version); payslips.pay_data_snapshot keeps only the
+-- per-payslip fields (leave days, leave and tax deductions) and
+-- payslips.structure_hash points at the structure.
+--
+-- Rows with structure_hash NULL still carry the full snapshot (written before
+-- this migration, until scripts/backfill_pay_structures.py converts them).
+-- The full snapshot is structure || pay_data_snapshot; the backend rehydrates
+-- it through an in-process cache (app/services/snapshot_store.py).
+
+CREATE TABLE IF NOT EXISTS public.pay_structure_snapshots (
+    structure_hash TEXT PRIMARY KEY,
+    format_version INTEGER NOT NULL,
+    structure JSONB NOT NULL,  -- immutable: a changed structure gets a new hash
+    created_at TIMESTAMPTZ DEFAULT NOW()
+);
+
+ALTER TABLE public.payslips
+    ADD COLUMN IF NOT EXISTS structure_hash TEXT REFERENCES public.pay_structure_snapshots(structure_hash);
+
+-- Backfill scans payslips that are not converted yet
+CREATE INDEX IF NOT EXISTS idx_payslips_unconverted ON public.payslips(id) WHERE structure_hash IS NULL;
+
+-- Readable by whoever can read a payslip that references the structure; written by the backend
+ALTER TABLE public.pay_structure_snapshots ENABLE ROW LEVEL SECURITY;
+
+CREATE POLICY "Payslip readers can view their pay structures"
+    ON public.pay_structure_snapshots FOR SELECT
+    USING (
+        EXISTS (
+            SELECT 1 FROM public.payslips ps
+            WHERE ps.structure_hash = pay_structure_snapshots.structure_hash
+        )
+    );
@@ -0,0 +1,195 @@
+-- Set-based payroll computation inside Postgres
+--
+-- For the largest companies the backend can push a payroll run down into the
+-- database instead of fetching every employee, computing in Python and posting
+-- the payslips back: process_payroll_in_db() inserts all payslips of a draft
+-- run with one INSERT ... SELECT over payroll_amounts() and returns only the
+-- run's totals. The statement-level totals trigger and the YTD trigger on
+-- payslips keep payrolls and employee_ytd_totals up to date as usual.
+--
+-- payroll_amounts() mirrors backend/app/services/payroll_calculator.py:
+-- gross = base pay + numeric allowances; deductions = base pay / 30 per
+-- approved unpaid leave day + fixed + percent of gross + TDS, with TDS from
+-- the bracket of the structure's tax regime (or the statutory default's) for
+-- the payroll's fiscal year, or a flat 10% without any, on gross pay
+-- annualized over 12 periods. It only reads, so the backend's parity check
+-- (scripts/check_payroll_parity.py) can compare it with the Python path.
+--
+-- Payslips written here carry the full pay_data_snapshot with structure_hash
+-- NULL (the hash is defined over Python's canonical JSON) and no PDF; the
+-- backfill script converts the snapshots and PDFs are rendered on first
+-- download.
+
+-- Sum of the numeric values of a JSON object (other values are ignored)
+CREATE OR REPLACE FUNCTION public.jsonb_number_sum(j JSONB)
+RETURNS NUMERIC AS $$
+    SELECT COALESCE(SUM(value::TEXT::NUMERIC), 0)
+    FROM jsonb_each(COALESCE(j, '{}'::JSONB))
+    WHERE jsonb_typeof(value) = 'number';
+$$ LANGUAGE sql IMMUTABLE;
+
+-- Monthly TDS on a monthly gross pay under a tax bracket (NULL bracket: flat 10%)
+CREATE OR REPLACE FUNCTION public.monthly_tds(b public.tax_brackets, gross NUMERIC, periods INTEGER DEFAULT 12)
+RETURNS NUMERIC AS $$
+DECLARE
+    taxable NUMERIC;
+    tax NUMERIC;
+BEGIN
+    IF b.id IS NULL THEN
+        RETURN ROUND(gross * 0.10, 2);
+    END IF;
+
+    taxable := GREATEST(gross * periods - b.standard_deduction, 0);
+
+    -- Slabs sorted by limit, open-ended last; the last slab extends to infinity
+    SELECT COALESCE(SUM(s.rate * GREATEST(
+        CASE WHEN s.is_last THEN taxable ELSE LEAST(taxable, s.up_to) END - s.lower, 0
+    )), 0)
+    INTO tax
+    FROM (
+        SELECT COALESCE((e.slab->>'rate')::NUMERIC, 0) / 100 AS rate,
+               e.up_to,
+               COALESCE(LAG(e.up_to) OVER w, 0) AS lower,
+               LEAD(1) OVER w IS NULL AS is_last
+        FROM (
+            SELECT slab, (slab->>'up_to')::NUMERIC AS up_to
+            FROM jsonb_array_elements(b.slabs) AS slab
+        ) e
+        WINDOW w AS (ORDER BY e.up_to NULLS LAST)
+    ) s;
+
+    IF taxable <= b.rebate_limit THEN
+        tax := GREATEST(tax - b.rebate_max, 0);
+    ELSIF b.rebate_marginal_relief THEN
+        tax := LEAST(tax, taxable - b.rebate_limit);
+    END IF;
+
+    RETURN ROUND(tax * (1 + b.cess_percent / 100) / periods, 2);
+END;
+$$ LANGUAGE plpgsql IMMUTABLE;
+
+-- Payslip amounts of every active employee with a salary structure
+CREATE OR REPLACE FUNCTION public.payroll_amounts(p_company_id UUID, p_period_start DATE, p_period_end DATE)
+RETURNS TABLE (
+    employee_id UUID,
+    gross_pay NUMERIC,
+    total_deductions NUMERIC,
+    net_pay NUMERIC,
+    pay_data_snapshot JSONB
+) AS $$
+    WITH structures AS (
+        -- One structure per employee (the backend embeds the first)
+        SELECT DISTINCT ON (s.employee_id)
+            s.employee_id,
+            s.base_pay,
+            COALESCE(s.allowances, '{}'::JSONB) AS allowances,
+            COALESCE(s.deductions_fixed, '{}'::JSONB) AS deductions_fixed,
+            COALESCE(s.deductions_percent, '{}'::JSONB) AS deductions_percent,
+            s.tax_regime
+        FROM public.salary_structures s
+        JOIN public.employees e ON e.id = s.employee_id
+        WHERE e.company_id = p_company_id AND e.is_active
+        ORDER BY s.employee_id, s.created_at, s.id
+    ),
+    leave AS (
+        SELECT l.employee_id, SUM(COALESCE(l.days_requested, 0)) AS days
+        FROM public.leave_requests l
+        JOIN structures st ON st.employee_id = l.employee_id
+        WHERE l.status = 'approved' AND l.leave_type = 'unpaid'
+          AND l.start_date >= p_period_start AND l.end_date <= p_period_end
+        GROUP BY l.employee_id
+    ),
+    default_bracket AS (
+        SELECT b FROM public.tax_brackets b
+        WHERE b.company_id IS NULL AND b.is_default
+          AND b.fiscal_year <= public.fiscal_year_of(p_period_end)
+        ORDER BY b.fiscal_year DESC
+        LIMIT 1
+    ),
+    regime_bracket AS (
+        -- Per regime: latest fiscal year at or before the payroll's, the company's row first
+        SELECT DISTINCT ON (b.regime) b.regime, b
+        FROM public.tax_brackets b
+        WHERE (b.company_id IS NULL OR b.company_id = p_company_id)
+          AND b.fiscal_year <= public.fiscal_year_of(p_period_end)
+        ORDER BY b.regime, b.fiscal_year DESC, b.company_id NULLS LAST, b.created_at
+    ),
+    inputs AS (
+        SELECT st.*,
+               COALESCE(lv.days, 0) AS leave_days,
+               st.base_pay + public.jsonb_number_sum(st.allowances) AS gross,
+               CASE WHEN rb.regime IS NOT NULL THEN rb.b ELSE (SELECT d.b FROM default_bracket d) END AS bracket
+        FROM structures st
+        LEFT JOIN leave lv ON lv.employee_id = st.employee_id
+        LEFT JOIN regime_bracket rb
+            ON rb.regime = COALESCE(st.tax_regime, (SELECT (d.b).regime FROM default_bracket d))
+    ),
+    amounts AS (
+        SELECT i.*,
+               i.base_pay / 30 * i.leave_days AS leave_deduction,
+               public.jsonb_number_sum(i.deductions_fixed)
+                   + i.gross * public.jsonb_number_sum(i.deductions_percent) / 100 AS other_deductions,
+               public.monthly_tds(i.bracket, i.gross) AS tax
+        FROM inputs i
+    )
+    SELECT
+        a.employee_id,
+        a.gross,
+        a.leave_deduction + a.other_deductions + a.tax,
+        a.gross - (a.leave_deduction + a.other_deductions + a.tax),
+        jsonb_build_object(
+            'base_pay', a.base_pay,
+            'allowances', a.allowances,
+            'deductions_fixed', a.deductions_fixed,
+            'deductions_percent', a.deductions_percent,
+            'unpaid_leave_days', a.leave_days,
+            'leave_deduction', a.leave_deduction,
+            'tax_deduction', a.tax,
+            'tax_bracket_id', (a.bracket).id,
+            'tax_regime', (a.bracket).regime
+        )
+    FROM amounts a;
+$$ LANGUAGE sql STABLE SECURITY DEFINER SET search_path = public;
+
+-- Insert the payslips of a draft payroll run in one statement and mark it processed
+CREATE OR REPLACE FUNCTION public.process_payroll_in_db(p_payroll_id UUID, p_created_by UUID DEFAULT NULL)
+RETURNS JSONB AS $$
+DECLARE
+    run public.payrolls;
+    totals JSONB;
+BEGIN
+    SELECT * INTO run FROM public.payrolls WHERE id = p_payroll_id FOR UPDATE;
+    IF NOT FOUND THEN
+        RAISE EXCEPTION 'Payroll run % not found', p_payroll_id;
+    END IF;
+    IF run.status <> 'draft' OR EXISTS (SELECT 1 FROM public.payslips WHERE payroll_id = p_payroll_id) THEN
+        RAISE EXCEPTION 'Payroll run % has already been processed', p_payroll_id;
+    END IF;
+
+    WITH inserted AS (
+        INSERT INTO public.payslips (payroll_id, employee_id, pay_data_snapshot, gross_pay, total_deductions, net_pay, created_by)
+        SELECT p_payroll_id, a.employee_id, a.pay_data_snapshot, a.gross_pay, a.total_deductions, a.net_pay, p_created_by
+        FROM public.payroll_amounts(run.company_id, run.pay_period_start, run.pay_period_end) a
+        RETURNING payslips.gross_pay, payslips.total_deductions, payslips.net_pay
+    )
+    SELECT jsonb_build_object(
+        'payslip_count', COUNT(*),
+        'total_gross', COALESCE(SUM(i.gross_pay), 0),
+        'total_deductions', COALESCE(SUM(i.total_deductions), 0),
+        'total_net', COALESCE(SUM(i.net_pay), 0)
+    )
+    INTO totals
+    FROM inserted i;
+
+    IF (totals->>'payslip_count')::INTEGER > 0 THEN
+        UPDATE public.payrolls SET status = 'processed' WHERE id = p_payroll_id;
+    END IF;
+    RETURN totals;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER SET search_path = public;
+
+-- Both bypass RLS: only the backend (service role) may call them through RPC
+REVOKE EXECUTE ON FUNCTION public.payroll_amounts(UUID, DATE, DATE) FROM PUBLIC, anon, authenticated;
+REVOKE EXECUTE ON FUNCTION public.process_payroll_in_db(UUID, UUID) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION public.payroll_amounts(UUID, DATE, DATE) TO service_role;
+GRANT EXECUTE ON FUNCTION public.process_payroll_in_db(UUID, UUID) TO service_role;